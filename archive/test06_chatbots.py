@@ -2,10 +2,9 @@ from typing import Annotated, Literal, Optional
 from typing_extensions import TypedDict
 from langgraph.graph.message import AnyMessage, add_messages
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.runnables import Runnable, RunnableConfig
+from langchain_core.runnables import Runnable, RunnableConfig, RunnableLambda
 from pydantic import BaseModel, Field
 from langchain_core.tools import tool
-from langchain_openai import AzureChatOpenAI
 import config as cfg
 import os
 from exa_py import Exa
@@ -14,11 +13,19 @@ from components.tools.chatbots_tools.main_tool import (
     init_and_get_tools,
     create_tool_node_with_fallback,
 )
+from components.tools.chatbots_tools.offline_fixtures import OfflineExa
 from langchain_core.messages import ToolMessage
+from utils.azure_openai import ClientRegistry
+from utils.checkpointer import CheckpointerManager
+from utils.llm_cache import LLMCacheManager
+from utils.scripted_llm import ScriptedChatModel
+from utils.conversation_memory import create_summarize_node, with_summary
+from utils.tool_output_compaction import create_compaction_node
+from utils.assistant_retry import RetryPolicy, RetryStats, is_empty_response
 
 # from langgraph.checkpoint.memory import MemorySaver
-import sqlite3
-from langgraph.checkpoint.sqlite import SqliteSaver
+import threading
+import time
 from langgraph.graph import StateGraph, START, END
 from langgraph.prebuilt import tools_condition
 from typing import Callable
@@ -51,25 +58,37 @@ class State(TypedDict):
         ],
         update_dialog_stack,
     ]
+    # 被 summarize_conversation 折叠的早期对话的滚动摘要，以及被折叠消息的 token 总数
+    conversation_summary: str
+    summarized_tokens: int
 
 
 class Assistant:
-    def __init__(self, runnable: Runnable):
+    def __init__(self, runnable: Runnable, name: str = "assistant", retry_policy: Optional[RetryPolicy] = None):
         self.runnable = runnable
+        self.name = name
+        self.retry_policy = retry_policy or RetryPolicy()
 
     def __call__(self, state: State, config: RunnableConfig):
-        while True:
-            result = self.runnable.invoke(state)
-            if not result.tool_calls and (
-                not result.content
-                or isinstance(result.content, list)
-                and not result.content[0].get("text")
-            ):
-                messages = state["messages"] + [("user", "Respond with a real output.")]
-                state = {**state, "messages": messages}
-            else:
+        # 早期对话已折叠为摘要时，把摘要放在保留的消息前面
+        state = with_summary(state)
+        policy = self.retry_policy
+        deadline = time.monotonic() + policy.deadline
+        for attempt in range(1, policy.max_attempts + 1):
+            # 传递 config，使本次运行的回调（如 StreamHandler）能收到 LLM 的 token
+            result = self.runnable.invoke(state, config)
+            if not is_empty_response(result):
+                RetryStats.record(self.name, attempt - 1)
+                return {"messages": result}
+            delay = policy.backoff(attempt)
+            if attempt == policy.max_attempts or time.monotonic() + delay > deadline:
                 break
-        return {"messages": result}
+            time.sleep(delay)
+            messages = state["messages"] + [("user", "Respond with a real output.")]
+            state = {**state, "messages": messages}
+        # 重试用尽或超过本轮期限，返回兜底回复而不是继续调用模型
+        RetryStats.record(self.name, attempt - 1, fallback=True)
+        return {"messages": policy.fallback_message()}
 
 
 class CompleteOrEscalate(BaseModel):
@@ -172,11 +191,17 @@ class ToBookExcursion(BaseModel):
 
 # 创建一个类来封装静态组件的初始化
 class GraphBuilder:
-    def __init__(self, init_db=True):
+    def __init__(self, init_db=True, offline=None):
+        # offline 为 True 时不访问任何网络服务：示例数据库、内置 FAQ、本地嵌入、Exa 替身和脚本化 LLM；
+        # 未指定时读取 config.OFFLINE
+        self.offline = getattr(cfg, "OFFLINE", False) if offline is None else offline
         # 初始化与 stream_handler 无关的部分
         self.init_tools(init_db)
         self.init_prompts()
         self.init_static_variables()
+        # 编译后的图只构建一次，各次运行通过 RunnableConfig 传入回调
+        self._graph = None
+        self._graph_lock = threading.Lock()
 
     def init_tools(self, init_db):
         (
@@ -197,7 +222,7 @@ class GraphBuilder:
             self.book_car_rental,
             self.update_car_rental,
             self.cancel_car_rental,
-        ) = init_and_get_tools(init_db)
+        ) = init_and_get_tools(init_db, self.offline)
 
     def init_prompts(self):
         self.flight_booking_prompt = ChatPromptTemplate.from_messages(
@@ -351,15 +376,20 @@ class GraphBuilder:
             self.book_excursion_safe_tools + self.book_excursion_sensitive_tools
         )
 
-        # 设置环境变量
-        os.environ["AZURE_OPENAI_API_KEY"] = cfg.AZURE_OPENAI_API_KEY
-        os.environ["AZURE_OPENAI_ENDPOINT"] = cfg.ENDPOINT_URL
-        os.environ["LANGCHAIN_TRACING_V2"] = cfg.LANGCHAIN_TRACING_V2
-        os.environ["LANGCHAIN_ENDPOINT"] = cfg.LANGCHAIN_ENDPOINT
-        os.environ["LANGCHAIN_API_KEY"] = cfg.LANGCHAIN_API_KEY_2
-        os.environ["LANGCHAIN_PROJECT"] = cfg.LANGCHAIN_PROJECT_2
-
-        self.exa = Exa(api_key=cfg.EXA_API_KEY)
+        if self.offline:
+            # 离线运行：关闭 LangSmith 追踪，网页搜索使用本地替身
+            os.environ["LANGCHAIN_TRACING_V2"] = "false"
+            self.exa = OfflineExa()
+        else:
+            # 设置环境变量
+            os.environ["AZURE_OPENAI_API_KEY"] = cfg.AZURE_OPENAI_API_KEY
+            os.environ["AZURE_OPENAI_ENDPOINT"] = cfg.ENDPOINT_URL
+            os.environ["LANGCHAIN_TRACING_V2"] = cfg.LANGCHAIN_TRACING_V2
+            os.environ["LANGCHAIN_ENDPOINT"] = cfg.LANGCHAIN_ENDPOINT
+            os.environ["LANGCHAIN_API_KEY"] = cfg.LANGCHAIN_API_KEY_2
+            os.environ["LANGCHAIN_PROJECT"] = cfg.LANGCHAIN_PROJECT_2
+
+            self.exa = Exa(api_key=cfg.EXA_API_KEY)
 
         @tool
         def search_and_contents(query: str):
@@ -375,21 +405,48 @@ class GraphBuilder:
             self.lookup_policy,
         ]
 
-    def create_graph(self, stream_handler=None) -> StateGraph:
-        # 创建依赖于 stream_handler 的部分
-        llm = None
+    def create_llm(self):
+        """获取图中所有助手共用的 LLM；开启流式输出，token 交给运行时传入的回调处理。
+
+        模型来自进程级注册表，所有会话的 GraphBuilder 共用同一组 HTTP 连接池；
+        外层的 LLM 回复缓存按 LLMCacheManager 的模式（cache/record/replay/off）工作，
+        调用敏感工具的回复不进入缓存。离线运行时使用按默认脚本回复的 ScriptedChatModel。
+        """
+        if self.offline:
+            return ScriptedChatModel()
+        sensitive_tools = (
+            self.update_flight_sensitive_tools
+            + self.book_hotel_sensitive_tools
+            + self.book_car_rental_sensitive_tools
+            + self.book_excursion_sensitive_tools
+        )
+        return LLMCacheManager.wrap(
+            ClientRegistry.get_chat_model(streaming=True),
+            no_store_tools=[tool.name for tool in sensitive_tools],
+        )
+
+    def get_graph(self):
+        """返回缓存的已编译图，第一次调用时构建"""
+        if self._graph is None:
+            with self._graph_lock:
+                if self._graph is None:
+                    self._graph = self.build_graph()
+        return self._graph
+
+    def create_graph(self, stream_handler=None):
+        """兼容旧接口：返回缓存的已编译图，传入 stream_handler 时将其绑定为本次使用的回调。
+
+        新代码应直接使用 get_graph()，并通过 config["callbacks"] 传入回调。
+        """
+        graph = self.get_graph()
         if stream_handler is None:
-            llm = AzureChatOpenAI(
-                azure_deployment=cfg.DEPLOYMENT_NAME,
-                api_version=cfg.AZURE_API_VERSION
-            )
-        else :
-            llm = AzureChatOpenAI(
-                azure_deployment=cfg.DEPLOYMENT_NAME,
-                api_version=cfg.AZURE_API_VERSION,
-                streaming=True,
-                callbacks=[stream_handler],
-            )
+            return graph
+        return graph.with_config(callbacks=[stream_handler])
+
+    def build_graph(self, llm=None):
+        """构建并编译完整的图（绑定工具、添加节点和边、创建检查点存储）"""
+        if llm is None:
+            llm = self.create_llm()
 
         # 定义运行实例（runnables）
         update_flight_runnable = self.flight_booking_prompt | llm.bind_tools(
@@ -444,7 +501,11 @@ class GraphBuilder:
         def user_info(state: State):
             return {"user_info": self.fetch_user_flight_information.invoke({})}
 
-        builder.add_node("fetch_user_info", user_info)
+        async def auser_info(state: State):
+            return {"user_info": await self.fetch_user_flight_information.ainvoke({})}
+
+        # 同时提供同步和异步实现，ainvoke/astream 时不会阻塞事件循环
+        builder.add_node("fetch_user_info", RunnableLambda(user_info, auser_info))
         builder.add_edge(START, "fetch_user_info")
 
         # Flight booking assistant nodes and edges
@@ -452,7 +513,7 @@ class GraphBuilder:
             "enter_update_flight",
             create_entry_node("Flight Updates & Booking Assistant", "update_flight"),
         )
-        builder.add_node("update_flight", Assistant(update_flight_runnable))
+        builder.add_node("update_flight", Assistant(update_flight_runnable, "update_flight"))
         builder.add_edge("enter_update_flight", "update_flight")
         builder.add_node(
             "update_flight_sensitive_tools",
@@ -521,7 +582,7 @@ class GraphBuilder:
             "enter_book_car_rental",
             create_entry_node("Car Rental Assistant", "book_car_rental"),
         )
-        builder.add_node("book_car_rental", Assistant(book_car_rental_runnable))
+        builder.add_node("book_car_rental", Assistant(book_car_rental_runnable, "book_car_rental"))
         builder.add_edge("enter_book_car_rental", "book_car_rental")
         builder.add_node(
             "book_car_rental_safe_tools",
@@ -567,7 +628,7 @@ class GraphBuilder:
             "enter_book_hotel",
             create_entry_node("Hotel Booking Assistant", "book_hotel"),
         )
-        builder.add_node("book_hotel", Assistant(book_hotel_runnable))
+        builder.add_node("book_hotel", Assistant(book_hotel_runnable, "book_hotel"))
         builder.add_edge("enter_book_hotel", "book_hotel")
         builder.add_node(
             "book_hotel_safe_tools",
@@ -608,7 +669,7 @@ class GraphBuilder:
             "enter_book_excursion",
             create_entry_node("Trip Recommendation Assistant", "book_excursion"),
         )
-        builder.add_node("book_excursion", Assistant(book_excursion_runnable))
+        builder.add_node("book_excursion", Assistant(book_excursion_runnable, "book_excursion"))
         builder.add_edge("enter_book_excursion", "book_excursion")
         builder.add_node(
             "book_excursion_safe_tools",
@@ -650,7 +711,7 @@ class GraphBuilder:
         )
 
         # Primary assistant
-        builder.add_node("primary_assistant", Assistant(assistant_runnable))
+        builder.add_node("primary_assistant", Assistant(assistant_runnable, "primary_assistant"))
         builder.add_node(
             "primary_assistant_tools",
             create_tool_node_with_fallback(self.primary_assistant_tools),
@@ -708,12 +769,16 @@ class GraphBuilder:
                 return "primary_assistant"
             return dialog_state[-1]
 
-        builder.add_conditional_edges("fetch_user_info", route_to_workflow)
+        # 每轮用户输入进入助手之前，先压缩已被使用过的旧工具输出，
+        # 历史仍超过阈值时再把早期对话折叠为摘要
+        builder.add_node("compact_tool_outputs", create_compaction_node())
+        builder.add_node("summarize_conversation", create_summarize_node(llm))
+        builder.add_edge("fetch_user_info", "compact_tool_outputs")
+        builder.add_edge("compact_tool_outputs", "summarize_conversation")
+        builder.add_conditional_edges("summarize_conversation", route_to_workflow)
 
-        # 编译图形
-        conn = sqlite3.connect("checkpoints.sqlite", check_same_thread=False)
-        # conn.execute("DROP TABLE IF EXISTS checkpoints")
-        memory = SqliteSaver(conn)
+        # 编译图形：检查点存储在进程内共享（WAL），astream 时自动使用异步实现
+        memory = CheckpointerManager.get_saver()
         part_4_graph = builder.compile(
             checkpointer=memory,
             interrupt_before=[
@@ -0,0 +1,66 @@
+"""对比精确搜索与 IVF 近似搜索在不同语料规模下的单次查询延迟和召回率。
+
+语料为带主题簇的合成向量（模拟真实嵌入的聚类结构），查询为语料向量加噪声。
+
+用法（在仓库根目录）：
+    python -m benchmarks.bench_ann_index [--sizes 1000 10000 100000] [--dim 384] [--k 5]
+"""
+import argparse
+import statistics
+import time
+import numpy as np
+from components.tools.chatbots_tools.ann_index import (
+    IVFIndex,
+    exact_search,
+    normalize_rows,
+    recall_at_k,
+)
+
+
+def make_corpus(n: int, dim: int, n_queries: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    topics = normalize_rows(rng.normal(size=(max(8, n // 50), dim)))
+    labels = rng.integers(0, topics.shape[0], size=n)
+    noise = normalize_rows(rng.normal(size=(n, dim)))
+    matrix = normalize_rows(topics[labels] + noise)
+    picks = rng.integers(0, n, size=n_queries)
+    queries = normalize_rows(matrix[picks] + 0.8 * normalize_rows(rng.normal(size=(n_queries, dim))))
+    return matrix, queries
+
+
+def _p50_ms(fn, queries) -> float:
+    timings = []
+    for query in queries:
+        start = time.perf_counter()
+        fn(query[None, :])
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000, 100000])
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--probes", type=int, nargs="+", default=[4, 8, 16])
+    args = parser.parse_args()
+
+    for n in args.sizes:
+        matrix, queries = make_corpus(n, args.dim, args.queries)
+        start = time.perf_counter()
+        index = IVFIndex.build(matrix)
+        build_s = time.perf_counter() - start
+        exact_ms = _p50_ms(lambda q: exact_search(matrix, q, args.k), queries)
+        print(f"n={n:<7} lists={index.n_lists:<5} build {build_s:6.2f}s   exact p50 {exact_ms:7.3f}ms")
+        for n_probe in args.probes:
+            ivf_ms = _p50_ms(lambda q: index.search(matrix, q, args.k, n_probe), queries)
+            recall = recall_at_k(index, matrix, queries, args.k, n_probe)
+            print(
+                f"          n_probe={n_probe:<3} IVF p50 {ivf_ms:7.3f}ms   "
+                f"speedup x{exact_ms / ivf_ms:5.1f}   recall@{args.k} {recall:.3f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
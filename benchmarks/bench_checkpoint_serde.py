@@ -0,0 +1,119 @@
+"""测量检查点序列化器每轮写入的字节数和序列化 CPU 时间。
+
+默认读取已记录对话的检查点数据库（checkpoints.sqlite），把其中每个检查点解码后
+用各个序列化器重新编码/解码；没有记录时用 travel2.sqlite 中的真实查询结果合成对话，
+每轮包含用户消息、工具调用、工具输出（整表查询结果）和助手回复。
+
+用法（在仓库根目录）：
+    python -m benchmarks.bench_checkpoint_serde [--checkpoints checkpoints.sqlite]
+    python -m benchmarks.bench_checkpoint_serde --synthetic 20 [--db travel2.sqlite]
+"""
+import argparse
+import os
+import sqlite3
+import time
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+from utils.checkpoint_serde import CompactSerializer, zstandard
+
+_TOOL_QUERIES = [
+    ("search_flights", "SELECT * FROM flights LIMIT 20"),
+    ("search_hotels", "SELECT * FROM hotels"),
+    ("search_car_rentals", "SELECT * FROM car_rentals"),
+    ("search_trip_recommendations", "SELECT * FROM trip_recommendations"),
+]
+
+
+class _JsonSerializer(JsonPlusSerializer):
+    """旧版 JSON 格式，作为对照"""
+
+    def dumps_typed(self, obj):
+        return "json", self.dumps(obj)
+
+
+def _serializers() -> dict:
+    serializers = {
+        "json": _JsonSerializer(),
+        "msgpack": CompactSerializer(compression=None),
+        "msgpack+zlib": CompactSerializer(compression="zlib"),
+    }
+    if zstandard is not None:
+        serializers["msgpack+zstd"] = CompactSerializer(compression="zstd")
+    return serializers
+
+
+def recorded_checkpoints(path: str) -> list:
+    reader = CompactSerializer()
+    with sqlite3.connect(path) as conn:
+        rows = conn.execute(
+            "SELECT type, checkpoint FROM checkpoints ORDER BY thread_id, checkpoint_id"
+        ).fetchall()
+    return [reader.loads_typed((type_, data)) for type_, data in rows]
+
+
+def synthetic_checkpoints(db_path: str, turns: int) -> list:
+    with sqlite3.connect(db_path) as conn:
+        conn.row_factory = sqlite3.Row
+        outputs = [
+            (name, [dict(row) for row in conn.execute(query)]) for name, query in _TOOL_QUERIES
+        ]
+    messages, checkpoints = [], []
+    for turn in range(turns):
+        name, rows = outputs[turn % len(outputs)]
+        call_id = f"call_{turn}"
+        messages += [
+            HumanMessage(content=f"Question {turn}: what are my options?"),
+            AIMessage(content="", tool_calls=[{"name": name, "args": {}, "id": call_id}]),
+            ToolMessage(content=str(rows), tool_call_id=call_id),
+            AIMessage(content=f"Here are {len(rows)} results for turn {turn}."),
+        ]
+        checkpoints.append({
+            "v": 1,
+            "id": f"turn-{turn}",
+            "channel_values": {"messages": list(messages), "user_info": "passenger 3442 587242"},
+            "channel_versions": {"messages": turn + 1},
+        })
+    return checkpoints
+
+
+def measure(checkpoints: list, serializer) -> tuple[float, float, float]:
+    total_bytes = dump_s = load_s = 0.0
+    for checkpoint in checkpoints:
+        start = time.process_time()
+        typed = serializer.dumps_typed(checkpoint)
+        dump_s += time.process_time() - start
+        total_bytes += len(typed[1])
+        start = time.process_time()
+        serializer.loads_typed(typed)
+        load_s += time.process_time() - start
+    n = len(checkpoints)
+    return total_bytes / n, dump_s / n * 1000, load_s / n * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--checkpoints", default="checkpoints.sqlite")
+    parser.add_argument("--synthetic", type=int, default=None, help="合成对话的轮数")
+    parser.add_argument("--db", default="travel2.sqlite")
+    args = parser.parse_args()
+
+    checkpoints = []
+    if args.synthetic is None and os.path.exists(args.checkpoints):
+        checkpoints = recorded_checkpoints(args.checkpoints)
+        print(f"{len(checkpoints)} recorded checkpoints from {args.checkpoints}")
+    if not checkpoints:
+        checkpoints = synthetic_checkpoints(args.db, args.synthetic or 20)
+        print(f"{len(checkpoints)} synthetic turns built from {args.db}")
+
+    baseline = None
+    for name, serializer in _serializers().items():
+        size, dump_ms, load_ms = measure(checkpoints, serializer)
+        baseline = baseline or size
+        print(
+            f"{name:<14} {size / 1024:9.1f} KiB/turn ({size / baseline:6.1%})   "
+            f"dump {dump_ms:7.3f}ms   load {load_ms:7.3f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
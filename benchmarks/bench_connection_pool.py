@@ -0,0 +1,126 @@
+"""对比每次调用新建连接与连接池复用连接时工具查询的耗时。
+
+用法（在仓库根目录）：
+    python -m benchmarks.bench_connection_pool [--db travel2.sqlite] [--iterations 2000] [--threads 4]
+
+不指定 --db 时会在临时目录中生成一个结构相同的小型 flights 表。
+"""
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+from components.tools.chatbots_tools.connection_manager import ConnectionManager
+
+QUERY = (
+    "SELECT * FROM flights WHERE departure_airport = ? AND arrival_airport = ? LIMIT 20"
+)
+AIRPORTS = ["BSL", "ZRH", "CDG", "LHR", "FRA", "AMS", "MUC", "VIE", "GVA", "BCN"]
+
+
+def build_sample_db(path: str, rows: int = 20000):
+    """生成一个与 travel2.sqlite 中 flights 表结构相同的示例数据库"""
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE flights (flight_id INTEGER, flight_no TEXT, scheduled_departure TEXT,"
+        " scheduled_arrival TEXT, departure_airport TEXT, arrival_airport TEXT, status TEXT,"
+        " aircraft_code TEXT, actual_departure TEXT, actual_arrival TEXT)"
+    )
+    rng = random.Random(0)
+    conn.executemany(
+        "INSERT INTO flights VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        [
+            (
+                i,
+                f"LX{i % 9000:04d}",
+                "2024-05-01 10:00:00.000000-04:00",
+                "2024-05-01 12:00:00.000000-04:00",
+                rng.choice(AIRPORTS),
+                rng.choice(AIRPORTS),
+                "Scheduled",
+                "319",
+                "\\N",
+                "\\N",
+            )
+            for i in range(rows)
+        ],
+    )
+    conn.commit()
+    conn.close()
+
+
+def _per_call(db_path: str, params):
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute(QUERY, params)
+    cursor.fetchall()
+    cursor.close()
+    conn.close()
+
+
+def _pooled(db_path: str, params):
+    cursor = ConnectionManager.get_connection(db_path).cursor()
+    cursor.execute(QUERY, params)
+    cursor.fetchall()
+    cursor.close()
+
+
+def _run(fn, db_path: str, iterations: int, threads: int) -> list[float]:
+    latencies = []
+    lock = threading.Lock()
+
+    def worker(seed):
+        rng = random.Random(seed)
+        local = []
+        for _ in range(iterations // threads):
+            params = (rng.choice(AIRPORTS), rng.choice(AIRPORTS))
+            start = time.perf_counter()
+            fn(db_path, params)
+            local.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(local)
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return latencies
+
+
+def _report(name: str, latencies: list[float], elapsed: float):
+    latencies = sorted(latencies)
+    p50 = statistics.median(latencies) * 1e6
+    p95 = latencies[int(len(latencies) * 0.95) - 1] * 1e6
+    print(
+        f"{name:<10} calls={len(latencies):<6} total={elapsed:.3f}s "
+        f"p50={p50:.1f}us p95={p95:.1f}us throughput={len(latencies) / elapsed:.0f}/s"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--db", default=None)
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=4)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = args.db
+        if db_path is None:
+            db_path = os.path.join(tmp, "bench.sqlite")
+            build_sample_db(db_path)
+
+        for name, fn in (("per-call", _per_call), ("pooled", _pooled)):
+            start = time.perf_counter()
+            latencies = _run(fn, db_path, args.iterations, args.threads)
+            _report(name, latencies, time.perf_counter() - start)
+
+        ConnectionManager.close_all(db_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""在放大后的数据集上对比 LIKE 搜索与 FTS5 全文检索的耗时。
+
+用法（在仓库根目录）：
+    python -m benchmarks.bench_fts_search [--rows 200000] [--repeat 20]
+"""
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+from components.tools.chatbots_tools.hotel_service_tool import (
+    _search_hotels_like_query,
+    _search_hotels_query,
+)
+from components.tools.chatbots_tools.search_index import ensure_search_indexes
+from components.tools.chatbots_tools.trip_recommendation_tool import (
+    _search_trip_recommendations_like_query,
+    _search_trip_recommendations_query,
+)
+
+LOCATIONS = ["Basel", "Zurich", "Geneva", "Lucerne", "Bern", "Lugano", "Lausanne", "Zermatt"]
+BRANDS = ["Hilton", "Marriott", "Hyatt", "Radisson", "Sheraton", "Ibis", "Novotel", "Mövenpick"]
+KEYWORDS = ["history", "art", "museum", "hiking", "lake", "food", "wine", "skiing", "castle", "boat"]
+
+CASES = [
+    ("hotels location", _search_hotels_like_query, _search_hotels_query, ("Zurich", None)),
+    ("hotels location+name", _search_hotels_like_query, _search_hotels_query, ("Basel", "Hilton")),
+    ("hotels selective name", _search_hotels_like_query, _search_hotels_query, (None, "4242")),
+    (
+        "trips keywords",
+        _search_trip_recommendations_like_query,
+        _search_trip_recommendations_query,
+        ("Lucerne", None, "lake, boat"),
+    ),
+]
+
+
+def build_scaled_db(path: str, rows: int):
+    """生成放大的 hotels 与 trip_recommendations 表，并建立 id 索引和全文索引"""
+    rng = random.Random(0)
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE hotels (id INTEGER, name TEXT, location TEXT, price_tier TEXT,"
+        " checkin_date TEXT, checkout_date TEXT, booked INTEGER)"
+    )
+    conn.executemany(
+        "INSERT INTO hotels VALUES (?, ?, ?, 'Upscale', '2024-04-02', '2024-04-05', 0)",
+        (
+            (i, f"{rng.choice(BRANDS)} {rng.choice(LOCATIONS)} {i}", rng.choice(LOCATIONS))
+            for i in range(1, rows + 1)
+        ),
+    )
+    conn.execute(
+        "CREATE TABLE trip_recommendations (id INTEGER, name TEXT, location TEXT,"
+        " keywords TEXT, details TEXT, booked INTEGER)"
+    )
+    conn.executemany(
+        "INSERT INTO trip_recommendations VALUES (?, ?, ?, ?, 'details', 0)",
+        (
+            (i, f"Tour {i}", rng.choice(LOCATIONS), ", ".join(rng.sample(KEYWORDS, 3)))
+            for i in range(1, rows + 1)
+        ),
+    )
+    conn.execute("CREATE INDEX idx_hotels_id ON hotels (id)")
+    conn.execute("CREATE INDEX idx_trip_recommendations_id ON trip_recommendations (id)")
+    conn.commit()
+    start = time.perf_counter()
+    ensure_search_indexes(conn)
+    print(f"built FTS5 indexes for {rows} rows per table in {time.perf_counter() - start:.2f}s")
+    conn.close()
+
+
+def _time(conn: sqlite3.Connection, query: str, params: list, repeat: int) -> tuple[float, int]:
+    timings = []
+    count = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        count = len(conn.execute(query, params).fetchall())
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000, count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench_fts.sqlite")
+        build_scaled_db(path, args.rows)
+        conn = sqlite3.connect(path)
+        for name, like_builder, fts_builder, case_args in CASES:
+            like_ms, like_rows = _time(conn, *like_builder(*case_args), args.repeat)
+            fts_ms, fts_rows = _time(conn, *fts_builder(*case_args), args.repeat)
+            print(
+                f"{name:<22} LIKE {like_ms:8.2f}ms ({like_rows} rows)   "
+                f"FTS5 {fts_ms:8.2f}ms ({fts_rows} rows)   speedup x{like_ms / fts_ms:.1f}"
+            )
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
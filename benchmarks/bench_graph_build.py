@@ -0,0 +1,49 @@
+"""测量每轮对话在准备图上的开销：每次重新构建编译 vs 复用已编译的图。
+
+旧做法每条消息都会新建 AzureChatOpenAI、为五个助手 bind_tools、重建 StateGraph、
+打开新的 checkpoints.sqlite 连接并重新编译；新做法只构建一次，每轮仅合并回调配置。
+两者都不发起 LLM 请求，只测准备阶段的耗时。需要与运行应用相同的 config.py。
+
+用法（在仓库根目录）：
+    python -m benchmarks.bench_graph_build [--turns 20]
+"""
+import argparse
+import statistics
+import time
+from langchain_core.callbacks import BaseCallbackHandler
+from archive.test06_chatbots import GraphBuilder
+
+
+class _NullHandler(BaseCallbackHandler):
+    def on_llm_new_token(self, token: str, **kwargs) -> None:
+        pass
+
+
+def _p50_ms(fn, turns: int) -> float:
+    timings = []
+    for _ in range(turns):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--turns", type=int, default=20)
+    args = parser.parse_args()
+
+    builder = GraphBuilder(init_db=False)
+    config = {"configurable": {"passenger_id": "3442 587242", "thread_id": "bench"}}
+
+    rebuild_ms = _p50_ms(lambda: builder.build_graph(), args.turns)
+    builder.get_graph()
+    cached_ms = _p50_ms(
+        lambda: (builder.get_graph(), {**config, "callbacks": [_NullHandler()]}), args.turns
+    )
+    print(f"rebuild per turn  p50 {rebuild_ms:9.3f}ms")
+    print(f"cached per turn   p50 {cached_ms:9.3f}ms   (x{rebuild_ms / cached_ms:.0f})")
+
+
+if __name__ == "__main__":
+    main()
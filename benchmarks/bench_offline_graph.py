@@ -0,0 +1,70 @@
+"""离线压测完整的图：脚本化 LLM、示例数据库、内置 FAQ、本地嵌入和 Exa 替身，不访问任何网络服务。
+
+多个线程各自在独立的 thread 上发送 DEMO_CONVERSATION，敏感工具前的中断直接继续执行（相当于用户同意）。
+报告每轮的耗时分布和吞吐量；--latency 模拟模型每次调用的响应时间，设为 0 时只测图、工具和检查点本身的开销。
+仍需要能导入的 config.py（离线模式下不读取其中的密钥）。
+
+用法（在仓库根目录）：
+    python -m benchmarks.bench_offline_graph [--conversations 20] [--threads 4] [--latency 0]
+"""
+import argparse
+import statistics
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from archive.test06_chatbots import GraphBuilder
+from components.tools.chatbots_tools.offline_fixtures import FIXTURE_PASSENGER_ID
+from utils.scripted_llm import DEMO_CONVERSATION, ScriptedChatModel
+
+
+def run_conversation(graph, messages: list[str]) -> list[float]:
+    """在新 thread 上发送一段对话，返回每轮的耗时（秒）"""
+    config = {"configurable": {"passenger_id": FIXTURE_PASSENGER_ID, "thread_id": str(uuid.uuid4())}}
+    timings = []
+    for content in messages:
+        start = time.perf_counter()
+        graph.invoke({"messages": [("user", content)]}, config)
+        while graph.get_state(config).next:
+            graph.invoke(None, config)
+        timings.append(time.perf_counter() - start)
+        last = graph.get_state(config).values["messages"][-1]
+        if not last.content:
+            raise RuntimeError(f"Empty reply to {content!r}")
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--conversations", type=int, default=20)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.0, help="simulated seconds per LLM call")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    builder = GraphBuilder(init_db=True, offline=True)
+    graph = builder.build_graph(llm=ScriptedChatModel(latency=args.latency))
+    print(f"init + build       {time.perf_counter() - start:9.3f}s")
+
+    timings = []
+    lock = threading.Lock()
+
+    def worker(_):
+        conversation = run_conversation(graph, DEMO_CONVERSATION)
+        with lock:
+            timings.extend(conversation)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        list(pool.map(worker, range(args.conversations)))
+    elapsed = time.perf_counter() - start
+
+    timings.sort()
+    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    print(f"turns              {len(timings):9d}")
+    print(f"per turn  p50 {statistics.median(timings) * 1000:9.2f}ms   p95 {p95 * 1000:9.2f}ms")
+    print(f"throughput         {len(timings) / elapsed:9.1f} turns/s")
+
+
+if __name__ == "__main__":
+    main()
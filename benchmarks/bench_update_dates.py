@@ -0,0 +1,119 @@
+"""对比 update_dates 的 SQL 原地平移与 pandas 整表重写的耗时和峰值内存。
+
+每种模式在独立子进程中运行，峰值 RSS 取子进程的 ru_maxrss，互不干扰。
+不指定 --db 时生成一个放大的示例数据库。
+
+用法（在仓库根目录）：
+    python -m benchmarks.bench_update_dates [--db travel2.backup.sqlite] [--flights 200000]
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+MODES = ("sql", "pandas")
+
+
+def build_sample_db(path: str, flights: int):
+    """生成放大的 flights / bookings 表，以及一张不涉及日期的大表"""
+    import sqlite3
+
+    rng = random.Random(0)
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE flights (flight_id INTEGER, flight_no TEXT, scheduled_departure TEXT,"
+        " scheduled_arrival TEXT, departure_airport TEXT, arrival_airport TEXT, status TEXT,"
+        " aircraft_code TEXT, actual_departure TEXT, actual_arrival TEXT)"
+    )
+    rows = []
+    for i in range(flights):
+        day = f"2024-04-{1 + i % 28:02d}"
+        departure = f"{day} {i % 24:02d}:15:00.000000-04:00"
+        arrival = f"{day} {i % 24:02d}:55:00.000000-04:00"
+        landed = i % 3 != 0
+        rows.append(
+            (i, f"LX{i:06d}", departure, arrival, "BSL", "ZRH", "Arrived", "319",
+             departure if landed else "\\N", arrival if landed else "\\N")
+        )
+    conn.executemany("INSERT INTO flights VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+    conn.execute("CREATE TABLE bookings (book_ref TEXT, book_date TEXT, total_amount INTEGER)")
+    conn.executemany(
+        "INSERT INTO bookings VALUES (?, ?, ?)",
+        ((f"B{i}", f"2024-03-{1 + i % 28:02d} 10:00:00.000000+00:00", 100) for i in range(flights)),
+    )
+    conn.execute(
+        "CREATE TABLE ticket_flights (ticket_no TEXT, flight_id INTEGER,"
+        " fare_conditions TEXT, amount INTEGER)"
+    )
+    conn.executemany(
+        "INSERT INTO ticket_flights VALUES (?, ?, 'Economy', ?)",
+        ((f"T{i}", rng.randrange(flights), 100) for i in range(flights * 4)),
+    )
+    conn.commit()
+    conn.close()
+
+
+def _run_child(mode: str, backup_file: str, local_file: str):
+    """子进程入口：执行一次 update_dates 并输出耗时"""
+    from components.tools.chatbots_tools.database_updater_tool import DatabaseUpdaterTool
+
+    tool = DatabaseUpdaterTool.__new__(DatabaseUpdaterTool)
+    tool.backup_file = backup_file
+    tool.local_file = local_file
+    start = time.perf_counter()
+    tool.update_dates(local_file, mode=mode)
+    print(json.dumps({"seconds": time.perf_counter() - start}))
+
+
+def _measure(mode: str, backup_file: str, local_file: str) -> dict:
+    before = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    start = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.bench_update_dates", "--child", mode, backup_file, local_file],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    wall = time.perf_counter() - start
+    peak_kb = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    result = json.loads(output.strip().splitlines()[-1])
+    result["wall"] = wall
+    # ru_maxrss 取所有已结束子进程的最大值，只有在超过之前的值时才能归到本次运行
+    result["peak_mb"] = peak_kb / 1024 if peak_kb > before else None
+    return result
+
+
+def main():
+    if len(sys.argv) == 5 and sys.argv[1] == "--child":
+        _run_child(*sys.argv[2:])
+        return
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--db", help="作为备份文件的数据库，默认生成示例数据库")
+    parser.add_argument("--flights", type=int, default=200000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        backup_file = args.db
+        if backup_file is None:
+            backup_file = os.path.join(tmp, "bench_backup.sqlite")
+            build_sample_db(backup_file, args.flights)
+        print(f"backup: {backup_file} ({os.path.getsize(backup_file) / 2**20:.1f} MiB)")
+        # 先运行内存占用较小的 sql 模式，使 ru_maxrss 能区分两次运行
+        for mode in MODES:
+            local_file = os.path.join(tmp, f"bench_{mode}.sqlite")
+            result = _measure(mode, backup_file, local_file)
+            peak = f"{result['peak_mb']:.0f} MiB" if result["peak_mb"] else "n/a"
+            print(
+                f"{mode:<7} update_dates {result['seconds']:6.2f}s   "
+                f"process wall {result['wall']:6.2f}s   peak RSS {peak}"
+            )
+
+
+if __name__ == "__main__":
+    main()
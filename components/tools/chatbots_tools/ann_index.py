@@ -0,0 +1,152 @@
+import hashlib
+import os
+from typing import Optional
+import numpy as np
+
+
+def normalize_rows(vectors) -> np.ndarray:
+    """转换为 float32 并按行做 L2 归一化，之后点积即余弦相似度"""
+    matrix = np.array(vectors, dtype=np.float32, ndmin=2)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return matrix / norms
+
+
+def fingerprint(matrix: np.ndarray) -> str:
+    """向量矩阵的摘要，用于判断磁盘上的索引是否仍然对应当前语料"""
+    digest = hashlib.sha1(str(matrix.shape).encode("utf-8"))
+    digest.update(np.ascontiguousarray(matrix).tobytes())
+    return digest.hexdigest()
+
+
+class IVFIndex:
+    """纯 NumPy 的倒排文件（IVF）近似最近邻索引。
+
+    用球面 k-means 把归一化向量划分为 `n_lists` 个簇，查询时只对与查询最相近的
+    `n_probe` 个簇中的向量精确打分。n_probe 越大召回率越高、速度越慢，
+    n_probe == n_lists 时退化为精确搜索。
+    """
+
+    _ASSIGN_BATCH = 8192
+
+    def __init__(self, centroids: np.ndarray, order: np.ndarray, offsets: np.ndarray,
+                 matrix_fingerprint: str, n_probe: int = 8):
+        self.centroids = centroids
+        self.order = order
+        self.offsets = offsets
+        self.fingerprint = matrix_fingerprint
+        self.n_probe = n_probe
+
+    @property
+    def n_lists(self) -> int:
+        return self.centroids.shape[0]
+
+    @staticmethod
+    def _assign(matrix: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+        labels = np.empty(matrix.shape[0], dtype=np.int64)
+        for start in range(0, matrix.shape[0], IVFIndex._ASSIGN_BATCH):
+            batch = matrix[start:start + IVFIndex._ASSIGN_BATCH]
+            labels[start:start + len(batch)] = np.argmax(batch @ centroids.T, axis=1)
+        return labels
+
+    @classmethod
+    def build(cls, matrix: np.ndarray, n_lists: Optional[int] = None, n_iter: int = 10,
+              n_probe: int = 8, seed: int = 0, max_train_per_list: int = 64) -> "IVFIndex":
+        """在已归一化的 float32 矩阵上训练簇中心并建立倒排表"""
+        rng = np.random.default_rng(seed)
+        n = matrix.shape[0]
+        if n_lists is None:
+            n_lists = max(1, int(round(np.sqrt(n))))
+        n_lists = min(n_lists, n)
+
+        # 只用样本训练簇中心，再把全部向量分配到最近的簇
+        train = matrix
+        if n > n_lists * max_train_per_list:
+            train = matrix[rng.choice(n, n_lists * max_train_per_list, replace=False)]
+        centroids = train[rng.choice(train.shape[0], n_lists, replace=False)].copy()
+        for _ in range(n_iter):
+            labels = cls._assign(train, centroids)
+            counts = np.bincount(labels, minlength=n_lists)
+            nonempty = np.flatnonzero(counts)
+            starts = np.concatenate([[0], np.cumsum(counts)])[nonempty]
+            sums = np.zeros_like(centroids)
+            sums[nonempty] = np.add.reduceat(train[np.argsort(labels, kind="stable")], starts, axis=0)
+            empty = counts == 0
+            # 空簇用随机样本重新初始化
+            sums[empty] = train[rng.choice(train.shape[0], int(empty.sum()))]
+            centroids = normalize_rows(sums)
+
+        labels = cls._assign(matrix, centroids)
+        order = np.argsort(labels, kind="stable")
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(labels, minlength=n_lists))])
+        return cls(centroids, order, offsets, fingerprint(matrix), n_probe)
+
+    def search(self, matrix: np.ndarray, queries: np.ndarray, k: int,
+               n_probe: Optional[int] = None) -> tuple[list[np.ndarray], list[np.ndarray]]:
+        """返回每个查询的文档下标列表和相似度列表，均按相似度降序，每个查询最多 k 个"""
+        n_probe = min(n_probe or self.n_probe, self.n_lists)
+        list_scores = queries @ self.centroids.T
+        probes = np.argpartition(-list_scores, n_probe - 1, axis=1)[:, :n_probe]
+        all_ids, all_scores = [], []
+        for query, probe in zip(queries, probes):
+            candidates = np.concatenate(
+                [self.order[self.offsets[l]:self.offsets[l + 1]] for l in probe]
+            )
+            scores = matrix[candidates] @ query
+            top = min(k, len(candidates))
+            if top == 0:
+                all_ids.append(candidates)
+                all_scores.append(scores)
+                continue
+            idx = np.argpartition(-scores, top - 1)[:top]
+            idx = idx[np.argsort(-scores[idx])]
+            all_ids.append(candidates[idx])
+            all_scores.append(scores[idx])
+        return all_ids, all_scores
+
+    def save(self, path: str):
+        with open(path, "wb") as f:
+            np.savez(
+                f,
+                centroids=self.centroids,
+                order=self.order,
+                offsets=self.offsets,
+                fingerprint=np.array(self.fingerprint),
+                n_probe=np.array(self.n_probe),
+            )
+
+    @classmethod
+    def load(cls, path: str, matrix: Optional[np.ndarray] = None) -> Optional["IVFIndex"]:
+        """从磁盘读取索引；文件不存在或与给定矩阵不匹配时返回 None"""
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            index = cls(
+                data["centroids"],
+                data["order"],
+                data["offsets"],
+                str(data["fingerprint"]),
+                int(data["n_probe"]),
+            )
+        if matrix is not None and index.fingerprint != fingerprint(matrix):
+            return None
+        return index
+
+
+def exact_search(matrix: np.ndarray, queries: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+    """精确搜索：一次矩阵乘法后按行取 top-k"""
+    scores = queries @ matrix.T
+    top = min(k, scores.shape[1])
+    idx = np.argpartition(-scores, top - 1, axis=1)[:, :top]
+    rows = np.arange(scores.shape[0])[:, None]
+    idx = np.take_along_axis(idx, np.argsort(-scores[rows, idx], axis=1), axis=1)
+    return idx, scores[rows, idx]
+
+
+def recall_at_k(index: IVFIndex, matrix: np.ndarray, queries: np.ndarray, k: int,
+                n_probe: Optional[int] = None) -> float:
+    """近似结果相对精确搜索的召回率"""
+    exact_ids, _ = exact_search(matrix, queries, k)
+    approx_ids, _ = index.search(matrix, queries, k, n_probe)
+    hits = sum(len(set(e.tolist()) & set(a.tolist())) for e, a in zip(exact_ids, approx_ids))
+    return hits / exact_ids.size
@@ -2,8 +2,39 @@ import sqlite3
 from datetime import date, datetime
 from typing import Optional, Union
 from components.tools.chatbots_tools.global_config import GlobalConfig
+from components.tools.chatbots_tools.connection_manager import aconnection, get_connection
+from components.tools.chatbots_tools.result_paging import ResultBudget, page_results, paged_query, projection
+from components.tools.chatbots_tools.search_index import is_missing_index_error, search_query
 from langchain_core.tools import tool
 
+
+def _search_car_rentals_like_query(
+    location: Optional[str], name: Optional[str], columns: Optional[tuple] = None
+) -> tuple[str, list]:
+    """构造基于 LIKE 的汽车租赁搜索语句，数据库没有全文索引时使用"""
+    select = ", ".join(columns) if columns else "*"
+    query = f"SELECT {select} FROM car_rentals WHERE 1=1"
+    params = []
+
+    if location:
+        query += " AND location LIKE ?"
+        params.append(f"%{location}%")
+    if name:
+        query += " AND name LIKE ?"
+        params.append(f"%{name}%")
+    # 在教程中，我们允许匹配任何日期和价格等级。
+    # （因为我们的示例数据集数据有限）
+    query += " ORDER BY id"
+    return query, params
+
+
+def _search_car_rentals_query(
+    location: Optional[str], name: Optional[str], columns: Optional[tuple] = None
+) -> tuple[str, list]:
+    """构造汽车租赁全文检索语句，按相关度排序，同步和异步工具共用"""
+    return search_query("car_rentals", {"location": location, "name": name}, columns=columns)
+
+
 class CarRentalServiceTool:
     def __init__(self, db_path: str):
         GlobalConfig.set_global_db(db_path)
@@ -15,7 +46,10 @@ class CarRentalServiceTool:
         price_tier: Optional[str] = None,
         start_date: Optional[Union[datetime, date]] = None,
         end_date: Optional[Union[datetime, date]] = None,
-    ) -> list[dict]:
+        fields: Optional[list[str]] = None,
+        limit: int = 10,
+        offset: int = 0,
+    ) -> dict:
         """
         根据位置、名称、价格等级、开始日期和结束日期搜索汽车租赁。
 
@@ -25,31 +59,62 @@ class CarRentalServiceTool:
             price_tier (Optional[str]): 汽车租赁的价格等级。默认为 None。
             start_date (Optional[Union[datetime, date]]): 汽车租赁的开始日期。默认为 None。
             end_date (Optional[Union[datetime, date]]): 汽车租赁的结束日期。默认为 None。
+            fields (Optional[list[str]]): 要返回的字段。默认为 id, name, location, price_tier, booked；可选 start_date, end_date。
+            limit (int): 本次返回结果的最大数量。默认为 10。
+            offset (int): 跳过的结果数量，查看更多结果时传入上次返回的 next_offset。默认为 0。
 
         Returns:
-            list[dict]: 匹配搜索条件的汽车租赁字典列表。
+            dict: results 为匹配搜索条件的汽车租赁字典列表；more_results 为 True 时还有更多结果，可用 next_offset 继续查询。
         """
-        conn = sqlite3.connect(GlobalConfig.get_global_db())
+        columns = projection("car_rentals", fields)
+        limit = ResultBudget.page_size(limit)
+        conn = get_connection()
         cursor = conn.cursor()
 
-        query = "SELECT * FROM car_rentals WHERE 1=1"
-        params = []
-
-        if location:
-            query += " AND location LIKE ?"
-            params.append(f"%{location}%")
-        if name:
-            query += " AND name LIKE ?"
-            params.append(f"%{name}%")
-        # 在教程中，我们允许匹配任何日期和价格等级。
-        # （因为我们的示例数据集数据有限）
-        cursor.execute(query, params)
+        try:
+            cursor.execute(*paged_query(*_search_car_rentals_query(location, name, columns), limit, offset))
+        except sqlite3.OperationalError as e:
+            if not is_missing_index_error(e):
+                raise
+            # 数据库尚未建立全文索引（未经 DatabaseUpdaterTool 准备），退回 LIKE 匹配
+            cursor.execute(*paged_query(*_search_car_rentals_like_query(location, name, columns), limit, offset))
         results = cursor.fetchall()
         column_names = [column[0] for column in cursor.description]
 
-        conn.close()
+        cursor.close()
 
-        return [dict(zip(column_names, row)) for row in results]
+        return page_results(column_names, results, limit, offset)
+
+    async def _asearch_car_rentals(
+        location: Optional[str] = None,
+        name: Optional[str] = None,
+        price_tier: Optional[str] = None,
+        start_date: Optional[Union[datetime, date]] = None,
+        end_date: Optional[Union[datetime, date]] = None,
+        fields: Optional[list[str]] = None,
+        limit: int = 10,
+        offset: int = 0,
+    ) -> dict:
+        columns = projection("car_rentals", fields)
+        limit = ResultBudget.page_size(limit)
+        async with aconnection() as conn:
+            try:
+                cursor = await conn.execute(
+                    *paged_query(*_search_car_rentals_query(location, name, columns), limit, offset)
+                )
+            except sqlite3.OperationalError as e:
+                if not is_missing_index_error(e):
+                    raise
+                cursor = await conn.execute(
+                    *paged_query(*_search_car_rentals_like_query(location, name, columns), limit, offset)
+                )
+            results = await cursor.fetchall()
+            column_names = [column[0] for column in cursor.description]
+            await cursor.close()
+
+        return page_results(column_names, results, limit, offset)
+
+    search_car_rentals.coroutine = _asearch_car_rentals
 
     @tool
     def book_car_rental(rental_id: int) -> str:
@@ -62,19 +127,35 @@ class CarRentalServiceTool:
         Returns:
             str: 指示汽车租赁是否成功预订的消息。
         """
-        conn = sqlite3.connect(GlobalConfig.get_global_db())
+        conn = get_connection()
         cursor = conn.cursor()
 
         cursor.execute("UPDATE car_rentals SET booked = 1 WHERE id = ?", (rental_id,))
         conn.commit()
 
         if cursor.rowcount > 0:
-            conn.close()
+            cursor.close()
+            return f"Car rental {rental_id} successfully booked."
+        else:
+            cursor.close()
+            return f"No car rental found with ID {rental_id}."
+
+    async def _abook_car_rental(rental_id: int) -> str:
+        async with aconnection() as conn:
+            cursor = await conn.execute(
+                "UPDATE car_rentals SET booked = 1 WHERE id = ?", (rental_id,)
+            )
+            await conn.commit()
+            rowcount = cursor.rowcount
+            await cursor.close()
+
+        if rowcount > 0:
             return f"Car rental {rental_id} successfully booked."
         else:
-            conn.close()
             return f"No car rental found with ID {rental_id}."
 
+    book_car_rental.coroutine = _abook_car_rental
+
     @tool
     def update_car_rental(
         rental_id: int,
@@ -92,7 +173,7 @@ class CarRentalServiceTool:
         Returns:
             str: 指示汽车租赁是否成功更新的消息。
         """
-        conn = sqlite3.connect(GlobalConfig.get_global_db())
+        conn = get_connection()
         cursor = conn.cursor()
 
         if start_date:
@@ -108,12 +189,41 @@ class CarRentalServiceTool:
         conn.commit()
 
         if cursor.rowcount > 0:
-            conn.close()
+            cursor.close()
             return f"Car rental {rental_id} successfully updated."
         else:
-            conn.close()
+            cursor.close()
             return f"No car rental found with ID {rental_id}."
 
+    async def _aupdate_car_rental(
+        rental_id: int,
+        start_date: Optional[Union[datetime, date]] = None,
+        end_date: Optional[Union[datetime, date]] = None,
+    ) -> str:
+        rowcount = 0
+        async with aconnection() as conn:
+            if start_date:
+                cursor = await conn.execute(
+                    "UPDATE car_rentals SET start_date = ? WHERE id = ?",
+                    (start_date, rental_id),
+                )
+                rowcount = cursor.rowcount
+                await cursor.close()
+            if end_date:
+                cursor = await conn.execute(
+                    "UPDATE car_rentals SET end_date = ? WHERE id = ?", (end_date, rental_id)
+                )
+                rowcount = cursor.rowcount
+                await cursor.close()
+            await conn.commit()
+
+        if rowcount > 0:
+            return f"Car rental {rental_id} successfully updated."
+        else:
+            return f"No car rental found with ID {rental_id}."
+
+    update_car_rental.coroutine = _aupdate_car_rental
+
     @tool
     def cancel_car_rental(rental_id: int) -> str:
         """
@@ -125,19 +235,35 @@ class CarRentalServiceTool:
         Returns:
             str: 指示汽车租赁是否成功取消的消息。
         """
-        conn = sqlite3.connect(GlobalConfig.get_global_db())
+        conn = get_connection()
         cursor = conn.cursor()
 
         cursor.execute("UPDATE car_rentals SET booked = 0 WHERE id = ?", (rental_id,))
         conn.commit()
 
         if cursor.rowcount > 0:
-            conn.close()
+            cursor.close()
             return f"Car rental {rental_id} successfully cancelled."
         else:
-            conn.close()
+            cursor.close()
             return f"No car rental found with ID {rental_id}."
 
+    async def _acancel_car_rental(rental_id: int) -> str:
+        async with aconnection() as conn:
+            cursor = await conn.execute(
+                "UPDATE car_rentals SET booked = 0 WHERE id = ?", (rental_id,)
+            )
+            await conn.commit()
+            rowcount = cursor.rowcount
+            await cursor.close()
+
+        if rowcount > 0:
+            return f"Car rental {rental_id} successfully cancelled."
+        else:
+            return f"No car rental found with ID {rental_id}."
+
+    cancel_car_rental.coroutine = _acancel_car_rental
+
 # from car_rental_service_tool import CarRentalServiceTool
 
 # # 初始化工具类，提供您的SQLite数据库路径
@@ -0,0 +1,226 @@
+import asyncio
+import sqlite3
+import threading
+import weakref
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+import aiosqlite
+from components.tools.chatbots_tools.global_config import GlobalConfig
+
+
+class PooledConnection(sqlite3.Connection):
+    """支持弱引用的 SQLite 连接，便于连接池在不持有强引用的情况下跟踪连接。"""
+
+
+class ConnectionManager:
+    """按线程复用的长连接 SQLite 连接池。
+
+    每个线程对每个数据库路径只打开一次连接，并在打开时设置 WAL 模式、
+    busy timeout 和语句缓存。线程结束后其连接随线程本地存储一起被回收；
+    当数据库文件被整体替换时（例如重置日期），调用 `close_all` 让所有线程在下次使用时重新连接。
+    异步工具使用的 `AsyncConnectionManager` 共用这里的连接参数和失效计数。
+    """
+
+    busy_timeout_ms = 5000
+    cached_statements = 256
+    journal_mode = "WAL"
+    synchronous = "NORMAL"
+
+    _local = threading.local()
+    _lock = threading.Lock()
+    _connections = {}
+    _generations = {}
+
+    @staticmethod
+    def configure(
+        busy_timeout_ms: Optional[int] = None,
+        cached_statements: Optional[int] = None,
+        journal_mode: Optional[str] = None,
+        synchronous: Optional[str] = None,
+    ):
+        """调整新建连接使用的参数，已打开的连接不受影响"""
+        if busy_timeout_ms is not None:
+            ConnectionManager.busy_timeout_ms = busy_timeout_ms
+        if cached_statements is not None:
+            ConnectionManager.cached_statements = cached_statements
+        if journal_mode is not None:
+            ConnectionManager.journal_mode = journal_mode
+        if synchronous is not None:
+            ConnectionManager.synchronous = synchronous
+
+    @staticmethod
+    def pragmas() -> list[str]:
+        """新建连接时执行的 PRAGMA 语句"""
+        return [
+            f"PRAGMA busy_timeout = {int(ConnectionManager.busy_timeout_ms)}",
+            f"PRAGMA journal_mode = {ConnectionManager.journal_mode}",
+            f"PRAGMA synchronous = {ConnectionManager.synchronous}",
+        ]
+
+    @staticmethod
+    def connect(db_path: str) -> sqlite3.Connection:
+        """打开一个按连接池参数配置好的新连接（不加入连接池）"""
+        conn = sqlite3.connect(
+            db_path,
+            timeout=ConnectionManager.busy_timeout_ms / 1000,
+            check_same_thread=False,
+            cached_statements=ConnectionManager.cached_statements,
+            factory=PooledConnection,
+            # 支持 file:...?mode=memory&cache=shared 形式的内存快照，普通路径不受影响
+            uri=True,
+        )
+        for pragma in ConnectionManager.pragmas():
+            conn.execute(pragma)
+        return conn
+
+    @staticmethod
+    def get_connection(db_path: Optional[str] = None) -> sqlite3.Connection:
+        """获取当前线程对应数据库的连接，默认使用全局数据库路径"""
+        db_path = db_path or GlobalConfig.get_global_db()
+        if db_path is None:
+            raise ValueError("No database path configured.")
+
+        pool = getattr(ConnectionManager._local, "pool", None)
+        if pool is None:
+            pool = ConnectionManager._local.pool = {}
+
+        generation = ConnectionManager._generations.get(db_path, 0)
+        entry = pool.get(db_path)
+        if entry is not None and entry[0] == generation:
+            return entry[1]
+
+        conn = ConnectionManager.connect(db_path)
+        pool[db_path] = (generation, conn)
+        with ConnectionManager._lock:
+            ConnectionManager._connections.setdefault(db_path, weakref.WeakSet()).add(conn)
+        return conn
+
+    @staticmethod
+    def generation(db_path: str) -> int:
+        """数据库被 close_all 失效（通常是文件被整体替换）的次数，依赖文件内容的缓存可以用它作为键的一部分"""
+        return ConnectionManager._generations.get(db_path, 0)
+
+    @staticmethod
+    def close_all(db_path: Optional[str] = None):
+        """关闭指定数据库（默认全部数据库）在所有线程中的连接"""
+        with ConnectionManager._lock:
+            paths = [db_path] if db_path else list(ConnectionManager._connections)
+            for path in paths:
+                ConnectionManager._generations[path] = ConnectionManager._generations.get(path, 0) + 1
+                for conn in list(ConnectionManager._connections.pop(path, ())):
+                    conn.close()
+
+
+class _AsyncPool:
+    """单个事件循环中某个数据库的 aiosqlite 连接池"""
+
+    def __init__(self, db_path: str, generation: int, size: int):
+        self.db_path = db_path
+        self.generation = generation
+        self.closed = False
+        self._idle = []
+        self._semaphore = asyncio.Semaphore(size)
+
+    async def acquire(self) -> aiosqlite.Connection:
+        await self._semaphore.acquire()
+        try:
+            if self._idle:
+                return self._idle.pop()
+            conn = aiosqlite.connect(
+                self.db_path,
+                timeout=ConnectionManager.busy_timeout_ms / 1000,
+                cached_statements=ConnectionManager.cached_statements,
+                uri=True,
+            )
+            # 池中的长连接会一直存活，工作线程不能阻止进程退出
+            conn.daemon = True
+            await conn
+            for pragma in ConnectionManager.pragmas():
+                await conn.execute(pragma)
+            return conn
+        except BaseException:
+            self._semaphore.release()
+            raise
+
+    async def release(self, conn: aiosqlite.Connection):
+        try:
+            if self.closed:
+                await conn.close()
+            else:
+                self._idle.append(conn)
+        finally:
+            self._semaphore.release()
+
+    async def close(self):
+        self.closed = True
+        idle, self._idle = self._idle, []
+        for conn in idle:
+            await conn.close()
+
+
+class AsyncConnectionManager:
+    """异步工具使用的 aiosqlite 连接池。
+
+    每个事件循环、每个数据库路径维护最多 `pool_size` 个长连接，协程在连接上排队，
+    而不是为每次查询占用一个线程。`ConnectionManager.close_all` 之后，
+    旧连接会在下一次获取连接时被关闭并重建。
+    """
+
+    pool_size = 4
+
+    _pools = weakref.WeakKeyDictionary()
+
+    @staticmethod
+    def configure(pool_size: Optional[int] = None):
+        """调整每个事件循环中每个数据库的最大连接数"""
+        if pool_size is not None:
+            AsyncConnectionManager.pool_size = pool_size
+
+    @staticmethod
+    @asynccontextmanager
+    async def connection(db_path: Optional[str] = None) -> AsyncIterator[aiosqlite.Connection]:
+        """借出一个异步连接，使用完毕后归还连接池"""
+        db_path = db_path or GlobalConfig.get_global_db()
+        if db_path is None:
+            raise ValueError("No database path configured.")
+
+        pools = AsyncConnectionManager._pools.setdefault(asyncio.get_running_loop(), {})
+        generation = ConnectionManager._generations.get(db_path, 0)
+        pool = pools.get(db_path)
+        if pool is None or pool.generation != generation:
+            if pool is not None:
+                await pool.close()
+            # 顺带关闭其他已失效数据库（例如被回收的会话快照）的空闲连接
+            for path, stale in list(pools.items()):
+                if path != db_path and stale.generation != ConnectionManager._generations.get(path, 0):
+                    del pools[path]
+                    await stale.close()
+            pool = pools[db_path] = _AsyncPool(
+                db_path, generation, AsyncConnectionManager.pool_size
+            )
+
+        conn = await pool.acquire()
+        try:
+            yield conn
+        except BaseException:
+            await conn.rollback()
+            raise
+        finally:
+            await pool.release(conn)
+
+    @staticmethod
+    async def close_all():
+        """关闭当前事件循环中所有空闲的异步连接，用于优雅退出"""
+        pools = AsyncConnectionManager._pools.pop(asyncio.get_running_loop(), {})
+        for pool in pools.values():
+            await pool.close()
+
+
+def get_connection(db_path: Optional[str] = None) -> sqlite3.Connection:
+    """获取当前线程的池化数据库连接"""
+    return ConnectionManager.get_connection(db_path)
+
+
+def aconnection(db_path: Optional[str] = None):
+    """异步上下文管理器：从当前事件循环的连接池借出一个 aiosqlite 连接"""
+    return AsyncConnectionManager.connection(db_path)
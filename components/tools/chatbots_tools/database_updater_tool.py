@@ -1,33 +1,195 @@
 import os
 import shutil
 import sqlite3
+import threading
+from datetime import datetime, timedelta, timezone
 import pandas as pd
 import requests
+from components.tools.chatbots_tools.connection_manager import ConnectionManager
+from components.tools.chatbots_tools.offline_fixtures import build_fixture_db
+from components.tools.chatbots_tools.search_index import ensure_search_indexes
+
+def _shift_timestamp(value, offset_us, to_utc):
+    """SQL 函数：把时间戳文本平移 offset_us 微秒，'\\N' 视为空值"""
+    if value is None or value == "\\N":
+        return None
+    shifted = datetime.fromisoformat(value) + timedelta(microseconds=offset_us)
+    if to_utc:
+        if shifted.tzinfo is None:
+            shifted = shifted.replace(tzinfo=timezone.utc)
+        shifted = shifted.astimezone(timezone.utc)
+    return shifted.isoformat(" ", timespec="microseconds")
+
+
+def _timestamp_epoch(value):
+    """SQL 函数：时间戳文本对应的 Unix 时间，用于在不同时区偏移之间比较先后"""
+    if value is None or value == "\\N":
+        return None
+    return datetime.fromisoformat(value).timestamp()
+
 
 class DatabaseUpdaterTool:
-    def __init__(self, db_url=None, local_file=None, backup_file=None, overwrite=False):
+    # 工具查询依赖的索引声明：索引名 -> (表名, 列)
+    # 由本类创建和维护，名称以 idx_ 开头的其他索引会被视为过期并删除
+    INDEXES = {
+        "idx_tickets_passenger_id": ("tickets", ("passenger_id",)),
+        "idx_tickets_ticket_no": ("tickets", ("ticket_no",)),
+        "idx_ticket_flights_ticket_no": ("ticket_flights", ("ticket_no",)),
+        "idx_flights_flight_id": ("flights", ("flight_id",)),
+        "idx_flights_route": ("flights", ("departure_airport", "arrival_airport", "scheduled_departure")),
+        "idx_flights_arrival": ("flights", ("arrival_airport", "scheduled_departure")),
+        "idx_flights_scheduled_departure": ("flights", ("scheduled_departure",)),
+        "idx_boarding_passes_ticket_flight": ("boarding_passes", ("ticket_no", "flight_id")),
+        "idx_hotels_id": ("hotels", ("id",)),
+        "idx_car_rentals_id": ("car_rentals", ("id",)),
+        "idx_trip_recommendations_id": ("trip_recommendations", ("id",)),
+    }
+
+    # 本进程中已检查过索引的文件：绝对路径 -> 检查后的 (mtime_ns, size)，文件未被改写时不再重复检查
+    _indexed_files = {}
+    _indexed_lock = threading.Lock()
+
+    def __init__(self, db_url=None, local_file=None, backup_file=None, overwrite=False, offline=False):
         self.db_url = db_url or "https://storage.googleapis.com/benchmarks-artifacts/travel-db/travel2.sqlite"
         self.local_file = local_file or "travel2.sqlite"
         self.backup_file = backup_file or "travel2.backup.sqlite"
         self.overwrite = overwrite
+        # 离线运行时不下载数据库，改为生成结构相同的小型示例数据库
+        self.offline = offline
         self._download_and_prepare_db()
+        self.ensure_indexes_once()
     
     def _download_and_prepare_db(self):
         if self.overwrite or not os.path.exists(self.local_file):
-            response = requests.get(self.db_url)
-            response.raise_for_status()  # 确保请求成功
-            with open(self.local_file, "wb") as f:
-                f.write(response.content)
+            if self.offline:
+                ConnectionManager.close_all(self.local_file)
+                build_fixture_db(self.local_file)
+            else:
+                response = requests.get(self.db_url)
+                response.raise_for_status()  # 确保请求成功
+                ConnectionManager.close_all(self.local_file)
+                with open(self.local_file, "wb") as f:
+                    f.write(response.content)
             # 备份数据库，以便在每个部分重置
             shutil.copy(self.local_file, self.backup_file)
-    
-    def update_dates(self, file_path=None, init_db=True):
-        """将航班日期更新为当前时间，以便在教程中使用。"""
+
+    @staticmethod
+    def _file_signature(file_path):
+        stat = os.stat(file_path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def ensure_indexes_once(self, file_path=None):
+        """同 ensure_indexes，但文件自上次检查后未被改写时直接返回，每个会话新建工具时不会重复打开共享数据库"""
+        if file_path is None:
+            file_path = self.local_file
+        key = os.path.abspath(file_path)
+        with DatabaseUpdaterTool._indexed_lock:
+            if DatabaseUpdaterTool._indexed_files.get(key) == self._file_signature(file_path):
+                return file_path
+            self.ensure_indexes(file_path)
+            DatabaseUpdaterTool._indexed_files[key] = self._file_signature(file_path)
+        return file_path
+
+    def ensure_indexes(self, file_path=None):
+        """创建缺失的索引，重建定义已变化的索引，删除不再声明的索引，并维护全文索引。"""
+        if file_path is None:
+            file_path = self.local_file
+        conn = sqlite3.connect(file_path)
+        cursor = conn.cursor()
+
+        tables = {
+            row[0]
+            for row in cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
+        }
+        existing = {
+            row[0]: row[1]
+            for row in cursor.execute(
+                "SELECT name, tbl_name FROM sqlite_master WHERE type='index' AND name LIKE 'idx\\_%' ESCAPE '\\'"
+            )
+        }
+        changed = False
+        for name in existing.keys() - self.INDEXES.keys():
+            cursor.execute(f'DROP INDEX "{name}"')
+            changed = True
+        for name, (table, columns) in self.INDEXES.items():
+            if table not in tables:
+                continue
+            if name in existing:
+                current = tuple(
+                    row[2] for row in cursor.execute(f'PRAGMA index_info("{name}")')
+                )
+                if existing[name] == table and current == columns:
+                    continue
+                cursor.execute(f'DROP INDEX "{name}"')
+            column_list = ", ".join(f'"{column}"' for column in columns)
+            cursor.execute(f'CREATE INDEX "{name}" ON "{table}" ({column_list})')
+            changed = True
+        if changed:
+            # 更新统计信息，让查询规划器选用新索引
+            cursor.execute("ANALYZE")
+        conn.commit()
+        # 搜索工具使用的 FTS5 全文索引
+        ensure_search_indexes(conn)
+        conn.close()
+        return file_path
+
+    def update_dates(self, file_path=None, init_db=True, mode="sql"):
+        """将航班日期更新为当前时间，以便在教程中使用。
+
+        mode="sql"（默认）只计算一次时间差，在一个事务中用 UPDATE 语句平移
+        flights 和 bookings 的日期列，其余表不动，列类型和索引都得以保留；
+        mode="pandas" 为原来的做法，把所有表读入 pandas 后整体写回。
+        """
+        if mode not in ("sql", "pandas"):
+            raise ValueError(f"Unknown update_dates mode: {mode}")
         if file_path is None:
             file_path = self.local_file
         if not init_db:
-            return file_path
+            return self.ensure_indexes_once(file_path)
+        # 文件即将被整体替换，先关闭连接池中指向它的长连接
+        ConnectionManager.close_all(file_path)
         shutil.copy(self.backup_file, file_path)
+        if mode == "sql":
+            self._shift_dates_in_place(file_path)
+        else:
+            self._shift_dates_with_pandas(file_path)
+        return self.ensure_indexes(file_path)
+
+    def _shift_dates_in_place(self, file_path):
+        """用集合式 UPDATE 语句在原文件上平移日期"""
+        conn = sqlite3.connect(file_path)
+        conn.create_function("shift_timestamp", 3, _shift_timestamp, deterministic=True)
+        conn.create_function("timestamp_epoch", 1, _timestamp_epoch, deterministic=True)
+        cursor = conn.cursor()
+
+        cursor.execute(
+            "SELECT actual_departure FROM flights"
+            " WHERE actual_departure IS NOT NULL AND actual_departure != '\\N'"
+            " ORDER BY timestamp_epoch(actual_departure) DESC LIMIT 1"
+        )
+        example_time = datetime.fromisoformat(cursor.fetchone()[0])
+        # 与 pandas 版本保持一致：pd.to_datetime("now") 是 UTC 的墙上时间，再标记为样例数据的时区
+        current_time = datetime.now(timezone.utc).replace(tzinfo=example_time.tzinfo)
+        offset_us = (current_time - example_time) // timedelta(microseconds=1)
+
+        with conn:
+            cursor.execute(
+                "UPDATE flights SET"
+                " scheduled_departure = shift_timestamp(scheduled_departure, :offset, 0),"
+                " scheduled_arrival = shift_timestamp(scheduled_arrival, :offset, 0),"
+                " actual_departure = shift_timestamp(actual_departure, :offset, 0),"
+                " actual_arrival = shift_timestamp(actual_arrival, :offset, 0)",
+                {"offset": offset_us},
+            )
+            cursor.execute(
+                "UPDATE bookings SET book_date = shift_timestamp(book_date, :offset, 1)",
+                {"offset": offset_us},
+            )
+        cursor.close()
+        conn.close()
+
+    def _shift_dates_with_pandas(self, file_path):
+        """把所有表读入 pandas 平移日期后整体写回"""
         conn = sqlite3.connect(file_path)
         cursor = conn.cursor()
     
@@ -67,8 +229,6 @@ class DatabaseUpdaterTool:
         conn.commit()
         conn.close()
     
-        return file_path
-    
 # from database_updater_tool import DatabaseUpdaterTool
 
 # # 实例化工具类
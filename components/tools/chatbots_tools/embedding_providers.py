@@ -0,0 +1,116 @@
+import re
+import zlib
+from typing import Optional, Sequence
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+
+class EmbeddingProvider(Embeddings):
+    """检索器使用的嵌入接口。
+
+    在 LangChain `Embeddings`（embed_documents / embed_query）的基础上增加：
+    - `cache_key`：写入 EmbeddingStore 时使用的模型键，为 None 表示向量不需要缓存；
+    - `fit(texts)`：建库前用全部文档调用一次，依赖语料统计的实现可在此拟合。
+    """
+
+    cache_key: Optional[str] = None
+
+    def fit(self, texts: Sequence[str]) -> "EmbeddingProvider":
+        return self
+
+
+class AzureEmbeddingProvider(EmbeddingProvider):
+    """通过 azure.ai.inference.EmbeddingsClient 计算向量，未传入客户端时按 config 创建"""
+
+    def __init__(self, client=None, model: Optional[str] = None):
+        import config as cfg
+
+        if client is None:
+            from azure.ai.inference import EmbeddingsClient
+            from azure.core.credentials import AzureKeyCredential
+
+            client = EmbeddingsClient(
+                endpoint=cfg.EMBEDDING_ENDPOINT_URL,
+                credential=AzureKeyCredential(cfg.AZURE_OPENAI_API_KEY),
+                api_version=cfg.EMBEDDING_API_VERSION,
+            )
+        self.client = client
+        self.model = model or cfg.EMBEDDING_DEPLOYMENT_NAME
+        self.cache_key = self.model
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        embeddings = self.client.embed(model=self.model, input=texts)
+        return [emb.embedding for emb in embeddings.data]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embed_documents([text])[0]
+
+
+class HashingTfidfEmbeddingProvider(EmbeddingProvider):
+    """纯 CPU 的本地嵌入：词、相邻词对和词内字符 n-gram 经哈希映射到固定维度，按 TF-IDF 加权。
+
+    不需要网络和模型文件，单次查询在毫秒级完成，适合离线运行和测试。
+    IDF 在 `fit` 时由文档集合统计，向量做 L2 归一化，点积即余弦相似度。
+    """
+
+    _TOKEN = re.compile(r"\w+", re.UNICODE)
+
+    def __init__(self, n_features: int = 2 ** 14, char_ngrams: tuple[int, int] = (3, 5)):
+        self.n_features = n_features
+        self.char_ngrams = char_ngrams
+        self._idf = np.ones(n_features, dtype=np.float32)
+
+    def _features(self, text: str) -> list[str]:
+        words = self._TOKEN.findall(text.lower())
+        features = [f"w:{word}" for word in words]
+        features += [f"b:{first} {second}" for first, second in zip(words, words[1:])]
+        low, high = self.char_ngrams
+        for word in words:
+            padded = f"<{word}>"
+            for n in range(low, high + 1):
+                features += [f"c:{padded[i:i + n]}" for i in range(len(padded) - n + 1)]
+        return features
+
+    def _hashed(self, text: str) -> tuple[np.ndarray, np.ndarray]:
+        """返回特征的哈希桶下标和符号（±1，减小哈希冲突带来的偏差）"""
+        hashes = np.array(
+            [zlib.crc32(feature.encode("utf-8")) for feature in self._features(text)],
+            dtype=np.uint32,
+        )
+        signs = np.where(hashes & 0x80000000, -1.0, 1.0).astype(np.float32)
+        return (hashes & 0x7FFFFFFF) % self.n_features, signs
+
+    def fit(self, texts: Sequence[str]) -> "HashingTfidfEmbeddingProvider":
+        df = np.zeros(self.n_features, dtype=np.float32)
+        for text in texts:
+            indices, _ = self._hashed(text)
+            df[np.unique(indices)] += 1
+        self._idf = (np.log((1 + len(texts)) / (1 + df)) + 1).astype(np.float32)
+        return self
+
+    def _embed(self, text: str) -> np.ndarray:
+        indices, signs = self._hashed(text)
+        counts = np.bincount(indices, weights=signs, minlength=self.n_features).astype(np.float32)
+        # 次线性词频：log(1 + |tf|)，保留符号
+        vector = np.sign(counts) * np.log1p(np.abs(counts)) * self._idf
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def embed_documents(self, texts: list[str]) -> list[np.ndarray]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> np.ndarray:
+        return self._embed(text)
+
+
+EMBEDDING_PROVIDERS = {
+    "azure": AzureEmbeddingProvider,
+    "local": HashingTfidfEmbeddingProvider,
+}
+
+
+def get_embedding_provider(name: str = "azure", **kwargs) -> EmbeddingProvider:
+    """按名称创建嵌入实现：azure 或 local"""
+    if name not in EMBEDDING_PROVIDERS:
+        raise ValueError(f"Unknown embedding provider: {name}")
+    return EMBEDDING_PROVIDERS[name](**kwargs)
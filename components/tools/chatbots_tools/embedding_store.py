@@ -0,0 +1,99 @@
+import hashlib
+import sqlite3
+from typing import Callable, Iterable, Sequence
+import numpy as np
+
+
+def content_hash(text: str) -> str:
+    """文本内容的 SHA-256 摘要，作为缓存键"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingStore:
+    """以内容哈希为键、保存在 SQLite 中的向量缓存。
+
+    每条记录对应 (模型, 文本哈希) -> float32 向量。文档内容不变时直接读取缓存，
+    只有新增或修改过的文本块才会调用嵌入接口，因此热启动不会产生任何嵌入请求。
+    """
+
+    _LOOKUP_BATCH = 500
+
+    def __init__(self, path: str = "embeddings.sqlite"):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        conn = sqlite3.connect(self.path)
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                " model TEXT NOT NULL,"
+                " content_hash TEXT NOT NULL,"
+                " dim INTEGER NOT NULL,"
+                " vector BLOB NOT NULL,"
+                " PRIMARY KEY (model, content_hash)"
+                ") WITHOUT ROWID"
+            )
+        conn.close()
+
+    def get_many(self, model: str, hashes: Iterable[str]) -> dict[str, np.ndarray]:
+        """读取已缓存的向量，返回 哈希 -> 向量"""
+        hashes = list(dict.fromkeys(hashes))
+        found = {}
+        conn = sqlite3.connect(self.path)
+        for start in range(0, len(hashes), self._LOOKUP_BATCH):
+            batch = hashes[start:start + self._LOOKUP_BATCH]
+            placeholders = ", ".join("?" for _ in batch)
+            rows = conn.execute(
+                f"SELECT content_hash, vector FROM embeddings"
+                f" WHERE model = ? AND content_hash IN ({placeholders})",
+                [model, *batch],
+            )
+            for key, blob in rows:
+                found[key] = np.frombuffer(blob, dtype=np.float32)
+        conn.close()
+        return found
+
+    def put_many(self, model: str, items: Iterable[tuple[str, Sequence[float]]]):
+        """写入 (哈希, 向量) 列表，已存在的记录被覆盖"""
+        rows = []
+        for key, vector in items:
+            vector = np.asarray(vector, dtype=np.float32)
+            rows.append((model, key, vector.shape[0], vector.tobytes()))
+        conn = sqlite3.connect(self.path)
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, content_hash, dim, vector)"
+                " VALUES (?, ?, ?, ?)",
+                rows,
+            )
+        conn.close()
+
+    def embed(
+        self,
+        model: str,
+        texts: Sequence[str],
+        embed_fn: Callable[[list[str]], list[Sequence[float]]],
+        batch_size: int = 256,
+    ) -> np.ndarray:
+        """返回 texts 的向量矩阵（float32），缓存中缺失的文本通过 embed_fn 分批计算并写入缓存"""
+        hashes = [content_hash(text) for text in texts]
+        cached = self.get_many(model, hashes)
+        missing = {}
+        for key, text in zip(hashes, texts):
+            if key not in cached:
+                missing.setdefault(key, text)
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+
+        pending = list(missing.items())
+        for start in range(0, len(pending), batch_size):
+            batch = pending[start:start + batch_size]
+            vectors = embed_fn([text for _, text in batch])
+            computed = [(key, vector) for (key, _), vector in zip(batch, vectors)]
+            self.put_many(model, computed)
+            for key, vector in computed:
+                cached[key] = np.asarray(vector, dtype=np.float32)
+
+        if not hashes:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.vstack([cached[key] for key in hashes])
@@ -1,11 +1,70 @@
-import sqlite3
 from datetime import date, datetime
 from typing import Union, Optional
 from components.tools.chatbots_tools.global_config import GlobalConfig
+from components.tools.chatbots_tools.connection_manager import aconnection, get_connection
+from components.tools.chatbots_tools.user_info_cache import UserInfoCache
 import pytz
 from langchain_core.runnables import RunnableConfig
 from langchain_core.tools import tool
 
+USER_FLIGHT_INFORMATION_QUERY = """
+        SELECT 
+            t.ticket_no, t.book_ref,
+            f.flight_id, f.flight_no, f.departure_airport, f.arrival_airport, f.scheduled_departure, f.scheduled_arrival,
+            bp.seat_no, tf.fare_conditions
+        FROM 
+            tickets t
+            JOIN ticket_flights tf ON t.ticket_no = tf.ticket_no
+            JOIN flights f ON tf.flight_id = f.flight_id
+            JOIN boarding_passes bp ON bp.ticket_no = t.ticket_no AND bp.flight_id = f.flight_id
+        WHERE 
+            t.passenger_id = ?
+        """
+
+
+def _search_flights_query(
+    departure_airport: Optional[str],
+    arrival_airport: Optional[str],
+    start_time: Optional[Union[date, datetime]],
+    end_time: Optional[Union[date, datetime]],
+    limit: int,
+) -> tuple[str, list]:
+    """构造航班搜索语句，同步和异步工具共用"""
+    query = "SELECT * FROM flights WHERE 1 = 1"
+    params = []
+
+    if departure_airport:
+        query += " AND departure_airport = ?"
+        params.append(departure_airport)
+
+    if arrival_airport:
+        query += " AND arrival_airport = ?"
+        params.append(arrival_airport)
+
+    if start_time:
+        query += " AND scheduled_departure >= ?"
+        params.append(start_time)
+
+    if end_time:
+        query += " AND scheduled_departure <= ?"
+        params.append(end_time)
+    query += " LIMIT ?"
+    params.append(limit)
+    return query, params
+
+
+def _check_reschedule_window(scheduled_departure: str) -> Optional[str]:
+    """距离起飞不足 3 小时的航班不允许改签，返回拒绝信息；允许时返回 None"""
+    timezone = pytz.timezone("Etc/GMT-3")
+    current_time = datetime.now(tz=timezone)
+    departure_time = datetime.strptime(
+        scheduled_departure, "%Y-%m-%d %H:%M:%S.%f%z"
+    )
+    time_until = (departure_time - current_time).total_seconds()
+    if time_until < (3 * 3600):
+        return f"Not permitted to reschedule to a flight that is less than 3 hours from the current time. Selected flight is at {departure_time}."
+    return None
+
 
 class FlightServiceTool:
     def __init__(self, db_path: str):
@@ -26,32 +85,46 @@ class FlightServiceTool:
         if not passenger_id:
             raise ValueError("No passenger ID configured.")
 
-        conn = sqlite3.connect(GlobalConfig.get_global_db())
+        # 结果只会被改签/退票修改，两者会使缓存失效
+        token, cached = UserInfoCache.lookup(passenger_id)
+        if cached is not None:
+            return cached
+
+        conn = get_connection()
         cursor = conn.cursor()
 
-        query = """
-        SELECT 
-            t.ticket_no, t.book_ref,
-            f.flight_id, f.flight_no, f.departure_airport, f.arrival_airport, f.scheduled_departure, f.scheduled_arrival,
-            bp.seat_no, tf.fare_conditions
-        FROM 
-            tickets t
-            JOIN ticket_flights tf ON t.ticket_no = tf.ticket_no
-            JOIN flights f ON tf.flight_id = f.flight_id
-            JOIN boarding_passes bp ON bp.ticket_no = t.ticket_no AND bp.flight_id = f.flight_id
-        WHERE 
-            t.passenger_id = ?
-        """
-        cursor.execute(query, (passenger_id,))
+        cursor.execute(USER_FLIGHT_INFORMATION_QUERY, (passenger_id,))
         rows = cursor.fetchall()
         column_names = [column[0] for column in cursor.description]
         results = [dict(zip(column_names, row)) for row in rows]
 
         cursor.close()
-        conn.close()
 
+        UserInfoCache.store(token, results)
+        return results
+
+    async def _afetch_user_flight_information(config: RunnableConfig) -> list[dict]:
+        configuration = config.get("configurable", {})
+        passenger_id = configuration.get("passenger_id", None)
+        if not passenger_id:
+            raise ValueError("No passenger ID configured.")
+
+        token, cached = UserInfoCache.lookup(passenger_id)
+        if cached is not None:
+            return cached
+
+        async with aconnection() as conn:
+            cursor = await conn.execute(USER_FLIGHT_INFORMATION_QUERY, (passenger_id,))
+            rows = await cursor.fetchall()
+            column_names = [column[0] for column in cursor.description]
+            await cursor.close()
+
+        results = [dict(zip(column_names, row)) for row in rows]
+        UserInfoCache.store(token, results)
         return results
 
+    fetch_user_flight_information.coroutine = _afetch_user_flight_information
+
     @tool
     def search_flights(
         departure_airport: Optional[str] = None,
@@ -72,39 +145,41 @@ class FlightServiceTool:
         Returns:
             list[dict]: 航班信息的字典列表。
         """
-        conn = sqlite3.connect(GlobalConfig.get_global_db())
+        conn = get_connection()
         cursor = conn.cursor()
 
-        query = "SELECT * FROM flights WHERE 1 = 1"
-        params = []
-
-        if departure_airport:
-            query += " AND departure_airport = ?"
-            params.append(departure_airport)
-
-        if arrival_airport:
-            query += " AND arrival_airport = ?"
-            params.append(arrival_airport)
-
-        if start_time:
-            query += " AND scheduled_departure >= ?"
-            params.append(start_time)
-
-        if end_time:
-            query += " AND scheduled_departure <= ?"
-            params.append(end_time)
-        query += " LIMIT ?"
-        params.append(limit)
+        query, params = _search_flights_query(
+            departure_airport, arrival_airport, start_time, end_time, limit
+        )
         cursor.execute(query, params)
         rows = cursor.fetchall()
         column_names = [column[0] for column in cursor.description]
         results = [dict(zip(column_names, row)) for row in rows]
 
         cursor.close()
-        conn.close()
 
         return results
 
+    async def _asearch_flights(
+        departure_airport: Optional[str] = None,
+        arrival_airport: Optional[str] = None,
+        start_time: Optional[Union[date, datetime]] = None,
+        end_time: Optional[Union[date, datetime]] = None,
+        limit: int = 20,
+    ) -> list[dict]:
+        query, params = _search_flights_query(
+            departure_airport, arrival_airport, start_time, end_time, limit
+        )
+        async with aconnection() as conn:
+            cursor = await conn.execute(query, params)
+            rows = await cursor.fetchall()
+            column_names = [column[0] for column in cursor.description]
+            await cursor.close()
+
+        return [dict(zip(column_names, row)) for row in rows]
+
+    search_flights.coroutine = _asearch_flights
+
     @tool
     def update_ticket_to_new_flight(
         ticket_no: str,
@@ -127,7 +202,7 @@ class FlightServiceTool:
         if not passenger_id:
             raise ValueError("No passenger ID configured.")
 
-        conn = sqlite3.connect(GlobalConfig.get_global_db())
+        conn = get_connection()
         cursor = conn.cursor()
 
         cursor.execute(
@@ -137,18 +212,13 @@ class FlightServiceTool:
         new_flight = cursor.fetchone()
         if not new_flight:
             cursor.close()
-            conn.close()
             return "Invalid new flight ID provided."
         column_names = [column[0] for column in cursor.description]
         new_flight_dict = dict(zip(column_names, new_flight))
-        timezone = pytz.timezone("Etc/GMT-3")
-        current_time = datetime.now(tz=timezone)
-        departure_time = datetime.strptime(
-            new_flight_dict["scheduled_departure"], "%Y-%m-%d %H:%M:%S.%f%z"
-        )
-        time_until = (departure_time - current_time).total_seconds()
-        if time_until < (3 * 3600):
-            return f"Not permitted to reschedule to a flight that is less than 3 hours from the current time. Selected flight is at {departure_time}."
+        rejection = _check_reschedule_window(new_flight_dict["scheduled_departure"])
+        if rejection:
+            cursor.close()
+            return rejection
 
         cursor.execute(
             "SELECT flight_id FROM ticket_flights WHERE ticket_no = ?", (ticket_no,)
@@ -156,7 +226,6 @@ class FlightServiceTool:
         current_flight = cursor.fetchone()
         if not current_flight:
             cursor.close()
-            conn.close()
             return "No existing ticket found for the given ticket number."
 
         # 检查当前登录的用户是否拥有这张机票
@@ -167,7 +236,6 @@ class FlightServiceTool:
         current_ticket = cursor.fetchone()
         if not current_ticket:
             cursor.close()
-            conn.close()
             return f"Current signed-in passenger with ID {passenger_id} not the owner of ticket {ticket_no}"
 
         # 您可以在此添加其他业务逻辑检查
@@ -177,11 +245,63 @@ class FlightServiceTool:
             (new_flight_id, ticket_no),
         )
         conn.commit()
+        UserInfoCache.invalidate(passenger_id)
 
         cursor.close()
-        conn.close()
         return "Ticket successfully updated to new flight."
 
+    async def _aupdate_ticket_to_new_flight(
+        ticket_no: str,
+        new_flight_id: int,
+        *,
+        config: RunnableConfig
+    ) -> str:
+        configuration = config.get("configurable", {})
+        passenger_id = configuration.get("passenger_id", None)
+        if not passenger_id:
+            raise ValueError("No passenger ID configured.")
+
+        async with aconnection() as conn:
+            async with conn.execute(
+                "SELECT departure_airport, arrival_airport, scheduled_departure FROM flights WHERE flight_id = ?",
+                (new_flight_id,),
+            ) as cursor:
+                new_flight = await cursor.fetchone()
+                column_names = [column[0] for column in cursor.description]
+            if not new_flight:
+                return "Invalid new flight ID provided."
+            new_flight_dict = dict(zip(column_names, new_flight))
+            rejection = _check_reschedule_window(new_flight_dict["scheduled_departure"])
+            if rejection:
+                return rejection
+
+            async with conn.execute(
+                "SELECT flight_id FROM ticket_flights WHERE ticket_no = ?", (ticket_no,)
+            ) as cursor:
+                current_flight = await cursor.fetchone()
+            if not current_flight:
+                return "No existing ticket found for the given ticket number."
+
+            # 检查当前登录的用户是否拥有这张机票
+            async with conn.execute(
+                "SELECT * FROM tickets WHERE ticket_no = ? AND passenger_id = ?",
+                (ticket_no, passenger_id),
+            ) as cursor:
+                current_ticket = await cursor.fetchone()
+            if not current_ticket:
+                return f"Current signed-in passenger with ID {passenger_id} not the owner of ticket {ticket_no}"
+
+            await conn.execute(
+                "UPDATE ticket_flights SET flight_id = ? WHERE ticket_no = ?",
+                (new_flight_id, ticket_no),
+            )
+            await conn.commit()
+        UserInfoCache.invalidate(passenger_id)
+
+        return "Ticket successfully updated to new flight."
+
+    update_ticket_to_new_flight.coroutine = _aupdate_ticket_to_new_flight
+
     @tool
     def cancel_ticket(ticket_no: str, *, config: RunnableConfig) -> str:
         """取消用户的机票并从数据库中删除。
@@ -197,7 +317,7 @@ class FlightServiceTool:
         passenger_id = configuration.get("passenger_id", None)
         if not passenger_id:
             raise ValueError("No passenger ID configured.")
-        conn = sqlite3.connect(GlobalConfig.get_global_db())
+        conn = get_connection()
         cursor = conn.cursor()
 
         cursor.execute(
@@ -206,27 +326,56 @@ class FlightServiceTool:
         existing_ticket = cursor.fetchone()
         if not existing_ticket:
             cursor.close()
-            conn.close()
             return "No existing ticket found for the given ticket number."
 
         # 检查当前登录的用户是否拥有这张机票
         cursor.execute(
-            "SELECT flight_id FROM tickets WHERE ticket_no = ? AND passenger_id = ?",
+            "SELECT ticket_no FROM tickets WHERE ticket_no = ? AND passenger_id = ?",
             (ticket_no, passenger_id),
         )
         current_ticket = cursor.fetchone()
         if not current_ticket:
             cursor.close()
-            conn.close()
             return f"Current signed-in passenger with ID {passenger_id} not the owner of ticket {ticket_no}"
 
         cursor.execute("DELETE FROM ticket_flights WHERE ticket_no = ?", (ticket_no,))
         conn.commit()
+        UserInfoCache.invalidate(passenger_id)
 
         cursor.close()
-        conn.close()
         return "Ticket successfully cancelled."
 
+    async def _acancel_ticket(ticket_no: str, *, config: RunnableConfig) -> str:
+        configuration = config.get("configurable", {})
+        passenger_id = configuration.get("passenger_id", None)
+        if not passenger_id:
+            raise ValueError("No passenger ID configured.")
+
+        async with aconnection() as conn:
+            async with conn.execute(
+                "SELECT flight_id FROM ticket_flights WHERE ticket_no = ?", (ticket_no,)
+            ) as cursor:
+                existing_ticket = await cursor.fetchone()
+            if not existing_ticket:
+                return "No existing ticket found for the given ticket number."
+
+            # 检查当前登录的用户是否拥有这张机票
+            async with conn.execute(
+                "SELECT ticket_no FROM tickets WHERE ticket_no = ? AND passenger_id = ?",
+                (ticket_no, passenger_id),
+            ) as cursor:
+                current_ticket = await cursor.fetchone()
+            if not current_ticket:
+                return f"Current signed-in passenger with ID {passenger_id} not the owner of ticket {ticket_no}"
+
+            await conn.execute("DELETE FROM ticket_flights WHERE ticket_no = ?", (ticket_no,))
+            await conn.commit()
+        UserInfoCache.invalidate(passenger_id)
+
+        return "Ticket successfully cancelled."
+
+    cancel_ticket.coroutine = _acancel_ticket
+
 # from flight_service_tool import FlightServiceTool
 # from langchain_core.runnables import RunnableConfig
 
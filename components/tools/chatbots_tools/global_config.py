@@ -1,8 +1,11 @@
+from contextvars import ContextVar, Token
 from typing import Optional
 
 class GlobalConfig:
     global_db = None
     global_retriever = None
+    # 当前上下文绑定的会话数据库，优先于 global_db；线程池和异步任务会继承该值
+    session_db = ContextVar("session_db", default=None)
 
     @staticmethod
     def set_global_db(db_path: str):
@@ -11,8 +14,18 @@ class GlobalConfig:
 
     @staticmethod
     def get_global_db() -> Optional[str]:
-        """获取全局数据库路径"""
-        return GlobalConfig.global_db
+        """获取当前使用的数据库路径，优先返回当前上下文绑定的会话数据库"""
+        return GlobalConfig.session_db.get() or GlobalConfig.global_db
+
+    @staticmethod
+    def set_session_db(db_path: Optional[str]) -> Token:
+        """在当前上下文中绑定会话数据库，返回用于恢复的 token"""
+        return GlobalConfig.session_db.set(db_path)
+
+    @staticmethod
+    def reset_session_db(token: Token):
+        """恢复 set_session_db 之前的会话数据库"""
+        GlobalConfig.session_db.reset(token)
 
     @staticmethod
     def set_global_retriever(retriever):
@@ -2,8 +2,38 @@ import sqlite3
 from datetime import date, datetime
 from typing import Optional, Union
 from components.tools.chatbots_tools.global_config import GlobalConfig
+from components.tools.chatbots_tools.connection_manager import aconnection, get_connection
+from components.tools.chatbots_tools.result_paging import ResultBudget, page_results, paged_query, projection
+from components.tools.chatbots_tools.search_index import is_missing_index_error, search_query
 from langchain_core.tools import tool
 
+
+def _search_hotels_like_query(
+    location: Optional[str], name: Optional[str], columns: Optional[tuple] = None
+) -> tuple[str, list]:
+    """构造基于 LIKE 的酒店搜索语句，数据库没有全文索引时使用"""
+    select = ", ".join(columns) if columns else "*"
+    query = f"SELECT {select} FROM hotels WHERE 1=1"
+    params = []
+
+    if location:
+        query += " AND location LIKE ?"
+        params.append(f"%{location}%")
+    if name:
+        query += " AND name LIKE ?"
+        params.append(f"%{name}%")
+    # 为了本教程的目的，我们允许匹配任何日期和价格等级。
+    query += " ORDER BY id"
+    return query, params
+
+
+def _search_hotels_query(
+    location: Optional[str], name: Optional[str], columns: Optional[tuple] = None
+) -> tuple[str, list]:
+    """构造酒店全文检索语句，按相关度排序，同步和异步工具共用"""
+    return search_query("hotels", {"location": location, "name": name}, columns=columns)
+
+
 class HotelServiceTool:
     def __init__(self, db_path: str):
         GlobalConfig.set_global_db(db_path)
@@ -15,7 +45,10 @@ class HotelServiceTool:
         price_tier: Optional[str] = None,
         checkin_date: Optional[Union[datetime, date]] = None,
         checkout_date: Optional[Union[datetime, date]] = None,
-    ) -> list[dict]:
+        fields: Optional[list[str]] = None,
+        limit: int = 10,
+        offset: int = 0,
+    ) -> dict:
         """
         根据位置、名称、价格等级、入住日期和退房日期搜索酒店。
 
@@ -25,30 +58,62 @@ class HotelServiceTool:
             price_tier (Optional[str]): 酒店的价格等级。默认为 None。示例：Midscale, Upper Midscale, Upscale, Luxury
             checkin_date (Optional[Union[datetime, date]]): 酒店的入住日期。默认为 None。
             checkout_date (Optional[Union[datetime, date]]): 酒店的退房日期。默认为 None。
+            fields (Optional[list[str]]): 要返回的字段。默认为 id, name, location, price_tier, booked；可选 checkin_date, checkout_date。
+            limit (int): 本次返回结果的最大数量。默认为 10。
+            offset (int): 跳过的结果数量，查看更多结果时传入上次返回的 next_offset。默认为 0。
 
         Returns:
-            list[dict]: 匹配搜索条件的酒店字典列表。
+            dict: results 为匹配搜索条件的酒店字典列表；more_results 为 True 时还有更多结果，可用 next_offset 继续查询。
         """
-        conn = sqlite3.connect(GlobalConfig.get_global_db())
+        columns = projection("hotels", fields)
+        limit = ResultBudget.page_size(limit)
+        conn = get_connection()
         cursor = conn.cursor()
 
-        query = "SELECT * FROM hotels WHERE 1=1"
-        params = []
-
-        if location:
-            query += " AND location LIKE ?"
-            params.append(f"%{location}%")
-        if name:
-            query += " AND name LIKE ?"
-            params.append(f"%{name}%")
-        # 为了本教程的目的，我们允许匹配任何日期和价格等级。
-        cursor.execute(query, params)
+        try:
+            cursor.execute(*paged_query(*_search_hotels_query(location, name, columns), limit, offset))
+        except sqlite3.OperationalError as e:
+            if not is_missing_index_error(e):
+                raise
+            # 数据库尚未建立全文索引（未经 DatabaseUpdaterTool 准备），退回 LIKE 匹配
+            cursor.execute(*paged_query(*_search_hotels_like_query(location, name, columns), limit, offset))
         results = cursor.fetchall()
         column_names = [column[0] for column in cursor.description]
 
-        conn.close()
+        cursor.close()
+
+        return page_results(column_names, results, limit, offset)
+
+    async def _asearch_hotels(
+        location: Optional[str] = None,
+        name: Optional[str] = None,
+        price_tier: Optional[str] = None,
+        checkin_date: Optional[Union[datetime, date]] = None,
+        checkout_date: Optional[Union[datetime, date]] = None,
+        fields: Optional[list[str]] = None,
+        limit: int = 10,
+        offset: int = 0,
+    ) -> dict:
+        columns = projection("hotels", fields)
+        limit = ResultBudget.page_size(limit)
+        async with aconnection() as conn:
+            try:
+                cursor = await conn.execute(
+                    *paged_query(*_search_hotels_query(location, name, columns), limit, offset)
+                )
+            except sqlite3.OperationalError as e:
+                if not is_missing_index_error(e):
+                    raise
+                cursor = await conn.execute(
+                    *paged_query(*_search_hotels_like_query(location, name, columns), limit, offset)
+                )
+            results = await cursor.fetchall()
+            column_names = [column[0] for column in cursor.description]
+            await cursor.close()
+
+        return page_results(column_names, results, limit, offset)
 
-        return [dict(zip(column_names, row)) for row in results]
+    search_hotels.coroutine = _asearch_hotels
 
     @tool
     def book_hotel(hotel_id: int) -> str:
@@ -61,19 +126,33 @@ class HotelServiceTool:
         Returns:
             str: 指示酒店是否成功预订的消息。
         """
-        conn = sqlite3.connect(GlobalConfig.get_global_db())
+        conn = get_connection()
         cursor = conn.cursor()
 
         cursor.execute("UPDATE hotels SET booked = 1 WHERE id = ?", (hotel_id,))
         conn.commit()
 
         if cursor.rowcount > 0:
-            conn.close()
+            cursor.close()
+            return f"Hotel {hotel_id} successfully booked."
+        else:
+            cursor.close()
+            return f"No hotel found with ID {hotel_id}."
+
+    async def _abook_hotel(hotel_id: int) -> str:
+        async with aconnection() as conn:
+            cursor = await conn.execute("UPDATE hotels SET booked = 1 WHERE id = ?", (hotel_id,))
+            await conn.commit()
+            rowcount = cursor.rowcount
+            await cursor.close()
+
+        if rowcount > 0:
             return f"Hotel {hotel_id} successfully booked."
         else:
-            conn.close()
             return f"No hotel found with ID {hotel_id}."
 
+    book_hotel.coroutine = _abook_hotel
+
     @tool
     def update_hotel(
         hotel_id: int,
@@ -91,7 +170,7 @@ class HotelServiceTool:
         Returns:
             str: 指示酒店是否成功更新的消息。
         """
-        conn = sqlite3.connect(GlobalConfig.get_global_db())
+        conn = get_connection()
         cursor = conn.cursor()
 
         if checkin_date:
@@ -107,12 +186,41 @@ class HotelServiceTool:
         conn.commit()
 
         if cursor.rowcount > 0:
-            conn.close()
+            cursor.close()
+            return f"Hotel {hotel_id} successfully updated."
+        else:
+            cursor.close()
+            return f"No hotel found with ID {hotel_id}."
+
+    async def _aupdate_hotel(
+        hotel_id: int,
+        checkin_date: Optional[Union[datetime, date]] = None,
+        checkout_date: Optional[Union[datetime, date]] = None,
+    ) -> str:
+        rowcount = 0
+        async with aconnection() as conn:
+            if checkin_date:
+                cursor = await conn.execute(
+                    "UPDATE hotels SET checkin_date = ? WHERE id = ?", (checkin_date, hotel_id)
+                )
+                rowcount = cursor.rowcount
+                await cursor.close()
+            if checkout_date:
+                cursor = await conn.execute(
+                    "UPDATE hotels SET checkout_date = ? WHERE id = ?",
+                    (checkout_date, hotel_id),
+                )
+                rowcount = cursor.rowcount
+                await cursor.close()
+            await conn.commit()
+
+        if rowcount > 0:
             return f"Hotel {hotel_id} successfully updated."
         else:
-            conn.close()
             return f"No hotel found with ID {hotel_id}."
 
+    update_hotel.coroutine = _aupdate_hotel
+
     @tool
     def cancel_hotel(hotel_id: int) -> str:
         """
@@ -124,19 +232,33 @@ class HotelServiceTool:
         Returns:
             str: 指示酒店是否成功取消的消息。
         """
-        conn = sqlite3.connect(GlobalConfig.get_global_db())
+        conn = get_connection()
         cursor = conn.cursor()
 
         cursor.execute("UPDATE hotels SET booked = 0 WHERE id = ?", (hotel_id,))
         conn.commit()
 
         if cursor.rowcount > 0:
-            conn.close()
+            cursor.close()
             return f"Hotel {hotel_id} successfully cancelled."
         else:
-            conn.close()
+            cursor.close()
             return f"No hotel found with ID {hotel_id}."
 
+    async def _acancel_hotel(hotel_id: int) -> str:
+        async with aconnection() as conn:
+            cursor = await conn.execute("UPDATE hotels SET booked = 0 WHERE id = ?", (hotel_id,))
+            await conn.commit()
+            rowcount = cursor.rowcount
+            await cursor.close()
+
+        if rowcount > 0:
+            return f"Hotel {hotel_id} successfully cancelled."
+        else:
+            return f"No hotel found with ID {hotel_id}."
+
+    cancel_hotel.coroutine = _acancel_hotel
+
 # from hotel_service_tool import HotelServiceTool
 
 # # 初始化工具类，提供您的SQLite数据库路径
@@ -4,6 +4,7 @@ from components.tools.chatbots_tools.database_updater_tool import DatabaseUpdate
 from components.tools.chatbots_tools.flight_service_tool import FlightServiceTool
 from components.tools.chatbots_tools.hotel_service_tool import HotelServiceTool
 from components.tools.chatbots_tools.car_rental_service_tool import CarRentalServiceTool
+from components.tools.chatbots_tools.snapshot_manager import SnapshotManager
 from langchain_core.messages import ToolMessage
 from langchain_core.runnables import RunnableLambda
 from langgraph.prebuilt import ToolNode
@@ -45,10 +46,17 @@ def _print_event(event: dict, _printed: set, max_length=1500):
             print(msg_repr)
             _printed.add(message.id)
 
-def init_and_get_tools(init_db=True):
-    policy_tool = PolicyLookupTool()
-    db_tool = DatabaseUpdaterTool()
-    db = db_tool.update_dates(init_db=init_db)
+def init_and_get_tools(init_db=True, offline=False):
+    # offline=True 时不访问网络：使用示例数据库、内置 FAQ 和本地嵌入
+    policy_tool = PolicyLookupTool(offline=offline)
+    db_tool = DatabaseUpdaterTool(offline=offline)
+    # 日期平移后的模板每个进程只准备一次，会话快照和共享数据库都从模板复制；
+    # 共享数据库只在进程内第一次（或模板重新准备后）覆盖，不影响正在使用它的其他会话
+    SnapshotManager.prepare_template(db_tool)
+    if init_db:
+        db = SnapshotManager.restore_shared(db_tool.local_file)
+    else:
+        db = db_tool.update_dates(init_db=False)
     trip_tool = TripRecommendationTool(db)
     flight_tool = FlightServiceTool(db)
     hotel_tool = HotelServiceTool(db)
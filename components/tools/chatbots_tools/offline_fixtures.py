@@ -0,0 +1,221 @@
+import os
+import random
+import sqlite3
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+# 示例数据中的乘客，与 web demo 使用的 passenger_id 一致
+FIXTURE_PASSENGER_ID = "3442 587242"
+
+# 已起飞航班中最晚的实际起飞时间；update_dates 会把它平移到当前时间，之后的航班都在未来
+_REFERENCE_TIME = datetime(2024, 4, 30, 12, 0, tzinfo=timezone(timedelta(hours=-4)))
+_PAST_DAYS = 10
+_FUTURE_DAYS = 14
+
+AIRPORTS = ("BSL", "ZRH", "GVA", "CDG", "LHR", "FRA", "AMS", "MUC")
+CITIES = ("Basel", "Zurich", "Geneva", "Lucerne", "Bern")
+
+_HOTEL_BRANDS = (
+    ("Hilton", "Luxury"),
+    ("Hyatt Regency", "Upper Upscale"),
+    ("Marriott", "Upscale"),
+    ("Radisson Blu", "Upscale"),
+    ("Best Western", "Upper Midscale"),
+    ("Holiday Inn", "Midscale"),
+    ("ibis", "Economy"),
+)
+
+_CAR_RENTAL_COMPANIES = (
+    ("Sixt", "Luxury"),
+    ("Hertz", "Premium"),
+    ("Avis", "Midsize"),
+    ("Europcar", "Midsize"),
+    ("Enterprise", "Economy"),
+    ("Budget", "Economy"),
+)
+
+_TRIPS = (
+    ("Basel Minster", "Basel", "landmark, history", "Explore the gothic cathedral and the view over the Rhine."),
+    ("Kunstmuseum Basel", "Basel", "art, museum", "One of the oldest public art collections in the world."),
+    ("Rhine Swim", "Basel", "river, summer, swimming", "Float down the Rhine with a waterproof Wickelfisch bag."),
+    ("Zurich Old Town Walk", "Zurich", "history, walking, architecture", "Guided walk through the Niederdorf and Lindenhof."),
+    ("Lake Zurich Cruise", "Zurich", "lake, boat, scenic", "A relaxing cruise with views of the Alps."),
+    ("Uetliberg Hike", "Zurich", "hiking, nature, views", "Short hike to the top of Zurich's local mountain."),
+    ("Jet d'Eau and Lakeside", "Geneva", "lake, landmark", "Walk along Lake Geneva to the famous water fountain."),
+    ("CERN Visitor Centre", "Geneva", "science, museum", "Exhibitions about particle physics and the LHC."),
+    ("Chapel Bridge", "Lucerne", "landmark, history, bridge", "The medieval covered wooden bridge across the Reuss."),
+    ("Mount Pilatus Excursion", "Lucerne", "mountains, cable car, scenic", "Cogwheel railway up and cable car down."),
+    ("Swiss Museum of Transport", "Lucerne", "museum, family", "Trains, planes and a planetarium by the lake."),
+    ("Bern Old Town", "Bern", "history, unesco, walking", "Arcades, fountains and the Zytglogge clock tower."),
+    ("Bear Park", "Bern", "family, nature", "Visit the bears on the banks of the Aare."),
+)
+
+FAQ_TEXT = """## Invoice Questions
+### My name is missing on my Swiss Air invoice.
+The invoice lists the person who made the booking. Contact customer service for a corrected invoice.
+## Booking and Cancellation
+### How can I change my booking?
+Tickets can be rebooked online up to 3 hours before departure. A change fee applies depending on the fare.
+### Can I cancel my ticket and get a refund?
+Refunds are issued for refundable fares. Non-refundable tickets only return taxes and fees.
+## Baggage
+### How much checked baggage is included?
+Economy Light includes no checked bag. Economy Classic includes one bag up to 23 kg.
+### Can I bring sports equipment such as skis?
+Ski equipment travels free of charge as part of the baggage allowance.
+## Travel Documents
+### Do I need a passport for flights within the Schengen area?
+A valid national identity card is sufficient for Schengen destinations.
+## Pets
+### Can I travel with my dog?
+Small dogs and cats up to 8 kg may travel in the cabin in an approved carrier.
+## Payment
+### Which payment methods are accepted?
+Credit cards, PayPal and bank transfer for bookings made more than 7 days before departure.
+"""
+
+
+def _timestamp(value: datetime) -> str:
+    return value.isoformat(" ", timespec="microseconds")
+
+
+def _flights(rng: random.Random) -> list[tuple]:
+    rows = []
+    routes = [(a, b) for a in AIRPORTS for b in AIRPORTS if a != b]
+    day_zero = _REFERENCE_TIME.replace(hour=0)
+    for day in range(-_PAST_DAYS, _FUTURE_DAYS):
+        for departure_airport, arrival_airport in routes:
+            flight_id = len(rows) + 1
+            departure = day_zero + timedelta(days=day, hours=6 + rng.randrange(16), minutes=5 * rng.randrange(12))
+            arrival = departure + timedelta(minutes=45 + 5 * rng.randrange(18))
+            departed = departure <= _REFERENCE_TIME
+            rows.append((
+                flight_id,
+                f"LX{flight_id:04d}",
+                _timestamp(departure),
+                _timestamp(arrival),
+                departure_airport,
+                arrival_airport,
+                "Arrived" if departed else "Scheduled",
+                rng.choice(("319", "320", "321", "CR2")),
+                _timestamp(departure) if departed else "\\N",
+                _timestamp(arrival) if departed else "\\N",
+            ))
+    # 保证最晚的实际起飞时间正好是参照时间
+    rows.append((
+        len(rows) + 1, f"LX{len(rows) + 1:04d}", _timestamp(_REFERENCE_TIME),
+        _timestamp(_REFERENCE_TIME + timedelta(hours=1)), "ZRH", "BSL", "Arrived", "319",
+        _timestamp(_REFERENCE_TIME), _timestamp(_REFERENCE_TIME + timedelta(hours=1)),
+    ))
+    return rows
+
+
+def _bookings(rng: random.Random, flights: list[tuple], passengers: int) -> tuple[list, list, list, list]:
+    """为 FIXTURE_PASSENGER_ID 和若干随机乘客生成订单、机票、航段和登机牌"""
+    future = [row for row in flights if row[6] == "Scheduled"]
+    bookings, tickets, ticket_flights, boarding_passes = [], [], [], []
+    for index in range(passengers + 1):
+        if index == 0:
+            passenger_id = FIXTURE_PASSENGER_ID
+            # 示例乘客持有一张一天后从巴黎飞往巴塞尔的机票
+            flight = next(row for row in future if row[4] == "CDG" and row[5] == "BSL")
+        else:
+            passenger_id = f"{rng.randrange(1000, 10000)} {rng.randrange(100000, 1000000)}"
+            flight = rng.choice(flights)
+        book_ref = f"{index:06X}"
+        ticket_no = f"{7240005432906569 + index}"
+        fare = rng.choice(("Economy", "Economy", "Comfort", "Business"))
+        amount = {"Economy": 250, "Comfort": 480, "Business": 1100}[fare] + rng.randrange(100)
+        book_date = datetime.fromisoformat(flight[2]) - timedelta(days=1 + rng.randrange(30))
+        bookings.append((book_ref, _timestamp(book_date.astimezone(timezone.utc)), amount))
+        tickets.append((ticket_no, book_ref, passenger_id))
+        ticket_flights.append((ticket_no, flight[0], fare, amount))
+        boarding_passes.append((ticket_no, flight[0], 1 + rng.randrange(150), f"{1 + rng.randrange(30)}{rng.choice('ABCDEF')}"))
+    return bookings, tickets, ticket_flights, boarding_passes
+
+
+def _stays() -> tuple[list, list, list]:
+    start = _REFERENCE_TIME.date()
+    checkin, checkout = str(start + timedelta(days=2)), str(start + timedelta(days=5))
+    hotels = [
+        (index + 1, f"{brand} {city}", city, tier, checkin, checkout, 0)
+        for index, ((brand, tier), city) in enumerate(
+            (brand, city) for city in CITIES for brand in _HOTEL_BRANDS
+        )
+    ]
+    car_rentals = [
+        (index + 1, company, city, tier, checkin, checkout, 0)
+        for index, ((company, tier), city) in enumerate(
+            (company, city) for city in CITIES for company in _CAR_RENTAL_COMPANIES
+        )
+    ]
+    trips = [(index + 1, *trip, 0) for index, trip in enumerate(_TRIPS)]
+    return hotels, car_rentals, trips
+
+
+def build_fixture_db(path: str, passengers: int = 200, seed: int = 0) -> str:
+    """生成与 travel2.sqlite 表结构相同的小型示例数据库（覆盖已有文件），供离线运行使用"""
+    rng = random.Random(seed)
+    if os.path.exists(path):
+        os.remove(path)
+    flights = _flights(rng)
+    bookings, tickets, ticket_flights, boarding_passes = _bookings(rng, flights, passengers)
+    hotels, car_rentals, trips = _stays()
+
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.execute(
+            "CREATE TABLE flights (flight_id INTEGER, flight_no TEXT, scheduled_departure TEXT,"
+            " scheduled_arrival TEXT, departure_airport TEXT, arrival_airport TEXT, status TEXT,"
+            " aircraft_code TEXT, actual_departure TEXT, actual_arrival TEXT)"
+        )
+        conn.execute("CREATE TABLE bookings (book_ref TEXT, book_date TEXT, total_amount INTEGER)")
+        conn.execute("CREATE TABLE tickets (ticket_no TEXT, book_ref TEXT, passenger_id TEXT)")
+        conn.execute(
+            "CREATE TABLE ticket_flights (ticket_no TEXT, flight_id INTEGER, fare_conditions TEXT, amount INTEGER)"
+        )
+        conn.execute(
+            "CREATE TABLE boarding_passes (ticket_no TEXT, flight_id INTEGER, boarding_no INTEGER, seat_no TEXT)"
+        )
+        conn.execute(
+            "CREATE TABLE hotels (id INTEGER, name TEXT, location TEXT, price_tier TEXT,"
+            " checkin_date TEXT, checkout_date TEXT, booked INTEGER)"
+        )
+        conn.execute(
+            "CREATE TABLE car_rentals (id INTEGER, name TEXT, location TEXT, price_tier TEXT,"
+            " start_date TEXT, end_date TEXT, booked INTEGER)"
+        )
+        conn.execute(
+            "CREATE TABLE trip_recommendations (id INTEGER, name TEXT, location TEXT, keywords TEXT,"
+            " details TEXT, booked INTEGER)"
+        )
+        conn.executemany("INSERT INTO flights VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", flights)
+        conn.executemany("INSERT INTO bookings VALUES (?, ?, ?)", bookings)
+        conn.executemany("INSERT INTO tickets VALUES (?, ?, ?)", tickets)
+        conn.executemany("INSERT INTO ticket_flights VALUES (?, ?, ?, ?)", ticket_flights)
+        conn.executemany("INSERT INTO boarding_passes VALUES (?, ?, ?, ?)", boarding_passes)
+        conn.executemany("INSERT INTO hotels VALUES (?, ?, ?, ?, ?, ?, ?)", hotels)
+        conn.executemany("INSERT INTO car_rentals VALUES (?, ?, ?, ?, ?, ?, ?)", car_rentals)
+        conn.executemany("INSERT INTO trip_recommendations VALUES (?, ?, ?, ?, ?, ?)", trips)
+    conn.close()
+    return path
+
+
+class OfflineExa:
+    """exa_py.Exa 的本地替身：search_and_contents 按查询返回固定格式的结果，不访问网络"""
+
+    def __init__(self, api_key: Optional[str] = None):
+        self.api_key = api_key
+
+    def search_and_contents(self, query: str, num_results: int = 1, **kwargs) -> dict:
+        query = " ".join(query.split())
+        results = [
+            {
+                "title": f"Travel notes: {query}" + (f" ({index + 1})" if index else ""),
+                "url": f"https://example.com/offline/{index + 1}",
+                "text": f"Offline search result for '{query}'. No live web content is available in offline mode.",
+                "highlights": [query],
+            }
+            for index in range(max(1, num_results))
+        ]
+        return {"results": results, "autoprompt_string": query}
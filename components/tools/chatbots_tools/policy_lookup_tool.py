@@ -1,57 +1,152 @@
+import os
 import re
+import threading
+from typing import Optional
 import numpy as np
+from cachetools import TTLCache
 from langchain_core.tools import tool
 import config as cfg
-from azure.ai.inference import EmbeddingsClient
-from azure.core.credentials import AzureKeyCredential
 import requests
+from components.tools.chatbots_tools.ann_index import IVFIndex, exact_search, normalize_rows
+from components.tools.chatbots_tools.embedding_providers import (
+    AzureEmbeddingProvider,
+    EmbeddingProvider,
+    get_embedding_provider,
+)
+from components.tools.chatbots_tools.embedding_store import EmbeddingStore
 from components.tools.chatbots_tools.global_config import GlobalConfig
+from components.tools.chatbots_tools.offline_fixtures import FAQ_TEXT
 
 class VectorStoreRetriever:
-    def __init__(self, docs: list, vectors: list, oai_client):
-        self._arr = np.array(vectors)
+    # 文档数达到该值时 from_docs 自动建立 IVF 近似最近邻索引
+    ann_min_docs = 2000
+
+    def __init__(self, docs: list, vectors: list, embedder, cache_size: int = 256, cache_ttl: float = 3600):
+        # 归一化的 float32 矩阵：内存减半，点积即余弦相似度
+        self._arr = normalize_rows(vectors)
         self._docs = docs
-        self._client = oai_client
+        self._index = None
+        if not isinstance(embedder, EmbeddingProvider):
+            # 兼容直接传入 EmbeddingsClient 的旧用法
+            embedder = AzureEmbeddingProvider(embedder)
+        self._embedder = embedder
+        # 智能体会反复询问相同的问题：缓存查询向量和 top-k 结果（LRU 淘汰 + 过期时间）
+        self._embedding_cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        self._result_cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        self._cache_lock = threading.Lock()
 
     @classmethod
-    def from_docs(cls, docs, oai_client):
-        embeddings = oai_client.embed(
-            model=cfg.EMBEDDING_DEPLOYMENT_NAME,
-            input=[doc["page_content"] for doc in docs],
-        )
-        vectors = [emb.embedding for emb in embeddings.data]
-        return cls(docs, vectors, oai_client)
+    def from_docs(cls, docs, embedder, store: Optional[EmbeddingStore] = None, index_path: Optional[str] = None):
+        if not isinstance(embedder, EmbeddingProvider):
+            embedder = AzureEmbeddingProvider(embedder)
+        texts = [doc["page_content"] for doc in docs]
+        embedder.fit(texts)
+        if store is None or embedder.cache_key is None:
+            vectors = embedder.embed_documents(texts)
+        else:
+            # 只为缓存中没有的文本块调用嵌入接口
+            vectors = store.embed(embedder.cache_key, texts, embedder.embed_documents)
+        retriever = cls(docs, vectors, embedder)
+        if len(docs) >= cls.ann_min_docs:
+            retriever.build_index(index_path)
+        return retriever
+
+    def build_index(self, path: Optional[str] = None, **kwargs) -> IVFIndex:
+        """启用 IVF 索引：path 处的索引与当前向量一致时直接加载，否则重新训练并保存"""
+        index = IVFIndex.load(path, self._arr) if path else None
+        if index is None:
+            index = IVFIndex.build(self._arr, **kwargs)
+            if path:
+                index.save(path)
+        with self._cache_lock:
+            self._index = index
+            self._result_cache.clear()
+        return index
 
     def query(self, query: str, k: int = 5) -> list:
-        embed = self._client.embed(
-            model=cfg.EMBEDDING_DEPLOYMENT_NAME, input=[query]
-        )
-        scores = np.array(embed.data[0].embedding) @ self._arr.T
-        top_k_idx = np.argpartition(scores, -k)[-k:]
-        top_k_idx_sorted = top_k_idx[np.argsort(-scores[top_k_idx])]
-        return [
-            {**self._docs[idx], "similarity": scores[idx]} for idx in top_k_idx_sorted
-        ]
+        return self.query_many([query], k)[0]
+
+    def query_many(self, queries: list[str], k: int = 5) -> list[list]:
+        """批量检索：未缓存的查询一次性嵌入，再用一次矩阵乘法（或 IVF 索引）为所有查询打分"""
+        keys = [" ".join(query.split()) for query in queries]
+        results = {}
+        vectors = {}
+        with self._cache_lock:
+            for key in keys:
+                hit = self._result_cache.get((key, k))
+                if hit is not None:
+                    results[key] = hit
+                elif key in self._embedding_cache:
+                    vectors[key] = self._embedding_cache[key]
+
+        pending = [key for key in dict.fromkeys(keys) if key not in results]
+        to_embed = [key for key in pending if key not in vectors]
+        if to_embed:
+            embedded = normalize_rows(self._embedder.embed_documents(to_embed))
+            for key, vector in zip(to_embed, embedded):
+                vectors[key] = vector
+
+        if pending:
+            query_matrix = np.vstack([vectors[key] for key in pending])
+            if self._index is not None:
+                top_ids, top_scores = self._index.search(self._arr, query_matrix, k)
+            else:
+                top_ids, top_scores = exact_search(self._arr, query_matrix, k)
+            for key, ids, scores in zip(pending, top_ids, top_scores):
+                results[key] = [
+                    {**self._docs[i], "similarity": score} for i, score in zip(ids, scores)
+                ]
+            with self._cache_lock:
+                for key in pending:
+                    self._embedding_cache[key] = vectors[key]
+                    self._result_cache[(key, k)] = results[key]
+
+        # 返回副本，调用方修改结果不会污染缓存
+        return [[dict(doc) for doc in results[key]] for key in keys]
 
 class PolicyLookupTool:
-    def __init__(self):
-        # Initialize the Azure Embeddings Client
-        self.client = EmbeddingsClient(
-            endpoint=cfg.EMBEDDING_ENDPOINT_URL,
-            credential=AzureKeyCredential(cfg.AZURE_OPENAI_API_KEY),
-            api_version=cfg.EMBEDDING_API_VERSION,
-        )
+    def __init__(self, faq_url=None, faq_file=None, embedding_cache=None, overwrite=False, embedder=None,
+                 index_file=None, offline=False):
+        self.faq_url = faq_url or "https://storage.googleapis.com/benchmarks-artifacts/travel-db/swiss_faq.md"
+        self.faq_file = faq_file or "swiss_faq.md"
+        self.embedding_cache = embedding_cache or "swiss_faq.embeddings.sqlite"
+        self.index_file = index_file or "swiss_faq.ivf.npz"
+        self.overwrite = overwrite
+        # Offline runs use the bundled FAQ text instead of downloading it
+        self.offline = offline
+
+        # Embedding backend: an EmbeddingProvider instance, a provider name, or
+        # config.EMBEDDING_PROVIDER ("azure" by default, "local" for the offline embedder);
+        # offline runs always default to the local embedder
+        if embedder is None:
+            embedder = "local" if offline else getattr(cfg, "EMBEDDING_PROVIDER", "azure")
+        if isinstance(embedder, str):
+            embedder = get_embedding_provider(embedder)
+        self.embedder = embedder
 
         # Fetch and process the FAQ document
-        response = requests.get(
-            "https://storage.googleapis.com/benchmarks-artifacts/travel-db/swiss_faq.md"
-        )
-        response.raise_for_status()
-        faq_text = response.text
+        faq_text = self._load_faq()
         docs = [{"page_content": txt} for txt in re.split(r"(?=\n##)", faq_text)]
 
-        # Create a retriever instance
-        GlobalConfig.set_global_retriever(VectorStoreRetriever.from_docs(docs, self.client))
+        # Create a retriever instance; chunk embeddings are cached on disk by content hash
+        store = EmbeddingStore(self.embedding_cache)
+        GlobalConfig.set_global_retriever(VectorStoreRetriever.from_docs(
+            docs, self.embedder, store, index_path=self.index_file
+        ))
+
+    def _load_faq(self) -> str:
+        """读取本地 FAQ 文档，不存在或要求覆盖时重新下载（离线时写入内置的示例 FAQ）"""
+        if self.overwrite or not os.path.exists(self.faq_file):
+            if self.offline:
+                text = FAQ_TEXT
+            else:
+                response = requests.get(self.faq_url)
+                response.raise_for_status()
+                text = response.text
+            with open(self.faq_file, "w", encoding="utf-8") as f:
+                f.write(text)
+        with open(self.faq_file, encoding="utf-8") as f:
+            return f.read()
 
     @tool
     def lookup_policy(query: str) -> str:
@@ -0,0 +1,212 @@
+"""检查所有数据库工具发出的 SQL 是否都能走索引。
+
+在数据库的临时副本上用代表性参数实际调用每个工具，通过 trace callback
+收集执行过的语句，再逐条运行 EXPLAIN QUERY PLAN。出现全表扫描即视为失败。
+
+用法（在仓库根目录）：
+    python -m components.tools.chatbots_tools.query_plan_check travel2.sqlite
+"""
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+from components.tools.chatbots_tools import flight_service_tool
+from components.tools.chatbots_tools.car_rental_service_tool import CarRentalServiceTool
+from components.tools.chatbots_tools.connection_manager import ConnectionManager
+from components.tools.chatbots_tools.flight_service_tool import FlightServiceTool
+from components.tools.chatbots_tools.global_config import GlobalConfig
+from components.tools.chatbots_tools.hotel_service_tool import HotelServiceTool
+from components.tools.chatbots_tools.trip_recommendation_tool import TripRecommendationTool
+
+# 允许扫描的调用（_tool_calls 中的名称）。带条件的搜索都走索引或 FTS5；
+# 不带任何条件的搜索只能按表的顺序读取，但查询计划中没有排序（USE TEMP B-TREE），
+# 扫描在 LIMIT（分页时为 OFFSET + LIMIT）行后停止：航班按表顺序读取，其余按 id 索引顺序读取
+ALLOWED_FULL_SCANS = {
+    "search_flights[no filters]",
+    "search_hotels[no filters]",
+    "search_car_rentals[no filters]",
+    "search_trip_recommendations[no filters]",
+}
+
+_FULL_SCAN = re.compile(r"^SCAN (?!CONSTANT ROW)(?!.*VIRTUAL TABLE)")
+
+
+def _sample_arguments(conn: sqlite3.Connection) -> dict:
+    """从数据库中挑选真实存在的取值作为工具参数"""
+    cursor = conn.cursor()
+    passenger_id, ticket_no = cursor.execute(
+        "SELECT t.passenger_id, t.ticket_no FROM tickets t"
+        " JOIN ticket_flights tf ON tf.ticket_no = t.ticket_no LIMIT 1"
+    ).fetchone()
+    flight = cursor.execute(
+        "SELECT flight_id, departure_airport, arrival_airport, scheduled_departure"
+        " FROM flights LIMIT 1"
+    ).fetchone()
+    ids = {
+        table: cursor.execute(f"SELECT id, location, name FROM {table} LIMIT 1").fetchone()
+        for table in ("hotels", "car_rentals", "trip_recommendations")
+    }
+    cursor.close()
+    return {
+        "config": {"configurable": {"passenger_id": passenger_id}},
+        "ticket_no": ticket_no,
+        "flight": flight,
+        "ids": ids,
+    }
+
+
+def _tool_calls(args: dict) -> list:
+    """(名称, 无参调用) 列表，覆盖每个工具的所有分支查询（包括不带条件的搜索和分页）
+
+    名称为工具名，不带任何条件的搜索标记为 "工具名[no filters]"，以便单独列入 ALLOWED_FULL_SCANS。
+    """
+    config = args["config"]
+    flight_id, departure, arrival, scheduled = args["flight"]
+    hotel_id, hotel_location, hotel_name = args["ids"]["hotels"]
+    rental_id, rental_location, rental_name = args["ids"]["car_rentals"]
+    trip_id, trip_location, trip_name = args["ids"]["trip_recommendations"]
+    return [
+        ("fetch_user_flight_information",
+         lambda: FlightServiceTool.fetch_user_flight_information.func(config)),
+        ("search_flights",
+         lambda: FlightServiceTool.search_flights.func(departure, arrival, scheduled, scheduled)),
+        ("search_flights",
+         lambda: FlightServiceTool.search_flights.func(departure_airport=departure)),
+        ("search_flights",
+         lambda: FlightServiceTool.search_flights.func(arrival_airport=arrival)),
+        ("search_flights",
+         lambda: FlightServiceTool.search_flights.func(start_time=scheduled)),
+        ("search_flights[no filters]", lambda: FlightServiceTool.search_flights.func()),
+        ("update_ticket_to_new_flight",
+         lambda: FlightServiceTool.update_ticket_to_new_flight.func(
+             args["ticket_no"], flight_id, config=config)),
+        ("cancel_ticket",
+         lambda: FlightServiceTool.cancel_ticket.func(args["ticket_no"], config=config)),
+        ("search_hotels",
+         lambda: HotelServiceTool.search_hotels.func(hotel_location, hotel_name)),
+        ("search_hotels",
+         lambda: HotelServiceTool.search_hotels.func(hotel_location, limit=2, offset=2)),
+        ("search_hotels[no filters]", lambda: HotelServiceTool.search_hotels.func()),
+        ("search_hotels[no filters]",
+         lambda: HotelServiceTool.search_hotels.func(limit=5, offset=10)),
+        ("book_hotel", lambda: HotelServiceTool.book_hotel.func(hotel_id)),
+        ("update_hotel",
+         lambda: HotelServiceTool.update_hotel.func(hotel_id, scheduled, scheduled)),
+        ("cancel_hotel", lambda: HotelServiceTool.cancel_hotel.func(hotel_id)),
+        ("search_car_rentals",
+         lambda: CarRentalServiceTool.search_car_rentals.func(rental_location, rental_name)),
+        ("search_car_rentals",
+         lambda: CarRentalServiceTool.search_car_rentals.func(rental_location, limit=2, offset=2)),
+        ("search_car_rentals[no filters]", lambda: CarRentalServiceTool.search_car_rentals.func()),
+        ("search_car_rentals[no filters]",
+         lambda: CarRentalServiceTool.search_car_rentals.func(limit=5, offset=10)),
+        ("book_car_rental", lambda: CarRentalServiceTool.book_car_rental.func(rental_id)),
+        ("update_car_rental",
+         lambda: CarRentalServiceTool.update_car_rental.func(rental_id, scheduled, scheduled)),
+        ("cancel_car_rental", lambda: CarRentalServiceTool.cancel_car_rental.func(rental_id)),
+        ("search_trip_recommendations",
+         lambda: TripRecommendationTool.search_trip_recommendations.func(
+             trip_location, trip_name, "history, art")),
+        ("search_trip_recommendations",
+         lambda: TripRecommendationTool.search_trip_recommendations.func(
+             keywords="history, art", limit=2, offset=2)),
+        ("search_trip_recommendations[no filters]",
+         lambda: TripRecommendationTool.search_trip_recommendations.func()),
+        ("search_trip_recommendations[no filters]",
+         lambda: TripRecommendationTool.search_trip_recommendations.func(limit=5, offset=10)),
+        ("book_excursion", lambda: TripRecommendationTool.book_excursion.func(trip_id)),
+        ("update_excursion",
+         lambda: TripRecommendationTool.update_excursion.func(trip_id, "details")),
+        ("cancel_excursion", lambda: TripRecommendationTool.cancel_excursion.func(trip_id)),
+    ]
+
+
+def collect_query_plans(db_path: str) -> list[dict]:
+    """在数据库副本上执行所有工具，返回每条语句的查询计划"""
+    reports = []
+    previous_db = GlobalConfig.get_global_db()
+    # 检查的是查询计划而不是业务规则，跳过改签时间窗口限制以覆盖后续语句
+    check_window = flight_service_tool._check_reschedule_window
+    flight_service_tool._check_reschedule_window = lambda scheduled_departure: None
+
+    with tempfile.TemporaryDirectory() as tmp:
+        copy_path = os.path.join(tmp, "query_plan_check.sqlite")
+        source = sqlite3.connect(db_path)
+        target = sqlite3.connect(copy_path)
+        source.backup(target)
+        source.close()
+        target.close()
+
+        try:
+            GlobalConfig.set_global_db(copy_path)
+            conn = ConnectionManager.get_connection(copy_path)
+            args = _sample_arguments(conn)
+            explain = sqlite3.connect(copy_path)
+
+            for tool_name, call in _tool_calls(args):
+                statements = []
+                conn.set_trace_callback(statements.append)
+                try:
+                    call()
+                finally:
+                    conn.set_trace_callback(None)
+                for sql in statements:
+                    if not re.match(r"\s*(SELECT|UPDATE|DELETE|INSERT)", sql, re.IGNORECASE):
+                        continue
+                    # FTS5 等虚拟表内部发出的语句（形如 'main'.'hotels_fts_config'）不属于工具查询
+                    if "'main'." in sql:
+                        continue
+                    plan = [row[3] for row in explain.execute(f"EXPLAIN QUERY PLAN {sql}")]
+                    full_scans = [detail for detail in plan if _FULL_SCAN.match(detail)]
+                    reports.append(
+                        {
+                            "tool": tool_name,
+                            "sql": " ".join(sql.split()),
+                            "plan": plan,
+                            "full_scans": full_scans,
+                            "ok": not full_scans or tool_name in ALLOWED_FULL_SCANS,
+                        }
+                    )
+            explain.close()
+        finally:
+            flight_service_tool._check_reschedule_window = check_window
+            GlobalConfig.set_global_db(previous_db)
+            ConnectionManager.close_all(copy_path)
+
+    return reports
+
+
+def verify_query_plans(db_path: str) -> list[dict]:
+    """检查查询计划，存在未被允许的全表扫描时抛出 AssertionError"""
+    reports = collect_query_plans(db_path)
+    failures = [report for report in reports if not report["ok"]]
+    if failures:
+        details = "\n".join(
+            f"{report['tool']}: {report['sql']} -> {report['full_scans']}" for report in failures
+        )
+        raise AssertionError(f"Full table scans found in tool queries:\n{details}")
+    return reports
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    db_path = argv[0] if argv else "travel2.sqlite"
+    reports = collect_query_plans(db_path)
+    for report in reports:
+        if not report["ok"]:
+            status = "FAIL "
+        elif report["full_scans"]:
+            status = "ALLOW"
+        else:
+            status = "OK   "
+        print(f"[{status}] {report['tool']}: {report['sql']}")
+        for detail in report["plan"]:
+            print(f"        {detail}")
+    failures = sum(not report["ok"] for report in reports)
+    print(f"{len(reports)} statements checked, {failures} with full table scans.")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
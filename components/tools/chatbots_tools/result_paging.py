@@ -0,0 +1,112 @@
+import json
+from typing import Iterable, Optional, Union
+
+# 搜索工具可以返回的列
+SEARCH_COLUMNS = {
+    "hotels": ("id", "name", "location", "price_tier", "checkin_date", "checkout_date", "booked"),
+    "car_rentals": ("id", "name", "location", "price_tier", "start_date", "end_date", "booked"),
+    "trip_recommendations": ("id", "name", "location", "keywords", "details", "booked"),
+}
+
+# 未指定 fields 时返回的列；日期和详情等列按需通过 fields 请求
+DEFAULT_COLUMNS = {
+    "hotels": ("id", "name", "location", "price_tier", "booked"),
+    "car_rentals": ("id", "name", "location", "price_tier", "booked"),
+    "trip_recommendations": ("id", "name", "location", "keywords", "booked"),
+}
+
+# 按 4 字节一个 token 粗略换算 token 预算
+BYTES_PER_TOKEN = 4
+
+
+class ResultBudget:
+    """搜索工具单次返回的结果条数和大小上限。
+
+    工具结果会写入 ToolMessage，之后每一轮都随对话重新发给 LLM。
+    超出条数或大小预算时只返回前面的结果，并给出继续查询用的 next_offset。
+    """
+
+    default_limit = 10
+    max_limit = 50
+    max_bytes = 4096
+    max_tokens = None
+
+    @staticmethod
+    def configure(
+        default_limit: Optional[int] = None,
+        max_limit: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        max_tokens: Optional[int] = None,
+    ):
+        """调整默认条数、条数上限以及按字节或 token 计的大小预算"""
+        if default_limit is not None:
+            ResultBudget.default_limit = default_limit
+        if max_limit is not None:
+            ResultBudget.max_limit = max_limit
+        if max_bytes is not None:
+            ResultBudget.max_bytes = max_bytes
+        if max_tokens is not None:
+            ResultBudget.max_tokens = max_tokens
+
+    @staticmethod
+    def byte_budget() -> Optional[int]:
+        """生效的字节预算，同时设置了两种预算时取较小者；都未设置时返回 None"""
+        budgets = [ResultBudget.max_bytes]
+        if ResultBudget.max_tokens is not None:
+            budgets.append(ResultBudget.max_tokens * BYTES_PER_TOKEN)
+        budgets = [budget for budget in budgets if budget is not None]
+        return min(budgets) if budgets else None
+
+    @staticmethod
+    def page_size(limit: Optional[int]) -> int:
+        """把工具参数中的 limit 限制在 1 到 max_limit 之间"""
+        if limit is None:
+            limit = ResultBudget.default_limit
+        return max(1, min(int(limit), ResultBudget.max_limit))
+
+
+def projection(table: str, fields: Optional[Union[str, Iterable[str]]] = None) -> tuple[str, ...]:
+    """校验 fields 并返回要查询的列，未指定时返回默认列；id 总是包含在内"""
+    if not fields:
+        return DEFAULT_COLUMNS[table]
+    if isinstance(fields, str):
+        fields = fields.split(",")
+    requested = [field.strip() for field in fields if field.strip()]
+    unknown = [field for field in requested if field not in SEARCH_COLUMNS[table]]
+    if unknown:
+        raise ValueError(
+            f"Unknown fields {unknown} for {table}; available fields: {', '.join(SEARCH_COLUMNS[table])}"
+        )
+    # 保持表中列的顺序，id 用于后续预订
+    return tuple(
+        column for column in SEARCH_COLUMNS[table] if column == "id" or column in requested
+    )
+
+
+def paged_query(query: str, params: list, limit: int, offset: int) -> tuple[str, list]:
+    """追加 LIMIT/OFFSET，多取一行用于判断是否还有更多结果"""
+    return f"{query} LIMIT ? OFFSET ?", [*params, limit + 1, max(0, int(offset))]
+
+
+def page_results(column_names: list[str], rows: list, limit: int, offset: int) -> dict:
+    """把 paged_query 取回的行转换为工具结果。
+
+    结果依次累加，加入下一行会超出字节预算时停止（至少返回一行）。
+    还有更多结果时 more_results 为 True，并给出下一次调用使用的 next_offset。
+    """
+    offset = max(0, int(offset))
+    budget = ResultBudget.byte_budget()
+    results = []
+    used = 0
+    for row in rows[:limit]:
+        item = dict(zip(column_names, row))
+        size = len(json.dumps(item, ensure_ascii=False, default=str).encode("utf-8"))
+        if results and budget is not None and used + size > budget:
+            break
+        results.append(item)
+        used += size
+
+    page = {"results": results, "more_results": len(rows) > len(results)}
+    if page["more_results"]:
+        page["next_offset"] = offset + len(results)
+    return page
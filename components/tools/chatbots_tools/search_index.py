@@ -0,0 +1,126 @@
+import sqlite3
+from typing import Iterable, Optional
+
+# 需要全文检索的表及其被索引的文本列
+SEARCH_INDEXES = {
+    "hotels": ("name", "location"),
+    "car_rentals": ("name", "location"),
+    "trip_recommendations": ("name", "location", "keywords"),
+}
+
+
+def fts_table(table: str) -> str:
+    """返回表对应的 FTS5 影子表名"""
+    return f"{table}_fts"
+
+
+def ensure_search_indexes(conn: sqlite3.Connection, rebuild: bool = False):
+    """创建 FTS5 影子表和同步触发器。
+
+    影子表使用外部内容（content=表, content_rowid=id），不重复存储文本；
+    触发器在插入、删除和修改被索引列时同步更新索引。基础表被重建（例如
+    to_sql(if_exists="replace")）后触发器会随之丢失，此时重新创建触发器并重建索引。
+    """
+    cursor = conn.cursor()
+    tables = {
+        row[0] for row in cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
+    }
+    triggers = {
+        row[0] for row in cursor.execute("SELECT name FROM sqlite_master WHERE type='trigger'")
+    }
+
+    for table, columns in SEARCH_INDEXES.items():
+        if table not in tables:
+            continue
+        fts = fts_table(table)
+        column_list = ", ".join(columns)
+        new_values = ", ".join(f"new.{column}" for column in columns)
+        old_values = ", ".join(f"old.{column}" for column in columns)
+        needs_rebuild = rebuild or fts not in tables
+
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+            f"{column_list}, content='{table}', content_rowid='id',"
+            f" tokenize='unicode61 remove_diacritics 2')"
+        )
+        if f"{fts}_ai" not in triggers:
+            needs_rebuild = True
+            cursor.execute(
+                f"CREATE TRIGGER {fts}_ai AFTER INSERT ON {table} BEGIN"
+                f" INSERT INTO {fts}(rowid, {column_list}) VALUES (new.id, {new_values}); END"
+            )
+        if f"{fts}_ad" not in triggers:
+            needs_rebuild = True
+            cursor.execute(
+                f"CREATE TRIGGER {fts}_ad AFTER DELETE ON {table} BEGIN"
+                f" INSERT INTO {fts}({fts}, rowid, {column_list}) VALUES ('delete', old.id, {old_values}); END"
+            )
+        if f"{fts}_au" not in triggers:
+            needs_rebuild = True
+            cursor.execute(
+                f"CREATE TRIGGER {fts}_au AFTER UPDATE OF id, {column_list} ON {table} BEGIN"
+                f" INSERT INTO {fts}({fts}, rowid, {column_list}) VALUES ('delete', old.id, {old_values});"
+                f" INSERT INTO {fts}(rowid, {column_list}) VALUES (new.id, {new_values}); END"
+            )
+        if needs_rebuild:
+            cursor.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+    conn.commit()
+    cursor.close()
+
+
+def _phrase(text: str) -> Optional[str]:
+    """把用户输入转换为带前缀匹配的 FTS5 短语，空输入返回 None"""
+    text = text.strip()
+    if not text:
+        return None
+    return '"' + text.replace('"', '""') + '"*'
+
+
+def match_expression(
+    filters: dict[str, Optional[str]], any_of: Optional[dict[str, Iterable[str]]] = None
+) -> Optional[str]:
+    """构造 MATCH 表达式。
+
+    filters 中每一列都必须匹配对应短语；any_of 中每一列匹配任意一个短语即可。
+    没有任何条件时返回 None。
+    """
+    clauses = []
+    for column, value in filters.items():
+        phrase = _phrase(value) if value else None
+        if phrase:
+            clauses.append(f"{column} : {phrase}")
+    for column, values in (any_of or {}).items():
+        phrases = [phrase for phrase in (_phrase(value) for value in values) if phrase]
+        if phrases:
+            clauses.append(f"{column} : ({' OR '.join(phrases)})")
+    if not clauses:
+        return None
+    return " AND ".join(clauses)
+
+
+def search_query(
+    table: str,
+    filters: dict[str, Optional[str]],
+    any_of: Optional[dict[str, Iterable[str]]] = None,
+    columns: Optional[Iterable[str]] = None,
+) -> tuple[str, list]:
+    """构造按 bm25 相关度排序的全文检索语句；没有检索条件时返回整表查询。
+
+    columns 为要返回的列，默认返回全部列。结果按相关度和 id 排序，分页时顺序稳定。
+    """
+    select = ", ".join(f"{table}.{column}" for column in columns) if columns else f"{table}.*"
+    expression = match_expression(filters, any_of)
+    if expression is None:
+        return f"SELECT {select} FROM {table} ORDER BY {table}.id", []
+    fts = fts_table(table)
+    query = (
+        f"SELECT {select} FROM {fts} JOIN {table} ON {table}.id = {fts}.rowid"
+        f" WHERE {fts} MATCH ? ORDER BY bm25({fts}), {table}.id"
+    )
+    return query, [expression]
+
+
+def is_missing_index_error(error: sqlite3.OperationalError) -> bool:
+    """数据库尚未建立 FTS 影子表时抛出的错误"""
+    return "no such table" in str(error)
@@ -0,0 +1,290 @@
+import atexit
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Iterator, Optional
+from components.tools.chatbots_tools.connection_manager import ConnectionManager
+from components.tools.chatbots_tools.global_config import GlobalConfig
+
+logger = logging.getLogger(__name__)
+
+
+class _Snapshot:
+    """一个会话的数据库快照"""
+
+    def __init__(self, path: str, anchor: Optional[sqlite3.Connection] = None):
+        self.path = path
+        # 内存快照在最后一个连接关闭时即被销毁，需要一个常驻连接维持
+        self.anchor = anchor
+        self.last_used = time.monotonic()
+        # 正在 SnapshotManager.session() 中使用该快照的次数，大于 0 时不会被回收
+        self.active = 0
+        # 在使用期间被 release 时推迟到最后一次使用结束后再回收
+        self.release_pending = False
+        # 会话的旧快照已被自动回收，这是从模板重新创建的快照
+        self.recreated = False
+
+
+class SnapshotManager:
+    """按会话隔离的数据库快照。
+
+    日期平移后的模板库在进程内只准备一次（超过 `template_max_age` 秒后重新准备），
+    每个会话（通常以 thread_id 区分）第一次使用时通过 SQLite backup API 从模板复制出
+    独立的数据库，会话之间的预订和改签互不影响。快照按最近使用顺序最多保留
+    `max_sessions` 个，空闲超过 `idle_ttl` 秒或超出容量时被回收；正在 `session()` 中使用的快照
+    不会被回收（此时快照数可以暂时超过容量）。被自动回收的会话再次使用时会得到模板的新副本，
+    之前的预订和改签都已丢失：此时记录警告日志，`recreated()` 返回 True。
+
+    storage="file" 时快照为临时目录中的文件；storage="memory" 时为共享缓存的内存数据库，
+    复制更快，但共享缓存使用表级锁，适合同一会话内串行调用工具的场景。
+    """
+
+    storage = "file"
+    max_sessions = 32
+    idle_ttl = 3600
+    template_max_age = 6 * 3600
+
+    _lock = threading.RLock()
+    _db_tool = None
+    _template = None
+    _template_prepared_at = None
+    _directory = None
+    _snapshots = OrderedDict()
+    # 已用模板覆盖过的共享数据库：绝对路径 -> 所用模板的准备时间
+    _restored = {}
+    # 最近被自动回收的会话，用于发现快照被重新创建的会话
+    _evicted = OrderedDict()
+    max_evicted_ids = 1024
+
+    @staticmethod
+    def configure(
+        storage: Optional[str] = None,
+        max_sessions: Optional[int] = None,
+        idle_ttl: Optional[float] = None,
+        template_max_age: Optional[float] = None,
+    ):
+        """调整快照参数，已创建的快照不受影响"""
+        if storage is not None:
+            if storage not in ("file", "memory"):
+                raise ValueError(f"Unknown snapshot storage: {storage}")
+            SnapshotManager.storage = storage
+        if max_sessions is not None:
+            SnapshotManager.max_sessions = max_sessions
+        if idle_ttl is not None:
+            SnapshotManager.idle_ttl = idle_ttl
+        if template_max_age is not None:
+            SnapshotManager.template_max_age = template_max_age
+
+    @staticmethod
+    def _workdir() -> str:
+        if SnapshotManager._directory is None:
+            SnapshotManager._directory = tempfile.mkdtemp(prefix="travel-snapshots-")
+        return SnapshotManager._directory
+
+    @staticmethod
+    def prepare_template(db_tool, refresh: bool = False) -> str:
+        """用 DatabaseUpdaterTool 准备日期平移后的模板库，已准备且未过期时直接返回"""
+        with SnapshotManager._lock:
+            SnapshotManager._db_tool = db_tool
+            template = SnapshotManager._template
+            prepared_at = SnapshotManager._template_prepared_at
+            if (
+                not refresh
+                and template is not None
+                and os.path.exists(template)
+                and time.monotonic() - prepared_at < SnapshotManager.template_max_age
+            ):
+                return template
+            template = os.path.join(SnapshotManager._workdir(), "template.sqlite")
+            db_tool.update_dates(template)
+            SnapshotManager._template = template
+            SnapshotManager._template_prepared_at = time.monotonic()
+            return template
+
+    @staticmethod
+    def _current_template() -> str:
+        if SnapshotManager._db_tool is None:
+            raise ValueError("Snapshot template has not been prepared.")
+        return SnapshotManager.prepare_template(SnapshotManager._db_tool)
+
+    @staticmethod
+    def _copy_template(target: sqlite3.Connection):
+        source = sqlite3.connect(SnapshotManager._current_template())
+        try:
+            source.backup(target)
+        finally:
+            source.close()
+
+    @staticmethod
+    def restore(db_path: str) -> str:
+        """用模板覆盖指定的数据库文件（例如共享的 travel2.sqlite），返回该路径"""
+        with SnapshotManager._lock:
+            ConnectionManager.close_all(db_path)
+            target = sqlite3.connect(db_path)
+            try:
+                SnapshotManager._copy_template(target)
+            finally:
+                target.close()
+        return db_path
+
+    @staticmethod
+    def restore_shared(db_path: str) -> str:
+        """用模板覆盖共享数据库，每个进程只在第一次调用和模板重新准备之后执行。
+
+        每个 Streamlit 会话都会新建 GraphBuilder，共享文件可能正被其他会话使用，
+        不能每次都覆盖并关闭其连接。
+        """
+        with SnapshotManager._lock:
+            SnapshotManager._current_template()
+            key = os.path.abspath(db_path)
+            prepared_at = SnapshotManager._template_prepared_at
+            if SnapshotManager._restored.get(key) == prepared_at and os.path.exists(db_path):
+                return db_path
+            SnapshotManager.restore(db_path)
+            SnapshotManager._restored[key] = prepared_at
+        return db_path
+
+    @staticmethod
+    def acquire(session_id: str) -> str:
+        """返回会话的快照路径，第一次使用时从模板创建"""
+        return SnapshotManager._acquire(session_id).path
+
+    @staticmethod
+    def _acquire(session_id: str, pin: bool = False) -> _Snapshot:
+        with SnapshotManager._lock:
+            now = time.monotonic()
+            snapshot = SnapshotManager._snapshots.get(session_id)
+            if snapshot is not None:
+                snapshot.last_used = now
+                snapshot.active += pin
+                SnapshotManager._snapshots.move_to_end(session_id)
+                return snapshot
+
+            name = f"session-{uuid.uuid4().hex}"
+            if SnapshotManager.storage == "memory":
+                path = f"file:{name}?mode=memory&cache=shared"
+                target = sqlite3.connect(path, uri=True, check_same_thread=False)
+                snapshot = _Snapshot(path, anchor=target)
+            else:
+                path = os.path.join(SnapshotManager._workdir(), f"{name}.sqlite")
+                target = sqlite3.connect(path)
+                snapshot = _Snapshot(path)
+            try:
+                SnapshotManager._copy_template(target)
+            except BaseException:
+                target.close()
+                SnapshotManager._remove_files(path)
+                raise
+            if snapshot.anchor is None:
+                target.close()
+            if SnapshotManager._evicted.pop(session_id, None) is not None:
+                snapshot.recreated = True
+                logger.warning(
+                    "Snapshot of session %s was evicted; recreated it from the template, "
+                    "earlier bookings and changes in this session are lost.",
+                    session_id,
+                )
+            snapshot.active += pin
+            SnapshotManager._snapshots[session_id] = snapshot
+            SnapshotManager._evict(now, keep=session_id)
+            return snapshot
+
+    @staticmethod
+    def _evict(now: float, keep: Optional[str] = None):
+        """回收空闲超时的快照，再按最近使用顺序回收超出容量的快照，跳过正在使用的快照和 keep"""
+        snapshots = SnapshotManager._snapshots
+        idle = [
+            session_id for session_id, snapshot in snapshots.items()
+            if snapshot.active == 0 and session_id != keep
+        ]
+        expired = [
+            session_id for session_id in idle
+            if now - snapshots[session_id].last_used > SnapshotManager.idle_ttl
+        ]
+        overflow = max(0, len(snapshots) - len(expired) - SnapshotManager.max_sessions)
+        for session_id in expired + [session_id for session_id in idle if session_id not in expired][:overflow]:
+            SnapshotManager.release(session_id)
+            SnapshotManager._evicted[session_id] = now
+            while len(SnapshotManager._evicted) > SnapshotManager.max_evicted_ids:
+                SnapshotManager._evicted.popitem(last=False)
+
+    @staticmethod
+    def recreated(session_id: str) -> bool:
+        """会话的快照是否因自动回收而被重新创建（之前的改动已丢失）；返回后清除该标记"""
+        with SnapshotManager._lock:
+            snapshot = SnapshotManager._snapshots.get(session_id)
+            if snapshot is None or not snapshot.recreated:
+                return False
+            snapshot.recreated = False
+            return True
+
+    @staticmethod
+    def _remove_files(path: str):
+        if path.startswith("file:"):
+            return
+        for suffix in ("", "-wal", "-shm", "-journal"):
+            try:
+                os.remove(path + suffix)
+            except FileNotFoundError:
+                pass
+
+    @staticmethod
+    def release(session_id: str):
+        """回收会话快照：关闭所有线程中指向它的连接并删除数据；正在使用时推迟到使用结束后回收"""
+        with SnapshotManager._lock:
+            snapshot = SnapshotManager._snapshots.get(session_id)
+            if snapshot is None:
+                return
+            if snapshot.active:
+                snapshot.release_pending = True
+                return
+            del SnapshotManager._snapshots[session_id]
+            ConnectionManager.close_all(snapshot.path)
+            if snapshot.anchor is not None:
+                snapshot.anchor.close()
+            SnapshotManager._remove_files(snapshot.path)
+
+    @staticmethod
+    @contextmanager
+    def session(session_id: str) -> Iterator[str]:
+        """在上下文中让所有工具使用该会话的快照，期间快照不会被回收"""
+        snapshot = SnapshotManager._acquire(session_id, pin=True)
+        token = GlobalConfig.set_session_db(snapshot.path)
+        try:
+            yield snapshot.path
+        finally:
+            GlobalConfig.reset_session_db(token)
+            with SnapshotManager._lock:
+                snapshot.active -= 1
+                snapshot.last_used = time.monotonic()
+                if snapshot.active == 0 and snapshot.release_pending:
+                    snapshot.release_pending = False
+                    SnapshotManager.release(session_id)
+
+    @staticmethod
+    def close_all():
+        """回收所有快照并删除模板和临时目录"""
+        with SnapshotManager._lock:
+            for session_id in list(SnapshotManager._snapshots):
+                # 进程退出时的清理，不再等待正在使用的快照
+                SnapshotManager._snapshots[session_id].active = 0
+                SnapshotManager.release(session_id)
+            SnapshotManager._evicted.clear()
+            if SnapshotManager._directory is not None:
+                if SnapshotManager._template is not None:
+                    ConnectionManager.close_all(SnapshotManager._template)
+                shutil.rmtree(SnapshotManager._directory, ignore_errors=True)
+            SnapshotManager._directory = None
+            SnapshotManager._template = None
+            SnapshotManager._template_prepared_at = None
+            SnapshotManager._restored.clear()
+
+
+atexit.register(SnapshotManager.close_all)
@@ -2,6 +2,51 @@ import sqlite3
 from typing import Optional
 from langchain_core.tools import tool
 from components.tools.chatbots_tools.global_config import GlobalConfig
+from components.tools.chatbots_tools.connection_manager import aconnection, get_connection
+from components.tools.chatbots_tools.result_paging import ResultBudget, page_results, paged_query, projection
+from components.tools.chatbots_tools.search_index import is_missing_index_error, search_query
+
+
+def _search_trip_recommendations_like_query(
+    location: Optional[str],
+    name: Optional[str],
+    keywords: Optional[str],
+    columns: Optional[tuple] = None,
+) -> tuple[str, list]:
+    """构造基于 LIKE 的旅行推荐搜索语句，数据库没有全文索引时使用"""
+    select = ", ".join(columns) if columns else "*"
+    query = f"SELECT {select} FROM trip_recommendations WHERE 1=1"
+    params = []
+
+    if location:
+        query += " AND location LIKE ?"
+        params.append(f"%{location}%")
+    if name:
+        query += " AND name LIKE ?"
+        params.append(f"%{name}%")
+    if keywords:
+        keyword_list = keywords.split(",")
+        keyword_conditions = " OR ".join(["keywords LIKE ?" for _ in keyword_list])
+        query += f" AND ({keyword_conditions})"
+        params.extend([f"%{keyword.strip()}%" for keyword in keyword_list])
+    query += " ORDER BY id"
+    return query, params
+
+
+def _search_trip_recommendations_query(
+    location: Optional[str],
+    name: Optional[str],
+    keywords: Optional[str],
+    columns: Optional[tuple] = None,
+) -> tuple[str, list]:
+    """构造旅行推荐全文检索语句，按相关度排序，同步和异步工具共用"""
+    return search_query(
+        "trip_recommendations",
+        {"location": location, "name": name},
+        {"keywords": keywords.split(",") if keywords else []},
+        columns=columns,
+    )
+
 
 class TripRecommendationTool:
     def __init__(self, db_path: str):
@@ -12,7 +57,10 @@ class TripRecommendationTool:
         location: Optional[str] = None,
         name: Optional[str] = None,
         keywords: Optional[str] = None,
-    ) -> list[dict]:
+        fields: Optional[list[str]] = None,
+        limit: int = 10,
+        offset: int = 0,
+    ) -> dict:
         """
         根据位置、名称和关键字搜索旅行推荐。
 
@@ -20,35 +68,64 @@ class TripRecommendationTool:
             location (Optional[str]): 旅行推荐的位置。默认为 None。
             name (Optional[str]): 旅行推荐的名称。默认为 None。
             keywords (Optional[str]): 与旅行推荐相关的关键字。默认为 None。
+            fields (Optional[list[str]]): 要返回的字段。默认为 id, name, location, keywords, booked；可选 details。
+            limit (int): 本次返回结果的最大数量。默认为 10。
+            offset (int): 跳过的结果数量，查看更多结果时传入上次返回的 next_offset。默认为 0。
 
         Returns:
-            list[dict]: 匹配搜索条件的旅行推荐字典列表。
+            dict: results 为匹配搜索条件的旅行推荐字典列表；more_results 为 True 时还有更多结果，可用 next_offset 继续查询。
         """
-        conn = sqlite3.connect(GlobalConfig.get_global_db())
+        columns = projection("trip_recommendations", fields)
+        limit = ResultBudget.page_size(limit)
+        conn = get_connection()
         cursor = conn.cursor()
 
-        query = "SELECT * FROM trip_recommendations WHERE 1=1"
-        params = []
-
-        if location:
-            query += " AND location LIKE ?"
-            params.append(f"%{location}%")
-        if name:
-            query += " AND name LIKE ?"
-            params.append(f"%{name}%")
-        if keywords:
-            keyword_list = keywords.split(",")
-            keyword_conditions = " OR ".join(["keywords LIKE ?" for _ in keyword_list])
-            query += f" AND ({keyword_conditions})"
-            params.extend([f"%{keyword.strip()}%" for keyword in keyword_list])
-
-        cursor.execute(query, params)
+        try:
+            cursor.execute(*paged_query(
+                *_search_trip_recommendations_query(location, name, keywords, columns), limit, offset
+            ))
+        except sqlite3.OperationalError as e:
+            if not is_missing_index_error(e):
+                raise
+            # 数据库尚未建立全文索引（未经 DatabaseUpdaterTool 准备），退回 LIKE 匹配
+            cursor.execute(*paged_query(
+                *_search_trip_recommendations_like_query(location, name, keywords, columns), limit, offset
+            ))
         results = cursor.fetchall()
         column_names = [column[0] for column in cursor.description]
 
-        conn.close()
+        cursor.close()
 
-        return [dict(zip(column_names, row)) for row in results]
+        return page_results(column_names, results, limit, offset)
+
+    async def _asearch_trip_recommendations(
+        location: Optional[str] = None,
+        name: Optional[str] = None,
+        keywords: Optional[str] = None,
+        fields: Optional[list[str]] = None,
+        limit: int = 10,
+        offset: int = 0,
+    ) -> dict:
+        columns = projection("trip_recommendations", fields)
+        limit = ResultBudget.page_size(limit)
+        async with aconnection() as conn:
+            try:
+                cursor = await conn.execute(*paged_query(
+                    *_search_trip_recommendations_query(location, name, keywords, columns), limit, offset
+                ))
+            except sqlite3.OperationalError as e:
+                if not is_missing_index_error(e):
+                    raise
+                cursor = await conn.execute(*paged_query(
+                    *_search_trip_recommendations_like_query(location, name, keywords, columns), limit, offset
+                ))
+            results = await cursor.fetchall()
+            column_names = [column[0] for column in cursor.description]
+            await cursor.close()
+
+        return page_results(column_names, results, limit, offset)
+
+    search_trip_recommendations.coroutine = _asearch_trip_recommendations
 
     @tool
     def book_excursion(recommendation_id: int) -> str:
@@ -61,7 +138,7 @@ class TripRecommendationTool:
         Returns:
             str: 指示旅行推荐是否成功预订的消息。
         """
-        conn = sqlite3.connect(GlobalConfig.get_global_db())
+        conn = get_connection()
         cursor = conn.cursor()
 
         cursor.execute(
@@ -71,12 +148,29 @@ class TripRecommendationTool:
         conn.commit()
 
         if cursor.rowcount > 0:
-            conn.close()
+            cursor.close()
+            return f"Trip recommendation {recommendation_id} successfully booked."
+        else:
+            cursor.close()
+            return f"No trip recommendation found with ID {recommendation_id}."
+
+    async def _abook_excursion(recommendation_id: int) -> str:
+        async with aconnection() as conn:
+            cursor = await conn.execute(
+                "UPDATE trip_recommendations SET booked = 1 WHERE id = ?",
+                (recommendation_id,)
+            )
+            await conn.commit()
+            rowcount = cursor.rowcount
+            await cursor.close()
+
+        if rowcount > 0:
             return f"Trip recommendation {recommendation_id} successfully booked."
         else:
-            conn.close()
             return f"No trip recommendation found with ID {recommendation_id}."
 
+    book_excursion.coroutine = _abook_excursion
+
     @tool
     def update_excursion(recommendation_id: int, details: str) -> str:
         """
@@ -89,7 +183,7 @@ class TripRecommendationTool:
         Returns:
             str: 指示旅行推荐是否成功更新的消息。
         """
-        conn = sqlite3.connect(GlobalConfig.get_global_db())
+        conn = get_connection()
         cursor = conn.cursor()
 
         cursor.execute(
@@ -99,12 +193,29 @@ class TripRecommendationTool:
         conn.commit()
 
         if cursor.rowcount > 0:
-            conn.close()
+            cursor.close()
+            return f"Trip recommendation {recommendation_id} successfully updated."
+        else:
+            cursor.close()
+            return f"No trip recommendation found with ID {recommendation_id}."
+
+    async def _aupdate_excursion(recommendation_id: int, details: str) -> str:
+        async with aconnection() as conn:
+            cursor = await conn.execute(
+                "UPDATE trip_recommendations SET details = ? WHERE id = ?",
+                (details, recommendation_id),
+            )
+            await conn.commit()
+            rowcount = cursor.rowcount
+            await cursor.close()
+
+        if rowcount > 0:
             return f"Trip recommendation {recommendation_id} successfully updated."
         else:
-            conn.close()
             return f"No trip recommendation found with ID {recommendation_id}."
 
+    update_excursion.coroutine = _aupdate_excursion
+
     @tool
     def cancel_excursion(recommendation_id: int) -> str:
         """
@@ -116,7 +227,7 @@ class TripRecommendationTool:
         Returns:
             str: 指示旅行推荐是否成功取消的消息。
         """
-        conn = sqlite3.connect(GlobalConfig.get_global_db())
+        conn = get_connection()
         cursor = conn.cursor()
 
         cursor.execute(
@@ -126,11 +237,28 @@ class TripRecommendationTool:
         conn.commit()
 
         if cursor.rowcount > 0:
-            conn.close()
+            cursor.close()
             return f"Trip recommendation {recommendation_id} successfully cancelled."
         else:
-            conn.close()
+            cursor.close()
             return f"No trip recommendation found with ID {recommendation_id}."
+
+    async def _acancel_excursion(recommendation_id: int) -> str:
+        async with aconnection() as conn:
+            cursor = await conn.execute(
+                "UPDATE trip_recommendations SET booked = 0 WHERE id = ?",
+                (recommendation_id,)
+            )
+            await conn.commit()
+            rowcount = cursor.rowcount
+            await cursor.close()
+
+        if rowcount > 0:
+            return f"Trip recommendation {recommendation_id} successfully cancelled."
+        else:
+            return f"No trip recommendation found with ID {recommendation_id}."
+
+    cancel_excursion.coroutine = _acancel_excursion
         
 # from trip_recommendation_tool import TripRecommendationTool
 
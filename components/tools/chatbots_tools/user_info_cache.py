@@ -0,0 +1,110 @@
+import threading
+from typing import Optional
+from cachetools import TTLCache
+from components.tools.chatbots_tools.connection_manager import ConnectionManager
+from components.tools.chatbots_tools.global_config import GlobalConfig
+
+
+class UserInfoCache:
+    """按乘客缓存 fetch_user_flight_information 的结果。
+
+    该查询是四表联接，fetch_user_info 节点每轮对话都会执行一次，而结果只会被
+    update_ticket_to_new_flight / cancel_ticket 改变，两者提交后调用 `invalidate`。
+    缓存键包含数据库路径和 ConnectionManager 的失效计数，数据库文件被整体替换
+    （重置日期、恢复快照）后旧结果自动失效；`ttl` 兜底其他途径对数据库的修改。
+    各乘客的修改次数同样按失效计数记录，数据库被替换或会话快照被回收后，
+    下一次 `invalidate` 会清理这些过期的记录。
+    """
+
+    maxsize = 1024
+    ttl = 600
+
+    _lock = threading.Lock()
+    _cache = TTLCache(maxsize=maxsize, ttl=ttl)
+    # 缓存键 (db_path, generation, passenger_id) -> 修改次数；查询期间发生写入时，查询结果不再写入缓存
+    _versions = {}
+    hits = 0
+    misses = 0
+    invalidations = 0
+
+    @staticmethod
+    def configure(maxsize: Optional[int] = None, ttl: Optional[float] = None):
+        """调整缓存容量和过期时间，已缓存的结果被丢弃"""
+        with UserInfoCache._lock:
+            if maxsize is not None:
+                UserInfoCache.maxsize = maxsize
+            if ttl is not None:
+                UserInfoCache.ttl = ttl
+            UserInfoCache._cache = TTLCache(maxsize=UserInfoCache.maxsize, ttl=UserInfoCache.ttl)
+
+    @staticmethod
+    def _passenger_key(passenger_id: str, db_path: Optional[str] = None) -> tuple:
+        return db_path or GlobalConfig.get_global_db(), passenger_id
+
+    @staticmethod
+    def lookup(passenger_id: str) -> tuple[tuple, Optional[list[dict]]]:
+        """返回 (token, 缓存的结果)；未命中时结果为 None，查询后用 token 调用 store"""
+        db_path, passenger_id = UserInfoCache._passenger_key(passenger_id)
+        key = (db_path, ConnectionManager.generation(db_path), passenger_id)
+        with UserInfoCache._lock:
+            rows = UserInfoCache._cache.get(key)
+            if rows is None:
+                UserInfoCache.misses += 1
+            else:
+                UserInfoCache.hits += 1
+            version = UserInfoCache._versions.get(key, 0)
+        token = (key, version)
+        if rows is None:
+            return token, None
+        return token, [dict(row) for row in rows]
+
+    @staticmethod
+    def store(token: tuple, rows: list[dict]):
+        """保存查询结果；查询期间该乘客的数据被修改过时不保存"""
+        key, version = token
+        with UserInfoCache._lock:
+            if UserInfoCache._versions.get(key, 0) == version:
+                UserInfoCache._cache[key] = [dict(row) for row in rows]
+
+    @staticmethod
+    def invalidate(passenger_id: str, db_path: Optional[str] = None):
+        """在修改乘客机票的事务提交后调用，丢弃该乘客在当前数据库中的缓存"""
+        db_path, passenger_id = UserInfoCache._passenger_key(passenger_id, db_path)
+        key = (db_path, ConnectionManager.generation(db_path), passenger_id)
+        with UserInfoCache._lock:
+            UserInfoCache._prune_versions_locked()
+            UserInfoCache._versions[key] = UserInfoCache._versions.get(key, 0) + 1
+            for key in [k for k in UserInfoCache._cache if k[0] == db_path and k[2] == passenger_id]:
+                UserInfoCache._cache.pop(key, None)
+            UserInfoCache.invalidations += 1
+
+    @staticmethod
+    def _prune_versions_locked():
+        # 失效计数已变化的数据库不会再有查询使用这些记录；进行中的旧查询写入的缓存键也不会再被读取
+        stale = [
+            key for key in UserInfoCache._versions if key[1] != ConnectionManager.generation(key[0])
+        ]
+        for key in stale:
+            del UserInfoCache._versions[key]
+
+    @staticmethod
+    def clear():
+        """清空缓存和计数"""
+        with UserInfoCache._lock:
+            UserInfoCache._cache.clear()
+            UserInfoCache._prune_versions_locked()
+            UserInfoCache.hits = UserInfoCache.misses = UserInfoCache.invalidations = 0
+
+    @staticmethod
+    def stats() -> dict:
+        """命中次数、未命中次数、失效次数和命中率"""
+        with UserInfoCache._lock:
+            lookups = UserInfoCache.hits + UserInfoCache.misses
+            return {
+                "hits": UserInfoCache.hits,
+                "misses": UserInfoCache.misses,
+                "invalidations": UserInfoCache.invalidations,
+                "size": len(UserInfoCache._cache),
+                "tracked_versions": len(UserInfoCache._versions),
+                "hit_rate": UserInfoCache.hits / lookups if lookups else 0.0,
+            }
@@ -1,6 +1,7 @@
 import streamlit as st
 from langchain.schema import ChatMessage
 from archive.test06_chatbots import GraphBuilder
+from components.tools.chatbots_tools.snapshot_manager import SnapshotManager
 from langchain_core.messages import ToolMessage
 from langchain.callbacks.base import BaseCallbackHandler
 import uuid
@@ -88,30 +89,37 @@ if prompt := st.chat_input("What is up?"):
     with st.chat_message("assistant"):
         assistant_response = ""
         stream_handler = StreamHandler(st.empty())
-        graph = st.session_state.graph_builder.create_graph(stream_handler)
+        # 图只编译一次，StreamHandler 通过本次运行的 config 回调传入
+        graph = st.session_state.graph_builder.get_graph()
         st.session_state.graph = graph  # 保存 graph 到 session_state
 
-        events = graph.stream(req, config, stream_mode="values")
-
-        for event in events:
-            # 处理消息
-            message = event.get("messages")
-            if message:
-                if isinstance(message, list):
-                    message = message[-1]
-                if message.id not in st.session_state.printed_ids:
-                    if hasattr(message, "content"):
-                        full_response = message.content
-                    st.session_state.printed_ids.add(message.id)
-                    if getattr(message, "tool_calls", None):
-                        tool_call = message.tool_calls[0]
-                        tool_name = tool_call["name"]
-                        tool_args = tool_call["args"]
-                        # 显示工具使用过程
-                        with st.container():
-                            sub_assistant_response = f"\n**助手正在请求使用工具：** `{tool_name}`\n**参数：** `{tool_args}`\n\n"
-                            stream_handler.on_llm_new_token(sub_assistant_response)
-                            assistant_response += sub_assistant_response
+        # 每个会话使用独立的数据库快照，不会影响其他用户
+        with SnapshotManager.session(st.session_state.thread_id):
+            if SnapshotManager.recreated(st.session_state.thread_id):
+                st.warning("会话空闲过久，数据库快照已被回收并重新创建，之前的预订和改签已丢失。")
+            events = graph.stream(
+                req, {**config, "callbacks": [stream_handler]}, stream_mode="values"
+            )
+
+            for event in events:
+                # 处理消息
+                message = event.get("messages")
+                if message:
+                    if isinstance(message, list):
+                        message = message[-1]
+                    if message.id not in st.session_state.printed_ids:
+                        if hasattr(message, "content"):
+                            full_response = message.content
+                        st.session_state.printed_ids.add(message.id)
+                        if getattr(message, "tool_calls", None):
+                            tool_call = message.tool_calls[0]
+                            tool_name = tool_call["name"]
+                            tool_args = tool_call["args"]
+                            # 显示工具使用过程
+                            with st.container():
+                                sub_assistant_response = f"\n**助手正在请求使用工具：** `{tool_name}`\n**参数：** `{tool_args}`\n\n"
+                                stream_handler.on_llm_new_token(sub_assistant_response)
+                                assistant_response += sub_assistant_response
 
         # 检查是否需要用户输入
         snapshot = graph.get_state(config)
@@ -150,13 +158,14 @@ if st.session_state.get("awaiting_user_input", False):
             continue_clicked = st.button("继续", key="continue_button")
             if continue_clicked:
                 display_messages()
-                graph = st.session_state.graph_builder.create_graph()
+                graph = st.session_state.graph_builder.get_graph()
 
                 # 继续处理
-                result = graph.invoke(
-                    None,
-                    config
-                )
+                with SnapshotManager.session(st.session_state.thread_id):
+                    result = graph.invoke(
+                        None,
+                        config
+                    )
 
                 full_response = st.session_state.partial_response + result["messages"][-1].content
                 st.session_state.messages.append(ChatMessage(role="assistant", content=full_response))
@@ -196,19 +205,20 @@ if st.session_state.get("awaiting_user_input", False):
                     key="user_feedback"
                 )
                 if st.button("提交反馈"):
-                    graph = st.session_state.graph_builder.create_graph()
+                    graph = st.session_state.graph_builder.get_graph()
                     # 传递用户反馈
-                    result = graph.invoke(
-                        {
-                            "messages": [
-                                ToolMessage(
-                                    tool_call_id=st.session_state.tool_call["id"],
-                                    content=f"用户拒绝了 API 调用。原因：'{feedback}'。请根据用户的输入继续提供帮助。",
-                                )
-                            ]
-                        },
-                        config,
-                    )
+                    with SnapshotManager.session(st.session_state.thread_id):
+                        result = graph.invoke(
+                            {
+                                "messages": [
+                                    ToolMessage(
+                                        tool_call_id=st.session_state.tool_call["id"],
+                                        content=f"用户拒绝了 API 调用。原因：'{feedback}'。请根据用户的输入继续提供帮助。",
+                                    )
+                                ]
+                            },
+                            config,
+                        )
 
                     full_response = st.session_state.partial_response + result["messages"][-1].content
                     st.session_state.messages.append(ChatMessage(role="assistant", content=full_response))
@@ -0,0 +1,306 @@
+"""
+检查点历史的回归测试：DeltaSqliteSaver 与保留策略裁剪、LLM 回复缓存的键、从检查点回放
+
+测试图与 GraphBuilder 的主助手结构相同（compact_tool_outputs -> summarize_conversation -> assistant <-> tools），
+使用 ScriptedChatModel，不访问任何网络服务。阈值调低后对话中会发生摘要（RemoveMessage）和工具输出压缩
+（按 id 替换早期消息）。
+"""
+import json
+import time
+import uuid
+from typing import Annotated, TypedDict
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
+from langchain_core.tools import tool
+from langgraph.constants import START
+from langgraph.graph import END, StateGraph
+from langgraph.graph.message import AnyMessage, add_messages
+from langgraph.prebuilt import ToolNode, tools_condition
+from utils.checkpoint_retention import CheckpointRetention, checkpoint_time
+from utils.checkpointer import DELTA_DEPTH_KEY, CheckpointerManager, DeltaSqliteSaver
+from utils.conversation_memory import ConversationMemory, create_summarize_node, with_summary
+from utils.llm_cache import LLMResponseCache
+from utils.replay import ReplayEngine
+from utils.scripted_llm import ScriptedChatModel
+from utils.tool_output_compaction import COMPACTED_KEY, create_compaction_node
+
+SCRIPT = [
+    {
+        "match": r"\bflights? from (\w+)",
+        "responses": [
+            lambda messages: {
+                "name": "search_flights",
+                "args": {"departure_airport": messages[-1].content.split()[-1].strip("?.")},
+            },
+            "Here are the flights I found.",
+        ],
+    },
+    {"match": None, "responses": ["Happy to help."]},
+]
+
+CONVERSATION = [
+    "Show me flights from CDG",
+    "Thanks.",
+    "Any flights from ZRH",
+    "What about the weather?",
+    "And flights from GVA",
+    "Bye.",
+]
+
+
+@tool
+def search_flights(departure_airport: str) -> list[dict]:
+    """Search for flights departing from the given airport."""
+    return [
+        {
+            "flight_id": index,
+            "flight_no": f"LX{index:04d}",
+            "departure_airport": departure_airport,
+            "arrival_airport": "BSL",
+            "scheduled_departure": f"2024-05-{index + 1:02d} 08:00:00",
+            "status": "Scheduled",
+            "aircraft_code": "320",
+        }
+        for index in range(15)
+    ]
+
+
+class State(TypedDict):
+    messages: Annotated[list[AnyMessage], add_messages]
+    conversation_summary: str
+    summarized_tokens: int
+
+
+class MiniGraphBuilder:
+    """提供 ReplayEngine 需要的 get_graph/build_graph(llm)/create_llm，工具以属性保存"""
+
+    def __init__(self, checkpointer):
+        self.checkpointer = checkpointer
+        self.search_flights = search_flights
+        self._graph = None
+
+    def create_llm(self):
+        return ScriptedChatModel(turns=SCRIPT)
+
+    def get_graph(self):
+        if self._graph is None:
+            self._graph = self.build_graph()
+        return self._graph
+
+    def build_graph(self, llm=None):
+        llm = llm or self.create_llm()
+        runnable = llm.bind_tools([self.search_flights])
+
+        def assistant(state: State):
+            return {"messages": [runnable.invoke(with_summary(state)["messages"])]}
+
+        builder = StateGraph(State)
+        builder.add_node("compact_tool_outputs", create_compaction_node())
+        builder.add_node("summarize_conversation", create_summarize_node(llm))
+        builder.add_node("assistant", assistant)
+        builder.add_node("tools", ToolNode([self.search_flights]))
+        builder.add_edge(START, "compact_tool_outputs")
+        builder.add_edge("compact_tool_outputs", "summarize_conversation")
+        builder.add_edge("summarize_conversation", "assistant")
+        builder.add_conditional_edges("assistant", tools_condition, ["tools", END])
+        builder.add_edge("tools", "assistant")
+        return builder.compile(checkpointer=self.checkpointer)
+
+
+@pytest.fixture(autouse=True)
+def memory_thresholds():
+    # 调低摘要阈值，让几轮对话内就发生折叠；结束后恢复类属性
+    previous = ConversationMemory.max_tokens, ConversationMemory.keep_tokens
+    ConversationMemory.configure(max_tokens=700, keep_tokens=250)
+    yield
+    ConversationMemory.configure(max_tokens=previous[0], keep_tokens=previous[1])
+
+
+def open_saver(path, snapshot_every=20):
+    return DeltaSqliteSaver(CheckpointerManager.connect(path), path, snapshot_every=snapshot_every)
+
+
+def run_conversation(graph, messages=CONVERSATION):
+    config = {"configurable": {"thread_id": str(uuid.uuid4())}}
+    for content in messages:
+        graph.invoke({"messages": [("user", content)]}, config)
+    return config
+
+
+def history(graph, config):
+    return [
+        (snapshot.config["configurable"]["checkpoint_id"], snapshot.values, snapshot.next, snapshot.metadata)
+        for snapshot in graph.get_state_history(config)
+    ]
+
+
+def transcript(messages):
+    return [(message.type, message.content) for message in messages]
+
+
+@pytest.mark.parametrize("snapshot_every, keep_last", [(2, 5), (3, 7), (4, 9), (20, 12)])
+def test_trim_preserves_state_history(tmp_path, snapshot_every, keep_last):
+    path = str(tmp_path / "checkpoints.sqlite")
+    saver = open_saver(path, snapshot_every)
+    config = run_conversation(MiniGraphBuilder(saver).get_graph())
+    before = history(MiniGraphBuilder(saver).get_graph(), config)
+    saver.conn.close()
+
+    final = before[0][1]
+    assert final["summarized_tokens"] > 0
+    assert any(
+        isinstance(message, ToolMessage) and message.response_metadata.get(COMPACTED_KEY)
+        for message in final["messages"]
+    )
+
+    report = CheckpointRetention(path, keep_last=keep_last, thread_ttl=None).run()
+    assert report["deleted_checkpoints"] > 0
+
+    # 新连接、空缓存，增量检查点只能从数据库中保留的父检查点重建
+    saver = open_saver(path, snapshot_every)
+    after = history(MiniGraphBuilder(saver).get_graph(), config)
+    depths = [
+        json.loads(row[0])[DELTA_DEPTH_KEY]
+        for row in saver.conn.execute("SELECT metadata FROM checkpoints ORDER BY checkpoint_id")
+    ]
+    saver.conn.close()
+
+    assert after[:keep_last] == before[:keep_last]
+    # 为重建而保留的更早检查点也与裁剪前一致
+    assert all(entry in before for entry in after)
+    if snapshot_every < keep_last:
+        assert depths[0] == 0 and max(depths) > 0
+
+
+def test_trim_then_continue_conversation(tmp_path):
+    path = str(tmp_path / "checkpoints.sqlite")
+    saver = open_saver(path, snapshot_every=3)
+    graph = MiniGraphBuilder(saver).get_graph()
+    config = run_conversation(graph, CONVERSATION[:4])
+    saver.conn.close()
+    CheckpointRetention(path, keep_last=4, thread_ttl=None).run()
+
+    saver = open_saver(path, snapshot_every=3)
+    graph = MiniGraphBuilder(saver).get_graph()
+    for content in CONVERSATION[4:]:
+        graph.invoke({"messages": [("user", content)]}, config)
+    resumed = graph.get_state(config).values
+    saver.conn.close()
+
+    reference = MiniGraphBuilder(open_saver(str(tmp_path / "reference.sqlite"))).get_graph()
+    expected = reference.get_state(run_conversation(reference)).values
+    assert transcript(resumed["messages"]) == transcript(expected["messages"])
+    assert resumed["conversation_summary"] == expected["conversation_summary"]
+
+
+@pytest.fixture
+def response_cache(tmp_path):
+    cache = LLMResponseCache(str(tmp_path / "llm_cache.sqlite"))
+    yield cache
+    cache.close()
+
+
+def prompt(now, message_id="a", call_id="call_1"):
+    return [
+        SystemMessage(content=f"You are a helpful assistant.\nCurrent time: {now}.\nBe brief."),
+        HumanMessage(content="Show me flights from CDG", id=message_id),
+        AIMessage(content="", id=f"ai-{message_id}", tool_calls=[
+            {"name": "search_flights", "args": {"departure_airport": "CDG"}, "id": call_id},
+        ]),
+        ToolMessage(content="[]", tool_call_id=call_id, id=f"tool-{message_id}"),
+    ]
+
+
+def test_cache_key_ignores_time_and_ids(response_cache):
+    params = {"model": "fake", "kwargs": {"tools": ["search_flights"]}}
+    key = response_cache.key(prompt("2024-05-01 10:00:00.123456"), params)
+    assert response_cache.key(prompt("2026-10-17 23:59:59.000001", "b", "call_2"), params) == key
+
+
+def test_cache_key_depends_on_content_and_params(response_cache):
+    params = {"model": "fake", "kwargs": {"tools": ["search_flights"]}}
+    messages = prompt("2024-05-01 10:00:00")
+    key = response_cache.key(messages, params)
+
+    changed = [*messages[:-1], messages[-1].model_copy(update={"content": "[{}]"})]
+    assert response_cache.key(changed, params) != key
+    system = [messages[0].model_copy(update={"content": "Be verbose.\nCurrent time: 2024-05-01 10:00:00."})]
+    assert response_cache.key(system + messages[1:], params) != key
+    assert response_cache.key(messages, {**params, "kwargs": {"tools": []}}) != key
+    assert response_cache.key(messages, {**params, "stop": ["\n"]}) != key
+
+
+def test_cache_round_trip(response_cache):
+    key = response_cache.key(prompt("now"), {})
+    assert response_cache.get(key) is None
+    response_cache.put(key, AIMessage(content="Here are the flights I found.", id="run-1"))
+    cached = response_cache.get(key)
+    assert cached.content == "Here are the flights I found." and cached.id is None
+    assert response_cache.stats()["hits"] == 1
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = str(tmp_path / "checkpoints.sqlite")
+    builder = MiniGraphBuilder(open_saver(path, snapshot_every=3))
+    config = run_conversation(builder.get_graph())
+    yield builder, config
+    builder.checkpointer.conn.close()
+
+
+def fork_points(graph, config):
+    snapshots = list(graph.get_state_history(config))
+    inputs = [snapshot for snapshot in snapshots if snapshot.next == (START,)]
+    tools = [snapshot for snapshot in snapshots if snapshot.next == ("tools",)]
+    # 第二轮的输入检查点，以及最早一次工具调用之前的检查点
+    return {"input": inputs[-2].config, "tools": tools[-1].config}
+
+
+def test_fork_copies_checkpoint_to_new_thread(source):
+    builder, config = source
+    engine = ReplayEngine(builder, config, offline=True)
+    checkpoint_config = fork_points(builder.get_graph(), config)["tools"]
+
+    fork_config = engine.fork(checkpoint_config)
+    assert fork_config["configurable"]["thread_id"] != config["configurable"]["thread_id"]
+    forked = engine.graph.get_state(fork_config)
+    original = builder.get_graph().get_state(checkpoint_config)
+    assert forked.values == original.values
+    assert forked.next == original.next == ("tools",)
+
+    # 分叉出的检查点使用新的 ID，保留策略按分叉时间计算新 thread 的最近活动
+    source_id = original.config["configurable"]["checkpoint_id"]
+    fork_id = forked.config["configurable"]["checkpoint_id"]
+    assert fork_id != source_id and fork_id > source_id
+    assert abs(checkpoint_time(fork_id) - time.time()) < 60
+    assert forked.metadata["forked_from"] == {
+        "thread_id": config["configurable"]["thread_id"],
+        "checkpoint_id": source_id,
+    }
+
+
+@pytest.mark.parametrize("point", ["input", "tools"])
+def test_offline_replay_reproduces_conversation(source, point):
+    builder, config = source
+    graph = builder.get_graph()
+    engine = ReplayEngine(builder, config, offline=True)
+
+    result = engine.run(fork_points(graph, config)[point])
+    expected = graph.get_state(config).values
+    assert transcript(result["state"].values["messages"]) == transcript(expected["messages"])
+    assert result["state"].values["conversation_summary"] == expected["conversation_summary"]
+    assert result["stats"]["llm_live"] == 0 and result["stats"]["tool_live"] == 0
+    assert result["stats"]["llm_replayed"] > 0 and result["stats"]["tool_replayed"] > 0
+
+
+def test_replay_with_new_input_goes_live(source):
+    builder, config = source
+    graph = builder.get_graph()
+    engine = ReplayEngine(builder, config, live_llm=builder.create_llm())
+
+    result = engine.run(fork_points(graph, config)["input"], inputs=["Show me flights from MUC"])
+    messages = result["state"].values["messages"]
+    assert messages[-1].content == "Here are the flights I found."
+    assert result["stats"]["llm_live"] > 0 and result["stats"]["tool_live"] == 1
+    # 源 thread 不受影响
+    assert graph.get_state(config).values["messages"][-1].content == "Happy to help."
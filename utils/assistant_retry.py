@@ -0,0 +1,92 @@
+"""
+助手在模型返回空回复时的有界重试
+
+模型偶尔返回既没有内容也没有工具调用的回复，Assistant 会追加提示后重新调用。
+RetryPolicy 限制重试次数、在两次调用之间按指数退避等待，并限制每轮的总耗时；
+重试用尽或超过期限时返回固定的兜底回复。RetryStats 按助手统计调用、重试和兜底次数。
+"""
+import threading
+from langchain_core.messages import AIMessage
+
+DEFAULT_FALLBACK = (
+    "Sorry, I was unable to produce a response just now. "
+    "Please try again or rephrase your request."
+)
+
+
+def is_empty_response(message) -> bool:
+    """
+    既没有工具调用也没有文本内容的回复
+    """
+    if message.tool_calls:
+        return False
+    if not message.content:
+        return True
+    return isinstance(message.content, list) and not message.content[0].get("text")
+
+
+class RetryPolicy:
+    """
+    重试策略
+
+    max_attempts 为包括第一次在内的最多调用次数；第 n 次重试前等待
+    initial_backoff * multiplier ** (n - 1) 秒（不超过 max_backoff）；
+    deadline 为每轮从第一次调用开始的最长耗时（秒），等待后会超过期限时不再重试。
+    """
+
+    def __init__(self, max_attempts=3, initial_backoff=0.5, multiplier=2.0, max_backoff=8.0,
+                 deadline=60.0, fallback=DEFAULT_FALLBACK):
+        self.max_attempts = max(1, max_attempts)
+        self.initial_backoff = initial_backoff
+        self.multiplier = multiplier
+        self.max_backoff = max_backoff
+        self.deadline = deadline
+        self.fallback = fallback
+
+    def backoff(self, retry: int) -> float:
+        """
+        第 retry 次重试（从 1 开始）之前的等待秒数
+        """
+        return min(self.initial_backoff * self.multiplier ** (retry - 1), self.max_backoff)
+
+    def fallback_message(self) -> AIMessage:
+        return AIMessage(content=self.fallback)
+
+
+class RetryStats:
+    """
+    按助手统计的调用次数、需要重试的调用次数、重试总次数和返回兜底回复的次数
+    """
+
+    _lock = threading.Lock()
+    _stats = {}
+
+    @staticmethod
+    def record(name: str, retries: int, fallback: bool = False):
+        with RetryStats._lock:
+            stats = RetryStats._stats.setdefault(
+                name, {"calls": 0, "retried_calls": 0, "retries": 0, "fallbacks": 0}
+            )
+            stats["calls"] += 1
+            stats["retried_calls"] += retries > 0
+            stats["retries"] += retries
+            stats["fallbacks"] += fallback
+
+    @staticmethod
+    def clear():
+        """
+        清空统计
+        """
+        with RetryStats._lock:
+            RetryStats._stats = {}
+
+    @staticmethod
+    def stats() -> dict:
+        """
+        以助手名为键的统计，另附需要重试的调用所占比例
+        """
+        with RetryStats._lock:
+            return {
+                name: {**stats, "retry_rate": stats["retried_calls"] / stats["calls"]}
+                for name, stats in RetryStats._stats.items()
+            }
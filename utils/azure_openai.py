@@ -1,6 +1,179 @@
-from openai import AzureOpenAI
+import threading
+import httpx
+from openai import AsyncAzureOpenAI, AzureOpenAI, DefaultAsyncHttpxClient, DefaultHttpxClient
 import config as cfg
 
+
+class ClientRegistry:
+    """
+    进程级共享的 Azure OpenAI 客户端注册表
+
+    同步和异步各共用一个 httpx 连接池，所有客户端（openai SDK 客户端以及
+    LangChain 的 AzureChatOpenAI）都复用这两个连接池，避免每次新建客户端都重新进行
+    TLS 握手、丢失 keep-alive 连接。相同参数的客户端只创建一次。
+    """
+
+    max_connections = 100
+    max_keepalive_connections = 20
+    keepalive_expiry = 60.0
+    timeout = 600.0
+
+    _lock = threading.Lock()
+    _http_client = None
+    _async_http_client = None
+    _clients = {}
+
+    @staticmethod
+    def configure(max_connections=None, max_keepalive_connections=None, keepalive_expiry=None, timeout=None):
+        """
+        调整连接池参数
+
+        已创建的客户端保持不变，之后获取的客户端使用按新参数创建的连接池。
+        """
+        with ClientRegistry._lock:
+            if max_connections is not None:
+                ClientRegistry.max_connections = max_connections
+            if max_keepalive_connections is not None:
+                ClientRegistry.max_keepalive_connections = max_keepalive_connections
+            if keepalive_expiry is not None:
+                ClientRegistry.keepalive_expiry = keepalive_expiry
+            if timeout is not None:
+                ClientRegistry.timeout = timeout
+            ClientRegistry._http_client = None
+            ClientRegistry._async_http_client = None
+            ClientRegistry._clients = {}
+
+    @staticmethod
+    def limits():
+        """
+        当前的连接池上限
+        """
+        return httpx.Limits(
+            max_connections=ClientRegistry.max_connections,
+            max_keepalive_connections=ClientRegistry.max_keepalive_connections,
+            keepalive_expiry=ClientRegistry.keepalive_expiry,
+        )
+
+    @staticmethod
+    def http_client():
+        """
+        获取共享的同步 httpx 客户端
+        """
+        with ClientRegistry._lock:
+            if ClientRegistry._http_client is None:
+                ClientRegistry._http_client = DefaultHttpxClient(
+                    limits=ClientRegistry.limits(), timeout=ClientRegistry.timeout
+                )
+            return ClientRegistry._http_client
+
+    @staticmethod
+    def async_http_client():
+        """
+        获取共享的异步 httpx 客户端
+        """
+        with ClientRegistry._lock:
+            if ClientRegistry._async_http_client is None:
+                ClientRegistry._async_http_client = DefaultAsyncHttpxClient(
+                    limits=ClientRegistry.limits(), timeout=ClientRegistry.timeout
+                )
+            return ClientRegistry._async_http_client
+
+    @staticmethod
+    def _get_or_create(key, factory):
+        with ClientRegistry._lock:
+            client = ClientRegistry._clients.get(key)
+        if client is None:
+            client = factory()
+            with ClientRegistry._lock:
+                client = ClientRegistry._clients.setdefault(key, client)
+        return client
+
+    @staticmethod
+    def get_client(endpoint=None, api_key=None, api_version=None):
+        """
+        获取共享的同步 AzureOpenAI 客户端，参数默认取自配置
+        """
+        endpoint = endpoint or cfg.ENDPOINT_URL
+        api_key = api_key or cfg.AZURE_OPENAI_API_KEY
+        api_version = api_version or cfg.AZURE_API_VERSION
+        return ClientRegistry._get_or_create(
+            ("sync", endpoint, api_key, api_version),
+            lambda: AzureOpenAI(
+                azure_endpoint=endpoint,
+                api_key=api_key,
+                api_version=api_version,
+                http_client=ClientRegistry.http_client(),
+            ),
+        )
+
+    @staticmethod
+    def get_async_client(endpoint=None, api_key=None, api_version=None):
+        """
+        获取共享的异步 AsyncAzureOpenAI 客户端，参数默认取自配置
+        """
+        endpoint = endpoint or cfg.ENDPOINT_URL
+        api_key = api_key or cfg.AZURE_OPENAI_API_KEY
+        api_version = api_version or cfg.AZURE_API_VERSION
+        return ClientRegistry._get_or_create(
+            ("async", endpoint, api_key, api_version),
+            lambda: AsyncAzureOpenAI(
+                azure_endpoint=endpoint,
+                api_key=api_key,
+                api_version=api_version,
+                http_client=ClientRegistry.async_http_client(),
+            ),
+        )
+
+    @staticmethod
+    def get_chat_model(deployment=None, api_version=None, **kwargs):
+        """
+        获取共享的 LangChain AzureChatOpenAI，同步和异步调用都走共享连接池
+
+        kwargs 为其他 AzureChatOpenAI 参数（如 streaming=True），参数相同的模型只创建一次。
+        """
+        from langchain_openai import AzureChatOpenAI
+
+        deployment = deployment or cfg.DEPLOYMENT_NAME
+        api_version = api_version or cfg.AZURE_API_VERSION
+        key = ("chat", deployment, api_version, tuple(sorted(kwargs.items())))
+        return ClientRegistry._get_or_create(
+            key,
+            lambda: AzureChatOpenAI(
+                azure_deployment=deployment,
+                azure_endpoint=cfg.ENDPOINT_URL,
+                api_key=cfg.AZURE_OPENAI_API_KEY,
+                api_version=api_version,
+                http_client=ClientRegistry.http_client(),
+                http_async_client=ClientRegistry.async_http_client(),
+                **kwargs,
+            ),
+        )
+
+    @staticmethod
+    def close_all():
+        """
+        关闭共享的同步连接池并清空注册表（异步连接池需在事件循环中调用 aclose_all）
+        """
+        with ClientRegistry._lock:
+            http_client = ClientRegistry._http_client
+            ClientRegistry._http_client = None
+            ClientRegistry._clients = {}
+        if http_client is not None:
+            http_client.close()
+
+    @staticmethod
+    async def aclose_all():
+        """
+        关闭共享的同步和异步连接池并清空注册表
+        """
+        with ClientRegistry._lock:
+            async_http_client = ClientRegistry._async_http_client
+            ClientRegistry._async_http_client = None
+        ClientRegistry.close_all()
+        if async_http_client is not None:
+            await async_http_client.aclose()
+
+
 def generate_chat_completion(prompt, max_tokens=800, temperature=0.7, top_p=0.95, stream=False, client=None, only_content=False):
     """
     生成基于聊天提示的 OpenAI 完成结果
@@ -66,17 +239,15 @@ def get_client():
     获取 Azure OpenAI 客户端
     
     返回:
-    - Azure OpenAI 客户端
+    - 进程内共享的 Azure OpenAI 客户端（复用 HTTP 连接池）
     """
-    # 从配置中读取 Azure OpenAI 的参数
-    endpoint = cfg.ENDPOINT_URL
-    subscription_key = cfg.AZURE_OPENAI_API_KEY
-
-    # 使用基于密钥的身份验证来初始化 Azure OpenAI 客户端
-    client = AzureOpenAI(
-        azure_endpoint=endpoint,
-        api_key=subscription_key,
-        api_version=cfg.AZURE_API_VERSION,
-    )
+    return ClientRegistry.get_client()
 
-    return client
+def get_async_client():
+    """
+    获取异步 Azure OpenAI 客户端
+    
+    返回:
+    - 进程内共享的 AsyncAzureOpenAI 客户端（复用 HTTP 连接池）
+    """
+    return ClientRegistry.get_async_client()
@@ -0,0 +1,54 @@
+"""
+聊天消息的通用辅助函数
+
+message_key / conversation_key 为 LLM 输入计算与消息 id 无关的匹配键（回放和脚本化模型使用）；
+message_chunks 把完整的 AIMessage 切分为流式片段，让不经过真实模型的回复也能逐个 token 交给回调。
+"""
+import hashlib
+import json
+import re
+from typing import Iterator
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, SystemMessage
+from langchain_core.messages.tool import tool_call_chunk
+from langchain_core.outputs import ChatGenerationChunk
+
+
+def message_key(message: BaseMessage) -> bytes:
+    """
+    消息的匹配键：类型、内容和工具调用（名称和参数），忽略消息 id 和 tool_call_id
+    """
+    tool_calls = [
+        [call["name"], call["args"]] for call in getattr(message, "tool_calls", None) or []
+    ]
+    return json.dumps(
+        [message.type, message.content, tool_calls], sort_keys=True, default=str
+    ).encode("utf-8")
+
+
+def conversation_key(messages: list) -> str:
+    """
+    LLM 输入的匹配键：按顺序对非系统消息取摘要
+    """
+    digest = hashlib.sha1()
+    for message in messages:
+        if not isinstance(message, SystemMessage):
+            digest.update(message_key(message))
+    return digest.hexdigest()
+
+
+def message_chunks(message: AIMessage) -> Iterator[ChatGenerationChunk]:
+    """
+    把完整的回复切分为流式片段：文本按词切分，工具调用和元数据放在最后一个片段中
+    """
+    content = message.content if isinstance(message.content, str) else ""
+    for piece in re.findall(r"\S+\s*|\s+", content):
+        yield ChatGenerationChunk(message=AIMessageChunk(content=piece))
+    yield ChatGenerationChunk(message=AIMessageChunk(
+        content="" if isinstance(message.content, str) else message.content,
+        additional_kwargs=message.additional_kwargs,
+        response_metadata=message.response_metadata,
+        tool_call_chunks=[
+            tool_call_chunk(name=call["name"], args=json.dumps(call["args"]), id=call["id"], index=index)
+            for index, call in enumerate(message.tool_calls)
+        ],
+    ))
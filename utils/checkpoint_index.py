@@ -0,0 +1,91 @@
+"""
+检查点的旁路索引：每个检查点一行，记录消息数、产生它的节点和最后一条消息调用的工具
+
+node 列保存本步写入状态的全部节点，格式为 ",节点1,节点2,"，按成员关系匹配，
+与 metadata["writes"] 的语义一致；早期写入的行只保存了第一个节点名。
+
+由 SharedSqliteSaver 在写入检查点时维护，选择要回放的状态时直接按条件查找，
+不必反序列化整个历史。
+"""
+from typing import Optional
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import Checkpoint, CheckpointMetadata
+
+INDEX_TABLE = "checkpoint_index"
+
+INDEX_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS {INDEX_TABLE} (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    checkpoint_id TEXT NOT NULL,
+    message_count INTEGER,
+    node TEXT,
+    tool_name TEXT,
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+);
+CREATE INDEX IF NOT EXISTS {INDEX_TABLE}_message_count
+    ON {INDEX_TABLE} (thread_id, checkpoint_ns, message_count);
+"""
+
+INDEX_INSERT = (
+    f"INSERT OR REPLACE INTO {INDEX_TABLE} "
+    "(thread_id, checkpoint_ns, checkpoint_id, message_count, node, tool_name) VALUES (?, ?, ?, ?, ?, ?)"
+)
+
+
+def index_row(config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata) -> tuple:
+    """
+    由写入的检查点得到索引行，checkpoint 的 channel_values 必须是完整值
+    """
+    messages = checkpoint["channel_values"].get("messages")
+    message_count = len(messages) if isinstance(messages, list) else None
+    tool_name = None
+    if messages:
+        tool_calls = getattr(messages[-1], "tool_calls", None)
+        if tool_calls:
+            tool_name = tool_calls[0]["name"]
+    # metadata["writes"] 的键是本步执行的节点（可能有多个），输入检查点为 "__start__"
+    writers = list(metadata.get("writes") or {})
+    node = f",{','.join(writers)}," if writers else None
+    return (
+        str(config["configurable"]["thread_id"]),
+        config["configurable"].get("checkpoint_ns", ""),
+        checkpoint["id"],
+        message_count,
+        node,
+        tool_name,
+    )
+
+
+def find_query(config: RunnableConfig, message_count: Optional[int] = None, node: Optional[str] = None,
+               tool_name: Optional[str] = None) -> tuple[str, list]:
+    """
+    查找 thread 中满足全部条件的最新检查点的 SQL 和参数
+    """
+    clauses = ["thread_id = ?", "checkpoint_ns = ?"]
+    params = [str(config["configurable"]["thread_id"]), config["configurable"].get("checkpoint_ns", "")]
+    if message_count is not None:
+        clauses.append("message_count = ?")
+        params.append(message_count)
+    if node is not None:
+        # 旧行的 node 是单个节点名，新行是分隔后的全部节点
+        clauses.append("(node = ? OR instr(node, ?) > 0)")
+        params.extend([node, f",{node},"])
+    if tool_name is not None:
+        clauses.append("tool_name = ?")
+        params.append(tool_name)
+    sql = (
+        f"SELECT checkpoint_id FROM {INDEX_TABLE} WHERE {' AND '.join(clauses)} "
+        "ORDER BY checkpoint_id DESC LIMIT 1"
+    )
+    return sql, params
+
+
+def oldest_query(config: RunnableConfig) -> tuple[str, list]:
+    """
+    thread 中最早被索引的检查点的 SQL 和参数，更早的检查点写入时还没有索引
+    """
+    return (
+        f"SELECT MIN(checkpoint_id) FROM {INDEX_TABLE} WHERE thread_id = ? AND checkpoint_ns = ?",
+        [str(config["configurable"]["thread_id"]), config["configurable"].get("checkpoint_ns", "")],
+    )
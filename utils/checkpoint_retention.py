@@ -0,0 +1,332 @@
+"""
+检查点保留策略：裁剪、过期和压缩 checkpoints.sqlite
+
+- 每个 thread（及子图命名空间）只保留最近 keep_last 个检查点，连同其 writes；
+  增量保存的检查点会连带保留重建所需的父检查点（最多回溯到最近的完整快照）；
+- 最近一次活动早于 thread_ttl 秒的 thread 整体删除；
+- 删除后执行增量 VACUUM 并截断 WAL，报告回收的字节数。
+
+增量 VACUUM 需要数据库处于 auto_vacuum=INCREMENTAL 模式。CheckpointerManager 新建的数据库已是该模式；
+之前创建的数据库需要用 --convert-auto-vacuum 执行一次完整 VACUUM 转换（会重写整个文件并长时间持有写锁，
+应在维护窗口中执行）。后台任务从不做这种转换，未转换的数据库只删除数据，空闲页留给之后的写入复用。
+
+可以作为命令行工具运行，也可以在应用进程中作为后台线程定期运行。
+
+用法（在仓库根目录）：
+    python -m utils.checkpoint_retention --path checkpoints.sqlite --keep-last 20 --ttl-days 7
+    python -m utils.checkpoint_retention --convert-auto-vacuum   # 一次性转换已有数据库
+    python -m utils.checkpoint_retention --interval 3600   # 常驻，每小时执行一次
+"""
+import argparse
+import datetime
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from utils.checkpoint_index import INDEX_TABLE
+from utils.checkpointer import DELTA_DEPTH_KEY
+
+logger = logging.getLogger(__name__)
+
+# UUIDv6 时间戳的起点（格里高利历起始日）
+_UUID_EPOCH = datetime.datetime(1582, 10, 15, tzinfo=datetime.timezone.utc)
+
+
+def checkpoint_time(checkpoint_id: str) -> float:
+    """
+    从检查点 ID（UUIDv6，按时间有序）中解析出 Unix 时间戳
+    """
+    value = uuid.UUID(checkpoint_id).int
+    ticks = ((value >> 96) << 28) | (((value >> 80) & 0xFFFF) << 12) | ((value >> 64) & 0x0FFF)
+    return (_UUID_EPOCH + datetime.timedelta(microseconds=ticks // 10)).timestamp()
+
+
+def database_size(path: str) -> int:
+    """
+    数据库文件及其 WAL 文件的总字节数
+    """
+    return sum(
+        os.path.getsize(path + suffix)
+        for suffix in ("", "-wal")
+        if os.path.exists(path + suffix)
+    )
+
+
+class CheckpointRetention:
+    """
+    对检查点数据库执行保留策略
+
+    keep_last 为 None 时不按数量裁剪，thread_ttl 为 None 时不按空闲时间过期。
+    删除按 thread 分批提交，运行期间应用仍可正常读写（WAL + busy timeout）。
+    convert_auto_vacuum 为 True 时，把尚未处于 auto_vacuum=INCREMENTAL 模式的数据库用一次完整 VACUUM 转换过来。
+    """
+
+    def __init__(self, path="checkpoints.sqlite", keep_last=20, thread_ttl=7 * 24 * 3600,
+                 busy_timeout_ms=5000, batch_size=100, convert_auto_vacuum=False):
+        self.path = path
+        self.keep_last = keep_last
+        self.thread_ttl = thread_ttl
+        self.busy_timeout_ms = busy_timeout_ms
+        self.batch_size = batch_size
+        self.convert_auto_vacuum = convert_auto_vacuum
+        self._warned_auto_vacuum = False
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=self.busy_timeout_ms / 1000, isolation_level=None)
+        conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout_ms)}")
+        return conn
+
+    @staticmethod
+    def _has_tables(conn: sqlite3.Connection) -> bool:
+        tables = {
+            row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")
+        }
+        return {"checkpoints", "writes"} <= tables
+
+    def _expired_threads(self, conn: sqlite3.Connection, now: float) -> list:
+        if self.thread_ttl is None:
+            return []
+        cutoff = now - self.thread_ttl
+        return [
+            thread_id
+            for thread_id, latest in conn.execute(
+                "SELECT thread_id, MAX(checkpoint_id) FROM checkpoints GROUP BY thread_id"
+            )
+            if checkpoint_time(latest) < cutoff
+        ]
+
+    @staticmethod
+    def _delete_index_rows(conn: sqlite3.Connection, batch: list):
+        # SharedSqliteSaver 维护的旁路索引随检查点一起清理
+        if conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type='table' AND name = ?", (INDEX_TABLE,)
+        ).fetchone() is None:
+            return
+        placeholders = ", ".join("?" for _ in batch)
+        conn.execute(
+            f"""
+            DELETE FROM {INDEX_TABLE} WHERE thread_id IN ({placeholders}) AND NOT EXISTS (
+                SELECT 1 FROM checkpoints c
+                WHERE c.thread_id = {INDEX_TABLE}.thread_id
+                  AND c.checkpoint_ns = {INDEX_TABLE}.checkpoint_ns
+                  AND c.checkpoint_id = {INDEX_TABLE}.checkpoint_id
+            )
+            """,
+            batch,
+        )
+
+    def _delete_threads(self, conn: sqlite3.Connection, thread_ids: list) -> tuple[int, int]:
+        checkpoints = writes = 0
+        for start in range(0, len(thread_ids), self.batch_size):
+            batch = thread_ids[start:start + self.batch_size]
+            placeholders = ", ".join("?" for _ in batch)
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                checkpoints += conn.execute(
+                    f"DELETE FROM checkpoints WHERE thread_id IN ({placeholders})", batch
+                ).rowcount
+                writes += conn.execute(
+                    f"DELETE FROM writes WHERE thread_id IN ({placeholders})", batch
+                ).rowcount
+                self._delete_index_rows(conn, batch)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return checkpoints, writes
+
+    def _trim_threads(self, conn: sqlite3.Connection) -> tuple[int, int]:
+        if self.keep_last is None:
+            return 0, 0
+        thread_ids = [
+            row[0]
+            for row in conn.execute(
+                "SELECT thread_id FROM checkpoints GROUP BY thread_id, checkpoint_ns"
+                " HAVING COUNT(*) > ?",
+                (self.keep_last,),
+            )
+        ]
+        thread_ids = list(dict.fromkeys(thread_ids))
+        checkpoints = writes = 0
+        for start in range(0, len(thread_ids), self.batch_size):
+            batch = thread_ids[start:start + self.batch_size]
+            placeholders = ", ".join("?" for _ in batch)
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # 按 checkpoint_id（UUIDv6，按时间有序）倒序编号，保留最近 keep_last 个检查点，
+                # 以及重建这些增量检查点（delta_depth > 0）所需的父检查点，其余删除。
+                # 以 WITH 开头的 DELETE 没有 rowcount，用 total_changes 统计删除行数
+                changes = conn.total_changes
+                conn.execute(
+                    f"""
+                    WITH RECURSIVE keep(rid, thread_id, checkpoint_ns, parent_checkpoint_id, metadata) AS (
+                        SELECT rid, thread_id, checkpoint_ns, parent_checkpoint_id, metadata FROM (
+                            SELECT rowid AS rid, thread_id, checkpoint_ns, parent_checkpoint_id, metadata,
+                                   ROW_NUMBER() OVER (
+                                       PARTITION BY thread_id, checkpoint_ns ORDER BY checkpoint_id DESC
+                                   ) AS rank
+                            FROM checkpoints WHERE thread_id IN ({placeholders})
+                        ) WHERE rank <= ?
+                        UNION
+                        SELECT c.rowid, c.thread_id, c.checkpoint_ns, c.parent_checkpoint_id, c.metadata
+                        FROM checkpoints c JOIN keep k
+                          ON c.thread_id = k.thread_id
+                         AND c.checkpoint_ns = k.checkpoint_ns
+                         AND c.checkpoint_id = k.parent_checkpoint_id
+                        WHERE json_extract(CAST(k.metadata AS TEXT), '$.{DELTA_DEPTH_KEY}') > 0
+                    )
+                    DELETE FROM checkpoints
+                    WHERE thread_id IN ({placeholders}) AND rowid NOT IN (SELECT rid FROM keep)
+                    """,
+                    [*batch, self.keep_last, *batch],
+                )
+                checkpoints += conn.total_changes - changes
+                writes += conn.execute(
+                    f"""
+                    DELETE FROM writes WHERE thread_id IN ({placeholders}) AND NOT EXISTS (
+                        SELECT 1 FROM checkpoints c
+                        WHERE c.thread_id = writes.thread_id
+                          AND c.checkpoint_ns = writes.checkpoint_ns
+                          AND c.checkpoint_id = writes.checkpoint_id
+                    )
+                    """,
+                    batch,
+                ).rowcount
+                self._delete_index_rows(conn, batch)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return checkpoints, writes
+
+    def _compact(self, conn: sqlite3.Connection):
+        # 增量 VACUUM 需要 auto_vacuum=INCREMENTAL，已有数据库切换时需要一次完整 VACUUM，只在显式要求时执行
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+            conn.execute("PRAGMA incremental_vacuum")
+        elif self.convert_auto_vacuum:
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.execute("VACUUM")
+        elif not self._warned_auto_vacuum:
+            self._warned_auto_vacuum = True
+            logger.warning(
+                "%s is not in auto_vacuum=INCREMENTAL mode; deleted pages are reused but the file does not "
+                "shrink. Run 'python -m utils.checkpoint_retention --convert-auto-vacuum' once to convert it.",
+                self.path,
+            )
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def run(self, now=None) -> dict:
+        """
+        执行一次保留策略，返回删除的行数和回收的字节数
+        """
+        now = time.time() if now is None else now
+        report = {
+            "expired_threads": 0,
+            "deleted_checkpoints": 0,
+            "deleted_writes": 0,
+            "bytes_before": database_size(self.path),
+            "bytes_after": 0,
+            "bytes_reclaimed": 0,
+        }
+        if not os.path.exists(self.path):
+            return report
+
+        conn = self._connect()
+        try:
+            if self._has_tables(conn):
+                expired = self._expired_threads(conn, now)
+                report["expired_threads"] = len(expired)
+                for checkpoints, writes in (self._delete_threads(conn, expired), self._trim_threads(conn)):
+                    report["deleted_checkpoints"] += checkpoints
+                    report["deleted_writes"] += writes
+                self._compact(conn)
+        finally:
+            conn.close()
+
+        report["bytes_after"] = database_size(self.path)
+        report["bytes_reclaimed"] = max(0, report["bytes_before"] - report["bytes_after"])
+        return report
+
+    def start(self, interval: float = 3600, on_report=None) -> "RetentionJob":
+        """
+        在后台线程中每隔 interval 秒执行一次，返回可 stop() 的任务；后台任务不做 auto_vacuum 模式的转换
+        """
+        if self.convert_auto_vacuum:
+            raise ValueError("convert_auto_vacuum runs a full VACUUM and is only allowed for a single run()")
+        job = RetentionJob(self, interval, on_report)
+        job.start()
+        return job
+
+
+class RetentionJob(threading.Thread):
+    """
+    定期执行检查点保留策略的后台线程
+    """
+
+    def __init__(self, retention: CheckpointRetention, interval: float, on_report=None):
+        super().__init__(name="checkpoint-retention", daemon=True)
+        self.retention = retention
+        self.interval = interval
+        self.on_report = on_report
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.is_set():
+            try:
+                report = self.retention.run()
+                if self.on_report is not None:
+                    self.on_report(report)
+            except Exception:
+                # 数据库繁忙等错误留到下一轮处理，线程不能退出
+                logger.exception("checkpoint retention failed")
+            self._stopped.wait(self.interval)
+
+    def stop(self):
+        self._stopped.set()
+
+
+def _format_report(report: dict) -> str:
+    return (
+        f"expired threads: {report['expired_threads']}, "
+        f"deleted checkpoints: {report['deleted_checkpoints']}, "
+        f"deleted writes: {report['deleted_writes']}, "
+        f"size: {report['bytes_before']} -> {report['bytes_after']} bytes "
+        f"(reclaimed {report['bytes_reclaimed']})"
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Prune and compact checkpoints.sqlite")
+    parser.add_argument("--path", default="checkpoints.sqlite")
+    parser.add_argument("--keep-last", type=int, default=20, help="每个 thread 保留的检查点数，0 表示不裁剪")
+    parser.add_argument("--ttl-days", type=float, default=7, help="thread 空闲多少天后删除，0 表示不过期")
+    parser.add_argument("--interval", type=float, default=None, help="常驻运行时两次执行的间隔秒数")
+    parser.add_argument("--convert-auto-vacuum", action="store_true",
+                        help="把已有数据库转换为 auto_vacuum=INCREMENTAL（一次完整 VACUUM，只能单次运行时使用）")
+    args = parser.parse_args(argv)
+    if args.convert_auto_vacuum and args.interval is not None:
+        parser.error("--convert-auto-vacuum cannot be combined with --interval")
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    retention = CheckpointRetention(
+        args.path,
+        keep_last=args.keep_last or None,
+        thread_ttl=args.ttl_days * 24 * 3600 if args.ttl_days else None,
+        convert_auto_vacuum=args.convert_auto_vacuum,
+    )
+    if args.interval is None:
+        print(_format_report(retention.run()))
+        return 0
+    job = retention.start(args.interval, on_report=lambda report: print(_format_report(report)))
+    try:
+        while job.is_alive():
+            job.join(1)
+    except KeyboardInterrupt:
+        job.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,58 @@
+import threading
+import zlib
+from typing import Any
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+try:
+    import zstandard
+except ImportError:  # zstandard 是可选依赖，缺失时退回标准库 zlib
+    zstandard = None
+
+
+class CompactSerializer(JsonPlusSerializer):
+    """
+    紧凑的检查点序列化器：msgpack 编码，超过 min_size 字节时再压缩
+
+    写入的类型标记为 "msgpack+zstd" / "msgpack+zlib"，较小的值仍按 "msgpack" 原样存储。
+    读取时其它类型（msgpack、json、bytes）交给 JsonPlusSerializer，已有的检查点可以照常加载。
+    compression 为 "auto" 时安装了 zstandard 就用 zstd，否则用 zlib；为 None 时不压缩。
+    """
+
+    def __init__(self, compression="auto", level=3, min_size=1024):
+        super().__init__()
+        if compression == "auto":
+            compression = "zstd" if zstandard is not None else "zlib"
+        if compression not in ("zstd", "zlib", None):
+            raise ValueError(f"Unknown compression: {compression}")
+        if compression == "zstd" and zstandard is None:
+            raise ImportError("zstd compression requires the zstandard package")
+        self.compression = compression
+        self.level = level
+        self.min_size = min_size
+        # zstandard 的压缩/解压对象不能在线程间共享
+        self._local = threading.local()
+
+    def _zstd(self):
+        local = self._local
+        if not hasattr(local, "compressor"):
+            local.compressor = zstandard.ZstdCompressor(level=self.level)
+            local.decompressor = zstandard.ZstdDecompressor()
+        return local.compressor, local.decompressor
+
+    def dumps_typed(self, obj: Any) -> tuple[str, bytes]:
+        type_, data = super().dumps_typed(obj)
+        if self.compression is None or type_ != "msgpack" or len(data) < self.min_size:
+            return type_, data
+        if self.compression == "zstd":
+            return "msgpack+zstd", self._zstd()[0].compress(data)
+        return "msgpack+zlib", zlib.compress(data, self.level)
+
+    def loads_typed(self, data: tuple[str, bytes]) -> Any:
+        type_, data_ = data
+        if type_ == "msgpack+zstd":
+            if zstandard is None:
+                raise ImportError("Reading zstd compressed checkpoints requires the zstandard package")
+            return super().loads_typed(("msgpack", self._zstd()[1].decompress(data_)))
+        if type_ == "msgpack+zlib":
+            return super().loads_typed(("msgpack", zlib.decompress(data_)))
+        return super().loads_typed(data)
@@ -0,0 +1,576 @@
+import asyncio
+import sqlite3
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, Iterator, Optional, Sequence, Tuple
+import aiosqlite
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import ChannelVersions, Checkpoint, CheckpointMetadata, CheckpointTuple
+from langgraph.checkpoint.sqlite import SqliteSaver
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+from utils.checkpoint_index import INDEX_INSERT, INDEX_SCHEMA, find_query, index_row, oldest_query
+from utils.checkpoint_serde import CompactSerializer
+
+# 与 SqliteSaver.put 相同的写入语句，这里和索引行放在同一个事务中执行
+CHECKPOINT_INSERT = (
+    "INSERT OR REPLACE INTO checkpoints "
+    "(thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?)"
+)
+
+
+class SharedSqliteSaver(SqliteSaver):
+    """
+    进程内共享的 SQLite 检查点存储
+
+    同步调用（invoke/stream）使用同一个 sqlite3 连接；异步调用（ainvoke/astream）
+    转交给当前事件循环对应的 AsyncSqliteSaver（基于 aiosqlite，不阻塞事件循环）。
+    两者读写同一个 WAL 模式的数据库文件，同一个已编译的图既可以同步运行也可以异步运行。
+    每次写入检查点时在同一个事务中更新 checkpoint_index 旁路索引，find_checkpoint 可以按条件直接定位检查点。
+    """
+
+    def __init__(self, conn: sqlite3.Connection, path: str, *, serde=None):
+        super().__init__(conn, serde=serde)
+        self.path = path
+        self._async_savers = weakref.WeakKeyDictionary()
+
+    def setup(self) -> None:
+        # 由 cursor() 在持有连接锁时调用
+        if self.is_setup:
+            return
+        super().setup()
+        self.conn.executescript(INDEX_SCHEMA)
+
+    async def async_saver(self) -> AsyncSqliteSaver:
+        """
+        获取当前事件循环对应的 AsyncSqliteSaver，第一次使用时创建
+        """
+        loop = asyncio.get_running_loop()
+        saver = self._async_savers.get(loop)
+        if saver is None:
+            conn = await CheckpointerManager.aconnect(self.path)
+            await conn.executescript(INDEX_SCHEMA)
+            created = AsyncSqliteSaver(conn, serde=self.serde)
+            saver = self._async_savers.setdefault(loop, created)
+            if saver is not created:
+                await conn.close()
+        return saver
+
+    async def aclose(self):
+        """
+        关闭当前事件循环中的异步连接
+        """
+        saver = self._async_savers.pop(asyncio.get_running_loop(), None)
+        if saver is not None:
+            await saver.conn.close()
+
+    def find_checkpoint(self, config: RunnableConfig, message_count: Optional[int] = None,
+                        node: Optional[str] = None, tool_name: Optional[str] = None) -> Optional[RunnableConfig]:
+        """
+        在索引中查找 thread 内满足全部条件的最新检查点，返回可传给 get_state 的配置
+        """
+        with self.cursor(transaction=False) as cur:
+            row = cur.execute(*find_query(config, message_count, node, tool_name)).fetchone()
+        if row is None:
+            return None
+        return {
+            "configurable": {
+                "thread_id": str(config["configurable"]["thread_id"]),
+                "checkpoint_ns": config["configurable"].get("checkpoint_ns", ""),
+                "checkpoint_id": row[0],
+            }
+        }
+
+    def oldest_indexed(self, config: RunnableConfig) -> Optional[RunnableConfig]:
+        """
+        thread 中最早被索引的检查点；更早的检查点不在索引中，只能逐个检查
+        """
+        with self.cursor(transaction=False) as cur:
+            row = cur.execute(*oldest_query(config)).fetchone()
+        if row is None or row[0] is None:
+            return None
+        return {
+            "configurable": {
+                "thread_id": str(config["configurable"]["thread_id"]),
+                "checkpoint_ns": config["configurable"].get("checkpoint_ns", ""),
+                "checkpoint_id": row[0],
+            }
+        }
+
+    def _checkpoint_params(self, config: RunnableConfig, checkpoint: Checkpoint,
+                           metadata: CheckpointMetadata) -> tuple:
+        type_, serialized_checkpoint = self.serde.dumps_typed(checkpoint)
+        return (
+            str(config["configurable"]["thread_id"]),
+            config["configurable"].get("checkpoint_ns", ""),
+            checkpoint["id"],
+            config["configurable"].get("checkpoint_id"),
+            type_,
+            serialized_checkpoint,
+            self.jsonplus_serde.dumps(metadata),
+        )
+
+    @staticmethod
+    def _next_config(config: RunnableConfig, checkpoint: Checkpoint) -> RunnableConfig:
+        return {
+            "configurable": {
+                "thread_id": config["configurable"]["thread_id"],
+                "checkpoint_ns": config["configurable"].get("checkpoint_ns", ""),
+                "checkpoint_id": checkpoint["id"],
+            }
+        }
+
+    def _write_checkpoint(self, config: RunnableConfig, checkpoint: Checkpoint,
+                          metadata: CheckpointMetadata, row: tuple) -> RunnableConfig:
+        """
+        在同一个事务中写入检查点和它的索引行，任一条失败时都回滚
+        """
+        params = self._checkpoint_params(config, checkpoint, metadata)
+        with self.lock:
+            self.setup()
+            with self.conn:
+                self.conn.execute(CHECKPOINT_INSERT, params)
+                self.conn.execute(INDEX_INSERT, row)
+        return self._next_config(config, checkpoint)
+
+    async def _awrite_checkpoint(self, config: RunnableConfig, checkpoint: Checkpoint,
+                                 metadata: CheckpointMetadata, row: tuple) -> RunnableConfig:
+        """
+        _write_checkpoint 的异步版本，使用当前事件循环的连接
+        """
+        params = self._checkpoint_params(config, checkpoint, metadata)
+        saver = await self.async_saver()
+        await saver.setup()
+        async with saver.lock:
+            try:
+                await saver.conn.execute(CHECKPOINT_INSERT, params)
+                await saver.conn.execute(INDEX_INSERT, row)
+            except BaseException:
+                await saver.conn.rollback()
+                raise
+            await saver.conn.commit()
+        return self._next_config(config, checkpoint)
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        return self._write_checkpoint(config, checkpoint, metadata, index_row(config, checkpoint, metadata))
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await (await self.async_saver()).aget_tuple(config)
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        saver = await self.async_saver()
+        async for item in saver.alist(config, filter=filter, before=before, limit=limit):
+            yield item
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        return await self._awrite_checkpoint(config, checkpoint, metadata, index_row(config, checkpoint, metadata))
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+    ) -> None:
+        await (await self.async_saver()).aput_writes(config, writes, task_id)
+
+
+# 增量编码的 channel 值：{"__delta__": 与父检查点共同前缀的长度, "tail": 之后的元素}
+_DELTA_MARKER = "__delta__"
+# 写入元数据，记录检查点与最近一次完整快照的距离（0 表示完整快照）
+DELTA_DEPTH_KEY = "delta_depth"
+
+# 沿 parent 链取出重建所需的检查点，遇到完整快照为止
+_CHAIN_QUERY = f"""
+WITH RECURSIVE chain(checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata, n) AS (
+    SELECT checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata, 0 FROM checkpoints
+    WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?
+    UNION ALL
+    SELECT c.checkpoint_id, c.parent_checkpoint_id, c.type, c.checkpoint, c.metadata, chain.n + 1
+    FROM checkpoints c JOIN chain ON c.checkpoint_id = chain.parent_checkpoint_id
+    WHERE c.thread_id = ? AND c.checkpoint_ns = ? AND chain.n < ?
+      AND json_extract(CAST(chain.metadata AS TEXT), '$.{DELTA_DEPTH_KEY}') > 0
+)
+SELECT checkpoint_id, type, checkpoint FROM chain ORDER BY n
+"""
+
+
+class DeltaSqliteSaver(SharedSqliteSaver):
+    """
+    增量保存列表型 channel（默认 messages）的检查点存储
+
+    messages 使用 add_messages 累加，每个检查点都会完整保存一遍对话历史，存储量随对话长度平方增长。
+    这里每个检查点只保存相对父检查点新增或改动的消息（共同前缀长度 + 之后的消息），
+    dialog_state、user_info 等其它 channel 照常保存，读取时沿 parent 链重建完整状态。
+    每 snapshot_every 步保存一次完整快照，重建最多回溯 snapshot_every 个检查点；
+    最近用到的完整值缓存在内存中，连续对话时写入和读取都不需要回溯。
+    不含增量标记的检查点（包括之前写入的）按原样读取。
+    """
+
+    def __init__(self, conn: sqlite3.Connection, path: str, *, serde=None,
+                 delta_channels=("messages",), snapshot_every=20, cache_size=128):
+        super().__init__(conn, path, serde=serde)
+        self.delta_channels = tuple(delta_channels)
+        self.snapshot_every = snapshot_every
+        self.cache_size = cache_size
+        # (thread_id, checkpoint_ns, checkpoint_id) -> (delta_depth, {channel: 完整列表})
+        self._full = OrderedDict()
+        self._full_lock = threading.Lock()
+
+    def _cache_get(self, key):
+        with self._full_lock:
+            entry = self._full.get(key)
+            if entry is not None:
+                self._full.move_to_end(key)
+            return entry
+
+    def _cache_put(self, key, entry):
+        with self._full_lock:
+            self._full[key] = entry
+            self._full.move_to_end(key)
+            while len(self._full) > self.cache_size:
+                self._full.popitem(last=False)
+
+    @staticmethod
+    def _key(config: RunnableConfig, checkpoint_id=None):
+        configurable = config["configurable"]
+        checkpoint_id = checkpoint_id or configurable.get("checkpoint_id")
+        if checkpoint_id is None:
+            return None
+        return str(configurable["thread_id"]), configurable.get("checkpoint_ns", ""), checkpoint_id
+
+    @staticmethod
+    def _common_prefix(base: list, values: list) -> int:
+        n = min(len(base), len(values))
+        for i in range(n):
+            if base[i] is not values[i] and base[i] != values[i]:
+                return i
+        return n
+
+    def _apply(self, channel_values: dict, parent_entry) -> tuple:
+        """
+        由检查点中保存的 channel 值和父检查点的完整值得到本检查点的 (depth, 完整值)
+        """
+        depth, full = 0, {}
+        for channel in self.delta_channels:
+            value = channel_values.get(channel)
+            if isinstance(value, dict) and _DELTA_MARKER in value:
+                if parent_entry is None or channel not in parent_entry[1]:
+                    raise ValueError(f"Base checkpoint for delta-encoded channel '{channel}' is missing")
+                full[channel] = parent_entry[1][channel][:value[_DELTA_MARKER]] + value["tail"]
+                depth = parent_entry[0] + 1
+            elif isinstance(value, list):
+                full[channel] = value
+        return depth, full
+
+    def _resolve(self, thread_id: str, checkpoint_ns: str, rows) -> Optional[tuple]:
+        """
+        rows 为 _CHAIN_QUERY 的结果（从目标检查点往前），返回目标检查点的 (depth, 完整值)
+        """
+        pending, entry = [], None
+        for checkpoint_id, type_, blob in rows:
+            key = (thread_id, checkpoint_ns, checkpoint_id)
+            entry = self._cache_get(key)
+            if entry is not None:
+                break
+            pending.append((key, self.serde.loads_typed((type_, blob))["channel_values"]))
+        for key, channel_values in reversed(pending):
+            entry = self._apply(channel_values, entry)
+            self._cache_put(key, entry)
+        return entry
+
+    def _chain_params(self, key) -> tuple:
+        return (*key, key[0], key[1], self.snapshot_every)
+
+    def _entry(self, key) -> Optional[tuple]:
+        if key is None:
+            return None
+        entry = self._cache_get(key)
+        if entry is None:
+            with self.cursor(transaction=False) as cur:
+                rows = cur.execute(_CHAIN_QUERY, self._chain_params(key)).fetchall()
+            entry = self._resolve(key[0], key[1], rows)
+        return entry
+
+    async def _aentry(self, key) -> Optional[tuple]:
+        if key is None:
+            return None
+        entry = self._cache_get(key)
+        if entry is None:
+            saver = await self.async_saver()
+            await saver.setup()
+            async with saver.lock, saver.conn.execute(_CHAIN_QUERY, self._chain_params(key)) as cur:
+                rows = await cur.fetchall()
+            entry = self._resolve(key[0], key[1], rows)
+        return entry
+
+    def _encode(self, checkpoint: Checkpoint, metadata: CheckpointMetadata, parent_entry) -> tuple:
+        """
+        返回要写入的检查点、元数据，以及本检查点的 (depth, 完整值)
+        """
+        depth, full = self._apply(checkpoint["channel_values"], None)
+        channel_values = dict(checkpoint["channel_values"])
+        if parent_entry is not None and parent_entry[0] + 1 < self.snapshot_every:
+            for channel, values in full.items():
+                base = parent_entry[1].get(channel)
+                prefix = 0 if base is None else self._common_prefix(base, values)
+                if prefix:
+                    channel_values[channel] = {_DELTA_MARKER: prefix, "tail": values[prefix:]}
+                    depth = parent_entry[0] + 1
+        full = {channel: list(values) for channel, values in full.items()}
+        return (
+            {**checkpoint, "channel_values": channel_values},
+            {**metadata, DELTA_DEPTH_KEY: depth},
+            (depth, full),
+        )
+
+    def _decode(self, checkpoint_tuple: Optional[CheckpointTuple], parent_entry) -> Optional[CheckpointTuple]:
+        if checkpoint_tuple is None:
+            return None
+        checkpoint = checkpoint_tuple.checkpoint
+        entry = self._apply(checkpoint["channel_values"], parent_entry)
+        self._cache_put(self._key(checkpoint_tuple.config, checkpoint["id"]), entry)
+        metadata = {k: v for k, v in checkpoint_tuple.metadata.items() if k != DELTA_DEPTH_KEY}
+        return checkpoint_tuple._replace(
+            checkpoint={**checkpoint, "channel_values": {**checkpoint["channel_values"], **entry[1]}},
+            metadata=metadata,
+        )
+
+    def _parent_key(self, checkpoint_tuple: Optional[CheckpointTuple]):
+        if checkpoint_tuple is None or checkpoint_tuple.parent_config is None:
+            return None
+        channel_values = checkpoint_tuple.checkpoint["channel_values"]
+        if not any(
+            isinstance(channel_values.get(channel), dict) and _DELTA_MARKER in channel_values[channel]
+            for channel in self.delta_channels
+        ):
+            return None
+        return self._key(checkpoint_tuple.parent_config)
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        checkpoint_tuple = super().get_tuple(config)
+        return self._decode(checkpoint_tuple, self._entry(self._parent_key(checkpoint_tuple)))
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        # SqliteSaver.list 在迭代期间持有连接锁，先取完再解码；从旧到新解码，父检查点总在缓存中
+        checkpoint_tuples = list(super().list(config, filter=filter, before=before, limit=limit))
+        decoded = [
+            self._decode(checkpoint_tuple, self._entry(self._parent_key(checkpoint_tuple)))
+            for checkpoint_tuple in reversed(checkpoint_tuples)
+        ]
+        yield from reversed(decoded)
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        # 索引行按完整值计算，父检查点的完整值在加锁写入之前取得
+        row = index_row(config, checkpoint, metadata)
+        checkpoint, metadata, entry = self._encode(checkpoint, metadata, self._entry(self._key(config)))
+        next_config = self._write_checkpoint(config, checkpoint, metadata, row)
+        self._cache_put(self._key(next_config), entry)
+        return next_config
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        checkpoint_tuple = await super().aget_tuple(config)
+        return self._decode(checkpoint_tuple, await self._aentry(self._parent_key(checkpoint_tuple)))
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        checkpoint_tuples = [
+            checkpoint_tuple
+            async for checkpoint_tuple in super().alist(config, filter=filter, before=before, limit=limit)
+        ]
+        decoded = [
+            self._decode(checkpoint_tuple, await self._aentry(self._parent_key(checkpoint_tuple)))
+            for checkpoint_tuple in reversed(checkpoint_tuples)
+        ]
+        for checkpoint_tuple in reversed(decoded):
+            yield checkpoint_tuple
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        row = index_row(config, checkpoint, metadata)
+        checkpoint, metadata, entry = self._encode(checkpoint, metadata, await self._aentry(self._key(config)))
+        next_config = await self._awrite_checkpoint(config, checkpoint, metadata, row)
+        self._cache_put(self._key(next_config), entry)
+        return next_config
+
+
+class CheckpointerManager:
+    """
+    每个进程一个的检查点存储
+
+    所有 GraphBuilder 共用同一个 SharedSqliteSaver，避免每次构建图都打开新连接；
+    连接使用 WAL 日志、synchronous=NORMAL 和 busy timeout，多个会话并发写入时不会互相阻塞读。
+    检查点默认用 CompactSerializer 序列化（msgpack + 压缩），仍能读取之前写入的检查点。
+    delta_channels 非空时使用 DeltaSqliteSaver 增量保存这些 channel，设为空元组则每步保存完整状态。
+    """
+
+    path = "checkpoints.sqlite"
+    busy_timeout_ms = 5000
+    synchronous = "NORMAL"
+    serde = CompactSerializer()
+    delta_channels = ("messages",)
+    snapshot_every = 20
+
+    _lock = threading.Lock()
+    _saver = None
+
+    @staticmethod
+    def configure(path=None, busy_timeout_ms=None, synchronous=None, serde=None,
+                  delta_channels=None, snapshot_every=None):
+        """
+        调整检查点数据库的路径和参数
+
+        已创建的检查点存储会被关闭，下次 get_saver 时按新参数创建。
+        """
+        with CheckpointerManager._lock:
+            if path is not None:
+                CheckpointerManager.path = path
+            if busy_timeout_ms is not None:
+                CheckpointerManager.busy_timeout_ms = busy_timeout_ms
+            if synchronous is not None:
+                CheckpointerManager.synchronous = synchronous
+            if serde is not None:
+                CheckpointerManager.serde = serde
+            if delta_channels is not None:
+                CheckpointerManager.delta_channels = tuple(delta_channels)
+            if snapshot_every is not None:
+                CheckpointerManager.snapshot_every = snapshot_every
+            CheckpointerManager._close_locked()
+
+    @staticmethod
+    def pragmas():
+        """
+        新建连接时执行的 PRAGMA 语句
+        """
+        return [
+            # 只对新建的数据库生效，保留策略可以直接用增量 VACUUM 回收空间（已有数据库见 checkpoint_retention）
+            "PRAGMA auto_vacuum = INCREMENTAL",
+            "PRAGMA journal_mode = WAL",
+            f"PRAGMA synchronous = {CheckpointerManager.synchronous}",
+            f"PRAGMA busy_timeout = {int(CheckpointerManager.busy_timeout_ms)}",
+        ]
+
+    @staticmethod
+    def connect(path: str) -> sqlite3.Connection:
+        """
+        打开按检查点参数配置的同步连接
+        """
+        conn = sqlite3.connect(
+            path,
+            check_same_thread=False,
+            timeout=CheckpointerManager.busy_timeout_ms / 1000,
+        )
+        for pragma in CheckpointerManager.pragmas():
+            conn.execute(pragma)
+        return conn
+
+    @staticmethod
+    async def aconnect(path: str) -> aiosqlite.Connection:
+        """
+        打开按检查点参数配置的异步连接
+        """
+        conn = aiosqlite.connect(path, timeout=CheckpointerManager.busy_timeout_ms / 1000)
+        # 长连接的工作线程不能阻止进程退出
+        conn.daemon = True
+        await conn
+        for pragma in CheckpointerManager.pragmas():
+            await conn.execute(pragma)
+        return conn
+
+    @staticmethod
+    def get_saver() -> SharedSqliteSaver:
+        """
+        获取进程内共享的检查点存储
+        """
+        with CheckpointerManager._lock:
+            if CheckpointerManager._saver is None:
+                path = CheckpointerManager.path
+                conn = CheckpointerManager.connect(path)
+                if CheckpointerManager.delta_channels:
+                    CheckpointerManager._saver = DeltaSqliteSaver(
+                        conn,
+                        path,
+                        serde=CheckpointerManager.serde,
+                        delta_channels=CheckpointerManager.delta_channels,
+                        snapshot_every=CheckpointerManager.snapshot_every,
+                    )
+                else:
+                    CheckpointerManager._saver = SharedSqliteSaver(conn, path, serde=CheckpointerManager.serde)
+            return CheckpointerManager._saver
+
+    @staticmethod
+    async def aget_saver() -> AsyncSqliteSaver:
+        """
+        获取当前事件循环中共享检查点存储的异步实现
+        """
+        return await CheckpointerManager.get_saver().async_saver()
+
+    @staticmethod
+    def start_retention(interval=3600, **kwargs):
+        """
+        在后台线程中对检查点数据库定期执行保留策略（参数见 CheckpointRetention）
+
+        后台任务只执行增量 VACUUM，不做 auto_vacuum 模式的转换（需要时用命令行的 --convert-auto-vacuum）。
+        """
+        from utils.checkpoint_retention import CheckpointRetention
+
+        return CheckpointRetention(CheckpointerManager.path, **kwargs).start(interval)
+
+    @staticmethod
+    def _close_locked():
+        saver = CheckpointerManager._saver
+        CheckpointerManager._saver = None
+        if saver is not None:
+            with saver.lock:
+                saver.conn.close()
+
+    @staticmethod
+    def close_all():
+        """
+        关闭共享的同步连接（异步连接在各自事件循环中通过 saver.aclose() 关闭）
+        """
+        with CheckpointerManager._lock:
+            CheckpointerManager._close_locked()
@@ -0,0 +1,280 @@
+"""
+有界的对话记忆
+
+State.messages 通过 add_messages 只增不减，每个助手都把完整历史连同系统提示发给 LLM。
+summarize_conversation 节点在每轮用户输入进入助手之前检查历史的 token 数，超过
+ConversationMemory.max_tokens 时把较早的若干轮折叠进滚动摘要（State.conversation_summary），
+并用 RemoveMessage 从 messages 中删除；最近的若干轮原样保留。
+切分点总在用户消息处，且保证保留部分中的每条 ToolMessage 都能找到发起调用的 AIMessage。
+助手调用 LLM 前用 with_summary 把摘要作为系统消息放在对话前面。
+"""
+import threading
+from typing import Optional
+from langchain_core.messages import (
+    AIMessage,
+    BaseMessage,
+    HumanMessage,
+    RemoveMessage,
+    SystemMessage,
+    ToolMessage,
+)
+from langchain_core.runnables import RunnableConfig, RunnableLambda
+
+# 无法加载 tiktoken 编码（例如离线环境）时按 4 个字符一个 token 估算
+_CHARS_PER_TOKEN = 4
+# 每条消息的角色、分隔符等固定开销
+_TOKENS_PER_MESSAGE = 4
+# 摘要输入中单条消息的最大字符数，避免整表查询结果撑大摘要请求
+_TRANSCRIPT_CHARS_PER_MESSAGE = 2000
+
+_SUMMARY_PROMPT = (
+    "You maintain the running memory of a customer support conversation for Swiss Airlines. "
+    "Update the summary with the new conversation excerpt. Keep every fact the assistants may still need: "
+    "the user's identity and requests, ticket numbers, flight, hotel, car rental and excursion ids, "
+    "dates, prices, bookings made or cancelled, and open questions. "
+    "Drop greetings, repetition and raw search results that were not acted upon. "
+    "Answer with the updated summary only, in at most {max_words} words."
+)
+
+_encoding = None
+
+
+def _encode_length(text: str) -> int:
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _encoding = False
+    if _encoding is False:
+        return (len(text) + _CHARS_PER_TOKEN - 1) // _CHARS_PER_TOKEN
+    return len(_encoding.encode(text, disallowed_special=()))
+
+
+def _content_text(message: BaseMessage) -> str:
+    if isinstance(message.content, str):
+        return message.content
+    return " ".join(
+        block.get("text", "") if isinstance(block, dict) else str(block) for block in message.content
+    )
+
+
+def count_tokens(messages: list) -> int:
+    """
+    估算消息列表发给 LLM 时占用的 token 数（内容、工具调用参数和每条消息的固定开销）
+    """
+    total = 0
+    for message in messages:
+        total += _TOKENS_PER_MESSAGE + _encode_length(_content_text(message))
+        for call in getattr(message, "tool_calls", None) or []:
+            total += _encode_length(f"{call['name']}{call['args']}")
+    return total
+
+
+def split_point(messages: list, keep_tokens: int) -> int:
+    """
+    返回保留部分的起始下标
+
+    从最后一轮开始按整轮向前累加，直到超出 keep_tokens（最后一轮总是保留）。
+    一轮从一条用户消息开始；保留部分中的 ToolMessage 必须都能在保留部分中找到对应的工具调用。
+    没有可折叠的部分时返回 0。
+    """
+    cut = 0
+    kept = 0
+    calls = set()
+    answered = set()
+    end = len(messages)
+    for index in range(len(messages) - 1, -1, -1):
+        message = messages[index]
+        if isinstance(message, ToolMessage):
+            answered.add(message.tool_call_id)
+        elif isinstance(message, AIMessage):
+            calls.update(call["id"] for call in message.tool_calls)
+        if not isinstance(message, HumanMessage) or not answered <= calls:
+            continue
+        tokens = count_tokens(messages[index:end])
+        if cut and kept + tokens > keep_tokens:
+            break
+        cut, kept, end = index, kept + tokens, index
+    return cut
+
+
+def _transcript(messages: list) -> str:
+    lines = []
+    for message in messages:
+        text = _content_text(message)
+        if len(text) > _TRANSCRIPT_CHARS_PER_MESSAGE:
+            text = text[:_TRANSCRIPT_CHARS_PER_MESSAGE] + " ... (truncated)"
+        if isinstance(message, HumanMessage):
+            lines.append(f"User: {text}")
+        elif isinstance(message, ToolMessage):
+            lines.append(f"Tool result: {text}")
+        elif isinstance(message, AIMessage):
+            calls = "; ".join(f"{call['name']}({call['args']})" for call in message.tool_calls)
+            lines.append(f"Assistant: {text}" + (f" [calls {calls}]" if calls else ""))
+        else:
+            lines.append(f"{message.type}: {text}")
+    return "\n".join(lines)
+
+
+def with_summary(state: dict) -> dict:
+    """
+    把滚动摘要作为系统消息放在对话前面，返回给助手使用的状态；没有摘要时原样返回
+    """
+    summary = state.get("conversation_summary")
+    if not summary:
+        return state
+    memory = SystemMessage(content=f"Summary of the earlier conversation:\n{summary}")
+    return {**state, "messages": [memory] + list(state["messages"])}
+
+
+class ConversationMemory:
+    """
+    对话记忆的阈值和统计
+
+    max_tokens 为触发摘要的历史 token 数（含已有摘要），keep_tokens 为原样保留的最近若干轮的
+    token 上限，summary_words 限制摘要长度。每轮记录发给助手的历史 token 数和相对完整历史节省的 token 数。
+    """
+
+    enabled = True
+    max_tokens = 6000
+    keep_tokens = 2000
+    summary_words = 300
+
+    _lock = threading.Lock()
+    turns = 0
+    summarizations = 0
+    prompt_tokens = 0
+    saved_tokens = 0
+    last_turn = None
+
+    @staticmethod
+    def configure(enabled: Optional[bool] = None, max_tokens: Optional[int] = None,
+                  keep_tokens: Optional[int] = None, summary_words: Optional[int] = None):
+        """
+        调整开关和阈值，之后的轮次生效
+        """
+        with ConversationMemory._lock:
+            if enabled is not None:
+                ConversationMemory.enabled = enabled
+            if max_tokens is not None:
+                ConversationMemory.max_tokens = max_tokens
+            if keep_tokens is not None:
+                ConversationMemory.keep_tokens = keep_tokens
+            if summary_words is not None:
+                ConversationMemory.summary_words = summary_words
+
+    @staticmethod
+    def record(turn: dict):
+        with ConversationMemory._lock:
+            ConversationMemory.turns += 1
+            ConversationMemory.summarizations += turn["summarized"]
+            ConversationMemory.prompt_tokens += turn["history_tokens"]
+            ConversationMemory.saved_tokens += turn["saved_tokens"]
+            ConversationMemory.last_turn = turn
+
+    @staticmethod
+    def clear():
+        """
+        清空统计
+        """
+        with ConversationMemory._lock:
+            ConversationMemory.turns = ConversationMemory.summarizations = 0
+            ConversationMemory.prompt_tokens = ConversationMemory.saved_tokens = 0
+            ConversationMemory.last_turn = None
+
+    @staticmethod
+    def stats() -> dict:
+        """
+        轮数、摘要次数、历史 token 总数、节省的 token 总数、平均每轮节省的 token 数和最近一轮的明细
+        """
+        with ConversationMemory._lock:
+            turns = ConversationMemory.turns
+            return {
+                "turns": turns,
+                "summarizations": ConversationMemory.summarizations,
+                "prompt_tokens": ConversationMemory.prompt_tokens,
+                "saved_tokens": ConversationMemory.saved_tokens,
+                "saved_per_turn": ConversationMemory.saved_tokens / turns if turns else 0.0,
+                "last_turn": ConversationMemory.last_turn,
+            }
+
+
+def summary_messages(summary: str, folded: list) -> list:
+    """
+    摘要请求的消息：说明和（已有摘要加上）被折叠部分的对话记录
+    """
+    instructions = _SUMMARY_PROMPT.format(max_words=ConversationMemory.summary_words)
+    excerpt = _transcript(folded)
+    if summary:
+        excerpt = f"Current summary:\n{summary}\n\nNew conversation excerpt:\n{excerpt}"
+    return [SystemMessage(content=instructions), HumanMessage(content=excerpt)]
+
+
+def _plan(state: dict) -> int:
+    """
+    需要摘要时返回保留部分的起始下标，否则返回 0
+    """
+    messages = state.get("messages") or []
+    summary = state.get("conversation_summary") or ""
+    if not ConversationMemory.enabled:
+        return 0
+    tokens = count_tokens(messages) + (_encode_length(summary) if summary else 0)
+    if tokens <= ConversationMemory.max_tokens:
+        return 0
+    return split_point(messages, ConversationMemory.keep_tokens)
+
+
+def _update(state: dict, cut: int, summary: Optional[str]) -> dict:
+    messages = state.get("messages") or []
+    folded_tokens = state.get("summarized_tokens") or 0
+    if cut:
+        folded_tokens += count_tokens(messages[:cut])
+        update = {
+            "messages": [RemoveMessage(id=message.id) for message in messages[:cut]],
+            "conversation_summary": summary,
+            "summarized_tokens": folded_tokens,
+        }
+        messages = messages[cut:]
+    else:
+        # 节点必须至少写入一个状态键
+        update = {"summarized_tokens": folded_tokens}
+        summary = state.get("conversation_summary") or ""
+    history_tokens = count_tokens(messages) + (_encode_length(summary) if summary else 0)
+    # 相对于不做摘要时的完整历史：被折叠消息的 token 数减去摘要本身的 token 数
+    saved = folded_tokens - (_encode_length(summary) if summary else 0)
+    ConversationMemory.record({
+        "summarized": bool(cut),
+        "folded_messages": cut,
+        "history_tokens": history_tokens,
+        "full_history_tokens": history_tokens + saved,
+        "saved_tokens": saved,
+    })
+    return update
+
+
+def create_summarize_node(llm) -> RunnableLambda:
+    """
+    创建 summarize_conversation 节点，使用 llm（不绑定工具）生成摘要，同时提供同步和异步实现
+    """
+    # 摘要请求不使用本次运行的回调，流式回调（如 StreamHandler）不会把摘要显示给用户
+    summary_config = {"callbacks": [], "run_name": "summarize_conversation"}
+
+    def summarize(state: dict, config: RunnableConfig) -> dict:
+        cut = _plan(state)
+        if not cut:
+            return _update(state, 0, None)
+        messages = summary_messages(state.get("conversation_summary") or "", state["messages"][:cut])
+        summary = _content_text(llm.invoke(messages, summary_config))
+        return _update(state, cut, summary)
+
+    async def asummarize(state: dict, config: RunnableConfig) -> dict:
+        cut = _plan(state)
+        if not cut:
+            return _update(state, 0, None)
+        messages = summary_messages(state.get("conversation_summary") or "", state["messages"][:cut])
+        summary = _content_text(await llm.ainvoke(messages, summary_config))
+        return _update(state, cut, summary)
+
+    return RunnableLambda(summarize, asummarize, name="summarize_conversation")
@@ -1,33 +1,99 @@
-def process_graph_and_select_state(graph, config, message_limit=6):
+def iter_state_history(graph, config, before=None, page_size=10):
     """
-    Process the graph's state history, print details, and select a specific state 
-    based on the number of messages.
+    Lazily iterate over the graph's state history, newest first.
+
+    Snapshots are fetched `page_size` at a time, so callers that stop early
+    never deserialize the rest of the history.
+
+    :param graph: The compiled graph (or a binding of it) with a checkpointer.
+    :param config: The configuration object identifying the thread.
+    :param before: Only return snapshots older than this checkpoint config.
+    :param page_size: The number of snapshots fetched per page.
+    :return: An iterator of state snapshots.
+    """
+    while True:
+        page = list(graph.get_state_history(config, before=before, limit=page_size))
+        yield from page
+        if len(page) < page_size:
+            return
+        before = page[-1].config
+
+
+def _last_tool_call(state):
+    messages = state.values.get("messages") or []
+    tool_calls = getattr(messages[-1], "tool_calls", None) if messages else None
+    return tool_calls[0] if tool_calls else None
+
+
+def _state_matches(state, message_count=None, node=None, tool_name=None):
+    if message_count is not None and len(state.values.get("messages") or []) != message_count:
+        return False
+    if node is not None and node not in ((state.metadata or {}).get("writes") or {}):
+        return False
+    if tool_name is not None:
+        tool_call = _last_tool_call(state)
+        if tool_call is None or tool_call["name"] != tool_name:
+            return False
+    return True
+
+
+def select_state(graph, config, message_count=None, node=None, tool_name=None, page_size=10):
+    """
+    Select the newest state in the thread matching all of the given criteria.
+
+    When the graph's checkpointer keeps a checkpoint index (SharedSqliteSaver),
+    the checkpoint is looked up directly; only checkpoints written before the
+    index existed are scanned page by page.
+
+    :param graph: The compiled graph (or a binding of it) with a checkpointer.
+    :param config: The configuration object identifying the thread.
+    :param message_count: The number of messages the state must hold.
+    :param node: The node that produced the state.
+    :param tool_name: The tool called by the state's last message.
+    :param page_size: The number of snapshots fetched per page when scanning.
+    :return: The selected state snapshot, which can be replayed by invoking the
+        graph with its `config`, or None if no state matches.
+    """
+    before = None
+    checkpointer = getattr(graph, "checkpointer", None)
+    if hasattr(checkpointer, "find_checkpoint"):
+        found = checkpointer.find_checkpoint(
+            config, message_count=message_count, node=node, tool_name=tool_name
+        )
+        if found is not None:
+            return graph.get_state(found)
+        before = checkpointer.oldest_indexed(config)
+
+    for state in iter_state_history(graph, config, before=before, page_size=page_size):
+        if _state_matches(state, message_count, node, tool_name):
+            return state
+    return None
+
+
+def process_graph_and_select_state(graph, config, message_limit=6, verbose=True):
+    """
+    Walk the graph's state history newest first, print details, and select the
+    first state with the given number of messages.
 
     :param graph: The input graph containing state history.
     :param config: The configuration object used to fetch state history.
     :param message_limit: The number of messages to use as the selection criterion.
+    :param verbose: Whether to print each visited state.
     :return: The selected state if found, otherwise None.
     """
-    to_replay = None  # Initialize the selected state as None
-    
-    for state in graph.get_state_history(config):
-        messages_length = len(state.values["messages"])
-        message = ''
-        
-        # Check if there are any messages in the state
-        if messages_length > 0:
-            last_message = state.values["messages"][messages_length - 1]
-            
-            # Safely access attributes using getattr
-            if getattr(last_message, "tool_calls", None):
-                message = f'tool_name: [{last_message.tool_calls[0]["name"]}] args: {last_message.tool_calls[0]["args"]}'
-        
-        # Print the state details
-        print(messages_length, " Next: ", state.next, message)
-        print("-" * 80)
-        
-        # Select the state based on the message limit
+    for state in iter_state_history(graph, config):
+        messages_length = len(state.values.get("messages") or [])
+
+        if verbose:
+            message = ''
+            tool_call = _last_tool_call(state)
+            if tool_call is not None:
+                message = f'tool_name: [{tool_call["name"]}] args: {tool_call["args"]}'
+            print(messages_length, " Next: ", state.next, message)
+            print("-" * 80)
+
+        # Stop at the first state matching the message limit
         if messages_length == message_limit:
-            to_replay = state
+            return state
 
     return None
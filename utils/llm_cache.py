@@ -0,0 +1,414 @@
+"""
+持久化的 LLM 回复缓存
+
+CachedChatModel 包装图中使用的聊天模型（AzureChatOpenAI）。缓存键由规范化的消息（忽略消息 id、
+tool_call_id，以及系统提示中每次启动都不同的当前时间）、绑定的工具定义和调用参数、以及模型参数计算，
+回复用 CompactSerializer 序列化后存入 SQLite，按 TTL、条数和总字节数淘汰。
+
+模式（默认 off，可由 config.LLM_CACHE_MODE 或 LLMCacheManager.configure 设置）：
+- cache：命中时直接返回，未命中时调用模型并写入缓存；调用敏感工具（no_store_tools，
+  如 cancel_ticket、book_hotel）的回复不写入，这类写操作的决定总是由模型重新做出
+- record：总是调用模型并覆盖缓存（录制回归用例）
+- replay：只读缓存，未命中时抛出 ReplayMiss，不会调用模型
+- off：不使用缓存
+
+命中时把回复按词切分为流式片段依次发出，StreamHandler.on_llm_new_token 仍能逐段收到内容。
+
+缓存文件默认是当前工作目录下的 llm_cache.sqlite（config.LLM_CACHE_PATH 可改为其它路径），
+其中保存完整的回复，包括乘客信息等对话内容，应与检查点数据库同样对待。
+"""
+import asyncio
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Iterable, Iterator, Optional
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from utils.chat_messages import message_chunks
+from utils.checkpoint_serde import CompactSerializer
+from utils.replay import ReplayMiss
+
+MODES = ("cache", "record", "replay", "off")
+
+# 系统提示中的 "Current time: {time}." 每次构建提示时不同，不参与缓存键
+DEFAULT_IGNORE_PATTERNS = (r"Current time: [^\n]*?\.(?=\s|$)",)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS llm_cache (
+    key TEXT PRIMARY KEY,
+    type TEXT NOT NULL,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    last_used REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS llm_cache_last_used ON llm_cache (last_used);
+"""
+
+# 按最近使用时间从新到旧保留，超出条数或总字节数的条目被删除
+_EVICT_QUERY = """
+DELETE FROM llm_cache WHERE key IN (
+    SELECT key FROM (
+        SELECT key,
+               ROW_NUMBER() OVER (ORDER BY last_used DESC) AS position,
+               SUM(size) OVER (ORDER BY last_used DESC ROWS UNBOUNDED PRECEDING) AS total
+        FROM llm_cache
+    ) WHERE position > ? OR total > ?
+)
+"""
+
+
+class LLMResponseCache:
+    """
+    SQLite 中的 LLM 回复缓存
+
+    ttl 为条目的有效期（秒，None 表示不过期）；max_entries、max_bytes 为条数和总字节数上限，
+    每写入 evict_every 条执行一次淘汰。ignore_patterns 中的正则匹配到的文本在计算缓存键前被去掉。
+    """
+
+    def __init__(self, path="llm_cache.sqlite", ttl: Optional[float] = 7 * 24 * 3600, max_entries=10000,
+                 max_bytes=256 * 1024 * 1024, evict_every=100, ignore_patterns=DEFAULT_IGNORE_PATTERNS):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.evict_every = evict_every
+        self.ignore_patterns = [re.compile(pattern) for pattern in ignore_patterns]
+        self.serde = CompactSerializer()
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.execute("PRAGMA synchronous = NORMAL")
+        self.conn.executescript(_SCHEMA)
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _normalize(self, text: str) -> str:
+        for pattern in self.ignore_patterns:
+            text = pattern.sub("", text)
+        return text
+
+    def _message(self, message: BaseMessage) -> list:
+        content = message.content
+        if isinstance(content, str):
+            content = self._normalize(content)
+        tool_calls = [[call["name"], call["args"]] for call in getattr(message, "tool_calls", None) or []]
+        return [message.type, content, tool_calls, getattr(message, "name", None)]
+
+    def key(self, messages: list[BaseMessage], params: dict) -> str:
+        """
+        由规范化的消息和参数（模型参数、工具定义、stop 等）计算缓存键
+        """
+        payload = json.dumps(
+            [[self._message(message) for message in messages], params], sort_keys=True, default=str
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[AIMessage]:
+        """
+        返回未过期的缓存回复，并更新最近使用时间；未命中时返回 None
+        """
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT type, value, created_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or (self.ttl is not None and row[2] < now - self.ttl):
+                self.misses += 1
+                return None
+            self.conn.execute(
+                "UPDATE llm_cache SET last_used = ?, hits = hits + 1 WHERE key = ?", (now, key)
+            )
+            self.conn.commit()
+            self.hits += 1
+        return self.serde.loads_typed((row[0], row[1]))
+
+    def put(self, key: str, message: AIMessage):
+        """
+        写入回复（覆盖同一个键的旧值）；既没有内容也没有工具调用的空回复不写入
+        """
+        if not message.content and not message.tool_calls:
+            return
+        type_, value = self.serde.dumps_typed(message.model_copy(update={"id": None}))
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, type, value, size, created_at, last_used, hits)"
+                " VALUES (?, ?, ?, ?, ?, ?, 0)",
+                (key, type_, value, len(value), now, now),
+            )
+            self._writes += 1
+            if self._writes % self.evict_every == 0:
+                self._evict_locked(now)
+            self.conn.commit()
+
+    def _evict_locked(self, now: float) -> int:
+        before = self.conn.total_changes
+        if self.ttl is not None:
+            self.conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl,))
+        self.conn.execute(
+            _EVICT_QUERY,
+            (self.max_entries or 2 ** 62, self.max_bytes or 2 ** 62),
+        )
+        return self.conn.total_changes - before
+
+    def evict(self) -> int:
+        """
+        立即执行淘汰，返回删除的条目数
+        """
+        with self.lock:
+            removed = self._evict_locked(time.time())
+            self.conn.commit()
+        return removed
+
+    def clear(self):
+        """
+        删除全部缓存条目
+        """
+        with self.lock:
+            self.conn.execute("DELETE FROM llm_cache")
+            self.conn.commit()
+            self.hits = self.misses = 0
+
+    def stats(self) -> dict:
+        """
+        条目数、总字节数和本进程内的命中、未命中次数
+        """
+        with self.lock:
+            entries, size = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache").fetchone()
+            lookups = self.hits + self.misses
+            return {
+                "entries": entries,
+                "bytes": size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+class CachedChatModel(BaseChatModel):
+    """
+    先查 LLMResponseCache 的聊天模型，未命中时交给 live 模型并写入缓存
+    """
+
+    live: BaseChatModel
+    response_cache: Any
+    mode: str = "cache"
+    # cache 模式下调用这些工具的回复不写入缓存
+    no_store_tools: frozenset = frozenset()
+
+    @property
+    def _llm_type(self) -> str:
+        return f"cached-{self.live._llm_type}"
+
+    def bind_tools(self, tools, **kwargs):
+        # 使用 live 模型的工具格式，工具定义作为调用参数进入缓存键
+        return self.bind(**self.live.bind_tools(tools, **kwargs).kwargs)
+
+    def _key(self, messages: list[BaseMessage], stop: Optional[list[str]], kwargs: dict) -> str:
+        params = {
+            "model": self.live._llm_type,
+            "model_params": self.live._identifying_params,
+            "stop": stop,
+            "kwargs": kwargs,
+        }
+        return self.response_cache.key(messages, params)
+
+    def _lookup(self, key: str) -> Optional[AIMessage]:
+        if self.mode == "record":
+            return None
+        message = self.response_cache.get(key)
+        if message is None and self.mode == "replay":
+            raise ReplayMiss("No cached response for this prompt")
+        return message
+
+    def _store(self, key: str, message: AIMessage):
+        if self.mode == "cache" and any(call["name"] in self.no_store_tools for call in message.tool_calls):
+            return
+        self.response_cache.put(key, message)
+
+    def _generate(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        key = self._key(messages, stop, kwargs)
+        cached = self._lookup(key)
+        if cached is not None:
+            if run_manager:
+                for chunk in message_chunks(cached):
+                    run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            return ChatResult(generations=[ChatGeneration(message=cached)])
+        result = self.live._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        self._store(key, result.generations[0].message)
+        return result
+
+    async def _agenerate(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        key = self._key(messages, stop, kwargs)
+        cached = await asyncio.to_thread(self._lookup, key)
+        if cached is not None:
+            if run_manager:
+                for chunk in message_chunks(cached):
+                    await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            return ChatResult(generations=[ChatGeneration(message=cached)])
+        result = await self.live._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        await asyncio.to_thread(self._store, key, result.generations[0].message)
+        return result
+
+    def _stream(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        key = self._key(messages, stop, kwargs)
+        cached = self._lookup(key)
+        if cached is not None:
+            yield from message_chunks(cached)
+            return
+        generation = None
+        for chunk in self.live._stream(messages, stop=stop, run_manager=run_manager, **kwargs):
+            generation = chunk if generation is None else generation + chunk
+            yield chunk
+        if generation is not None:
+            self._store(key, _to_message(generation))
+
+    async def _astream(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ):
+        key = self._key(messages, stop, kwargs)
+        cached = await asyncio.to_thread(self._lookup, key)
+        if cached is not None:
+            for chunk in message_chunks(cached):
+                yield chunk
+            return
+        generation = None
+        async for chunk in self.live._astream(messages, stop=stop, run_manager=run_manager, **kwargs):
+            generation = chunk if generation is None else generation + chunk
+            yield chunk
+        if generation is not None:
+            await asyncio.to_thread(self._store, key, _to_message(generation))
+
+
+def _to_message(generation: ChatGenerationChunk) -> AIMessage:
+    chunk = generation.message
+    return AIMessage(
+        content=chunk.content,
+        additional_kwargs=chunk.additional_kwargs,
+        response_metadata=chunk.response_metadata,
+        tool_calls=chunk.tool_calls,
+        invalid_tool_calls=chunk.invalid_tool_calls,
+        usage_metadata=chunk.usage_metadata,
+    )
+
+
+class LLMCacheManager:
+    """
+    每个进程一个的 LLM 回复缓存
+
+    GraphBuilder.create_llm 通过 wrap 在聊天模型外包一层 CachedChatModel；mode 为 "off" 时原样返回模型。
+    默认关闭；第一次使用时读取 config.LLM_CACHE_MODE 和 config.LLM_CACHE_PATH 作为初始的模式和缓存文件
+    （相对路径相对于进程的当前工作目录），configure 传入的参数优先。
+    """
+
+    path = "llm_cache.sqlite"
+    mode = "off"
+    ttl = 7 * 24 * 3600
+    max_entries = 10000
+    max_bytes = 256 * 1024 * 1024
+
+    _lock = threading.Lock()
+    _cache = None
+    _settings_loaded = False
+
+    @staticmethod
+    def _load_settings_locked():
+        if LLMCacheManager._settings_loaded:
+            return
+        LLMCacheManager._settings_loaded = True
+        import config as cfg
+        mode = getattr(cfg, "LLM_CACHE_MODE", None)
+        if mode is not None and mode not in MODES:
+            raise ValueError(f"Unknown LLM_CACHE_MODE {mode!r} in config.py; expected one of {MODES}")
+        LLMCacheManager.mode = mode or LLMCacheManager.mode
+        LLMCacheManager.path = getattr(cfg, "LLM_CACHE_PATH", None) or LLMCacheManager.path
+
+    @staticmethod
+    def configure(path=None, mode=None, ttl=None, max_entries=None, max_bytes=None):
+        """
+        调整缓存文件、模式和淘汰参数；已打开的缓存被关闭，之后包装的模型使用新参数
+        """
+        if mode is not None and mode not in MODES:
+            raise ValueError(f"Unknown LLM cache mode {mode!r}; expected one of {MODES}")
+        with LLMCacheManager._lock:
+            LLMCacheManager._load_settings_locked()
+            if path is not None:
+                LLMCacheManager.path = path
+            if mode is not None:
+                LLMCacheManager.mode = mode
+            if ttl is not None:
+                LLMCacheManager.ttl = ttl
+            if max_entries is not None:
+                LLMCacheManager.max_entries = max_entries
+            if max_bytes is not None:
+                LLMCacheManager.max_bytes = max_bytes
+            if LLMCacheManager._cache is not None:
+                LLMCacheManager._cache.close()
+                LLMCacheManager._cache = None
+
+    @staticmethod
+    def get_cache() -> LLMResponseCache:
+        """
+        获取进程内共享的缓存，第一次调用时打开数据库
+        """
+        with LLMCacheManager._lock:
+            LLMCacheManager._load_settings_locked()
+            if LLMCacheManager._cache is None:
+                LLMCacheManager._cache = LLMResponseCache(
+                    LLMCacheManager.path,
+                    ttl=LLMCacheManager.ttl,
+                    max_entries=LLMCacheManager.max_entries,
+                    max_bytes=LLMCacheManager.max_bytes,
+                )
+            return LLMCacheManager._cache
+
+    @staticmethod
+    def wrap(llm: BaseChatModel, no_store_tools: Iterable[str] = ()) -> BaseChatModel:
+        """
+        按当前模式为聊天模型加上缓存；cache 模式下调用 no_store_tools 中工具的回复不写入
+        """
+        with LLMCacheManager._lock:
+            LLMCacheManager._load_settings_locked()
+            mode = LLMCacheManager.mode
+        if mode == "off":
+            return llm
+        return CachedChatModel(
+            live=llm,
+            response_cache=LLMCacheManager.get_cache(),
+            mode=mode,
+            no_store_tools=frozenset(no_store_tools),
+        )
@@ -0,0 +1,377 @@
+"""
+从检查点回放对话
+
+ReplayRecording 通过 get_state_history 读取源 thread 的全部历史，记录每次 LLM 调用的输入
+（对话消息，不含随时间变化的系统提示）和返回的 AIMessage，以及每次工具调用的 (工具名, 参数) 和返回的 ToolMessage；
+summarize_conversation 节点不绑定工具的摘要调用按父检查点还原出的摘要请求记录。
+ReplayEngine 用包装后的 LLM 和工具重新构建图，从选定的检查点分叉出新 thread，
+再依次发送源 thread 中之后的用户消息：输入与记录一致的步骤直接返回记录的结果，
+只有出现分歧的步骤才调用真实的 LLM 和数据库。一旦某次 LLM 回复与记录不同，
+之后的对话前缀都不再匹配，LLM 会一直走真实调用；工具调用按参数匹配，仍可命中记录。
+"""
+import copy
+import hashlib
+import json
+import threading
+import uuid
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Any, Optional
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import (
+    AIMessage,
+    BaseMessage,
+    HumanMessage,
+    ToolMessage,
+    convert_to_messages,
+)
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.runnables import RunnableConfig
+from langchain_core.tools import BaseTool
+from langgraph.checkpoint.base.id import uuid6
+from langgraph.constants import START
+from utils.chat_messages import conversation_key, message_key
+from utils.conversation_memory import summary_messages
+from utils.langchain_util import iter_state_history
+
+
+class ReplayMiss(LookupError):
+    """离线回放时遇到记录中没有的调用"""
+
+
+def _tool_key(name: str, args: dict) -> str:
+    return json.dumps([name, args], sort_keys=True, default=str)
+
+
+class ReplayRecording:
+    """
+    源 thread 中记录的 LLM 回复和工具输出，以及回放统计
+
+    同一个键被记录多次时按原来的顺序依次返回，用完后重复返回最后一个；rewind() 后从头开始。
+    """
+
+    def __init__(self):
+        self.responses = defaultdict(list)
+        self.tool_outputs = defaultdict(list)
+        self.human_messages = []
+        self._lock = threading.Lock()
+        self.rewind()
+
+    def rewind(self):
+        """
+        重置返回位置和统计，开始新一次回放
+        """
+        with self._lock:
+            self._positions = defaultdict(int)
+            self.stats = {"llm_replayed": 0, "llm_live": 0, "tool_replayed": 0, "tool_live": 0}
+
+    @classmethod
+    def from_history(cls, graph, config: RunnableConfig) -> "ReplayRecording":
+        """
+        从 thread 的全部历史（包括分叉出去的分支）中收集记录
+        """
+        recording = cls()
+        snapshots = list(iter_state_history(graph, config))
+        by_id = {snapshot.config["configurable"]["checkpoint_id"]: snapshot for snapshot in snapshots}
+        seen = set()
+        # 从旧到新处理，保证同一个键的多条记录按发生顺序排列
+        for snapshot in reversed(snapshots):
+            parent = snapshot.parent_config and by_id.get(snapshot.parent_config["configurable"]["checkpoint_id"])
+            if parent is not None:
+                recording._record_summary(parent.values, snapshot.values)
+            messages = snapshot.values.get("messages") or []
+            if all(message.id in seen for message in messages):
+                continue
+            digest = hashlib.sha1()
+            tool_names = {}
+            for message in messages:
+                if message.id not in seen:
+                    seen.add(message.id)
+                    recording._record(message, digest.hexdigest(), tool_names)
+                if isinstance(message, AIMessage):
+                    for call in message.tool_calls:
+                        tool_names[call["id"]] = (call["name"], call["args"])
+                digest.update(message_key(message))
+        return recording
+
+    def _record(self, message: BaseMessage, prefix_key: str, tool_names: dict):
+        if isinstance(message, AIMessage):
+            self.responses[prefix_key].append(message)
+        elif isinstance(message, ToolMessage) and message.tool_call_id in tool_names:
+            self.tool_outputs[_tool_key(*tool_names[message.tool_call_id])].append(message)
+        elif isinstance(message, HumanMessage):
+            self.human_messages.append(message)
+
+    def _record_summary(self, before: dict, after: dict):
+        """
+        summarize_conversation 节点的 LLM 调用：从父检查点的状态还原摘要请求，记录生成的摘要
+        """
+        # 每次折叠都会增加 summarized_tokens；摘要文本可能与上一次相同
+        summary = after.get("conversation_summary")
+        if not summary or (after.get("summarized_tokens") or 0) <= (before.get("summarized_tokens") or 0):
+            return
+        kept = {message.id for message in after.get("messages") or []}
+        folded = [message for message in before.get("messages") or [] if message.id not in kept]
+        request = summary_messages(before.get("conversation_summary") or "", folded)
+        self.responses[conversation_key(request)].append(AIMessage(content=summary))
+
+    def _take(self, records: dict, key: str):
+        with self._lock:
+            items = records.get(key)
+            if not items:
+                return None
+            position = self._positions[id(records), key]
+            self._positions[id(records), key] = position + 1
+            return items[min(position, len(items) - 1)]
+
+    def response(self, messages: list) -> Optional[AIMessage]:
+        return self._take(self.responses, conversation_key(messages))
+
+    def tool_output(self, name: str, args: dict) -> Optional[ToolMessage]:
+        return self._take(self.tool_outputs, _tool_key(name, args))
+
+    def count(self, stat: str):
+        with self._lock:
+            self.stats[stat] += 1
+
+
+class ReplayChatModel(BaseChatModel):
+    """
+    先在记录中查找回复的聊天模型，查不到时交给 live 模型（live 为 None 时抛出 ReplayMiss）
+    """
+
+    recording: Any
+    live: Optional[BaseChatModel] = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "replay"
+
+    def bind_tools(self, tools, **kwargs):
+        if self.live is None:
+            return self.bind()
+        # 使用 live 模型的工具格式，未命中时原样传给 live 模型
+        return self.bind(**self.live.bind_tools(tools, **kwargs).kwargs)
+
+    def _replayed(self, messages: list) -> Optional[ChatResult]:
+        response = self.recording.response(messages)
+        if response is None:
+            if self.live is None:
+                raise ReplayMiss("No recorded response for this conversation")
+            self.recording.count("llm_live")
+            return None
+        self.recording.count("llm_replayed")
+        # 使用新的消息 id，避免 add_messages 把它当成对已有消息的替换
+        return ChatResult(generations=[ChatGeneration(message=response.model_copy(update={"id": None}))])
+
+    def _generate(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        result = self._replayed(messages)
+        if result is None:
+            result = self.live._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        return result
+
+    async def _agenerate(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        result = self._replayed(messages)
+        if result is None:
+            result = await self.live._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        return result
+
+
+class ReplayTool(BaseTool):
+    """
+    包装真实工具：ToolNode 发来的工具调用参数与记录一致时直接返回记录的 ToolMessage
+    """
+
+    live: BaseTool
+    recording: Any
+    offline: bool = False
+
+    @classmethod
+    def wrap(cls, tool: BaseTool, recording: ReplayRecording, offline=False) -> "ReplayTool":
+        return cls(
+            name=tool.name,
+            description=tool.description,
+            args_schema=tool.args_schema,
+            live=tool,
+            recording=recording,
+            offline=offline,
+        )
+
+    def _replayed(self, input: Any) -> Optional[ToolMessage]:
+        # 只有 ToolNode 的工具调用返回 ToolMessage，直接调用（如 fetch_user_info 节点）照常执行
+        if not (isinstance(input, dict) and input.get("type") == "tool_call"):
+            return None
+        output = self.recording.tool_output(self.name, input["args"])
+        if output is None:
+            if self.offline:
+                raise ReplayMiss(f"No recorded output for tool {self.name}")
+            self.recording.count("tool_live")
+            return None
+        self.recording.count("tool_replayed")
+        return output.model_copy(update={"id": None, "tool_call_id": input["id"]})
+
+    def invoke(self, input, config: Optional[RunnableConfig] = None, **kwargs):
+        output = self._replayed(input)
+        return output if output is not None else self.live.invoke(input, config, **kwargs)
+
+    async def ainvoke(self, input, config: Optional[RunnableConfig] = None, **kwargs):
+        output = self._replayed(input)
+        return output if output is not None else await self.live.ainvoke(input, config, **kwargs)
+
+    def _run(self, *args, **kwargs):
+        return self.live._run(*args, **kwargs)
+
+
+class ReplayEngine:
+    """
+    从检查点分叉 thread 并回放后续对话
+
+    builder 为 GraphBuilder（或同样提供 get_graph/build_graph(llm) 且以属性保存工具的对象）。
+    offline=True 时不调用任何真实服务，遇到记录中没有的调用抛出 ReplayMiss；
+    否则未命中的 LLM 调用使用 live_llm（默认 builder.create_llm()），工具调用使用原工具。
+    """
+
+    def __init__(self, builder, source_config: RunnableConfig, live_llm=None, offline=False):
+        self.source_config = source_config
+        self.recording = ReplayRecording.from_history(builder.get_graph(), source_config)
+        if not offline and live_llm is None:
+            live_llm = builder.create_llm()
+        self.graph = self._build_graph(builder, live_llm, offline)
+
+    def _build_graph(self, builder, live_llm, offline):
+        replay_builder = copy.copy(builder)
+        wrapped = {}
+
+        def wrap(tool):
+            if id(tool) not in wrapped:
+                wrapped[id(tool)] = ReplayTool.wrap(tool, self.recording, offline)
+            return wrapped[id(tool)]
+
+        for name, value in vars(builder).items():
+            if isinstance(value, BaseTool):
+                setattr(replay_builder, name, wrap(value))
+            elif isinstance(value, list) and value and all(isinstance(v, BaseTool) for v in value):
+                setattr(replay_builder, name, [wrap(v) for v in value])
+        return replay_builder.build_graph(
+            llm=ReplayChatModel(recording=self.recording, live=None if offline else live_llm)
+        )
+
+    def fork(self, checkpoint_config: RunnableConfig, thread_id: Optional[str] = None) -> RunnableConfig:
+        """
+        把 checkpoint_config 指向的检查点复制到新 thread，返回新 thread 的配置
+
+        不复制检查点上已完成任务的写入，分叉后这些任务会重新执行（由回放的 LLM 和工具返回结果）。
+        分叉出的检查点使用新的 ID（UUIDv6，按分叉时间排序，保留策略按它计算 thread 的最近活动时间），
+        元数据中的 forked_from 记录源 thread 和检查点 ID。
+        """
+        checkpointer = self.graph.checkpointer
+        source = checkpointer.get_tuple(checkpoint_config)
+        if source is None:
+            raise ValueError("Checkpoint to fork from does not exist")
+        configurable = {
+            **self.source_config["configurable"],
+            "thread_id": thread_id or str(uuid.uuid4()),
+            "checkpoint_ns": "",
+        }
+        configurable.pop("checkpoint_id", None)
+        metadata = {
+            **source.metadata,
+            "source": "fork",
+            "thread_id": configurable["thread_id"],
+            "forked_from": {
+                "thread_id": str(source.config["configurable"]["thread_id"]),
+                "checkpoint_id": source.checkpoint["id"],
+            },
+        }
+        checkpoint = {
+            **source.checkpoint,
+            "id": str(uuid6(clock_seq=source.metadata.get("step", -1))),
+            "ts": datetime.now(timezone.utc).isoformat(),
+        }
+        checkpointer.put({"configurable": configurable}, checkpoint, metadata, {})
+        return {"configurable": configurable}
+
+    def _seen_message_ids(self, checkpoint_config: RunnableConfig) -> set:
+        """
+        分叉点及其祖先检查点中出现过的消息 id，包括之后被摘要折叠删除的消息
+        """
+        configurable = dict(checkpoint_config["configurable"])
+        checkpoint_id = configurable.pop("checkpoint_id", None)
+        snapshots = {
+            snapshot.config["configurable"]["checkpoint_id"]: snapshot
+            for snapshot in iter_state_history(self.graph, {"configurable": configurable})
+        }
+        seen = set()
+        while checkpoint_id in snapshots:
+            snapshot = snapshots[checkpoint_id]
+            seen.update(message.id for message in snapshot.values.get("messages") or [])
+            checkpoint_id = snapshot.parent_config and snapshot.parent_config["configurable"]["checkpoint_id"]
+        return seen
+
+    def _pending_inputs(self, config: RunnableConfig) -> list:
+        """
+        输入检查点（next 为 __start__）的 __start__ 通道中尚未处理的用户消息内容，其他检查点返回空列表
+        """
+        if self.graph.get_state(config).next != (START,):
+            return []
+        checkpoint = self.graph.checkpointer.get_tuple(config).checkpoint
+        pending = checkpoint["channel_values"].get(START)
+        messages = pending.get("messages") if isinstance(pending, dict) else None
+        if not messages:
+            return []
+        if not isinstance(messages, list):
+            messages = [messages]
+        return [m.content for m in convert_to_messages(messages) if isinstance(m, HumanMessage)]
+
+    def _resume(self, config: RunnableConfig, approve_interrupts: bool):
+        if not approve_interrupts:
+            return
+        while self.graph.get_state(config).next:
+            self.graph.invoke(None, config)
+
+    def run(self, checkpoint_config: RunnableConfig, inputs: Optional[list] = None,
+            thread_id: Optional[str] = None, approve_interrupts=True) -> dict:
+        """
+        从 checkpoint_config 分叉并依次发送用户消息，返回新 thread 的配置、最终状态和回放统计
+
+        inputs 默认为源 thread 中分叉点之后的用户消息；approve_interrupts 为 True 时
+        在敏感工具前的中断处直接继续执行（相当于用户同意）。
+        """
+        self.recording.rewind()
+        fork_config = self.fork(checkpoint_config, thread_id)
+        pending = self._pending_inputs(fork_config)
+        if inputs is None:
+            seen = self._seen_message_ids(checkpoint_config)
+            inputs = [m.content for m in self.recording.human_messages if m.id not in seen]
+            # 输入检查点中待处理的用户消息在下面继续执行时发送，不能再发送一次
+            for content in pending:
+                if content in inputs:
+                    inputs.remove(content)
+
+        # 分叉点本身还有待执行的节点时先把这一轮跑完；输入检查点总是先处理其中的用户消息
+        if pending:
+            self.graph.invoke(None, fork_config)
+        if self.graph.get_state(fork_config).next:
+            self._resume(fork_config, approve_interrupts)
+        for content in inputs:
+            self.graph.invoke({"messages": [("user", content)]}, fork_config)
+            self._resume(fork_config, approve_interrupts)
+
+        return {
+            "config": fork_config,
+            "state": self.graph.get_state(fork_config),
+            "stats": dict(self.recording.stats),
+        }
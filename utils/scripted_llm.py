@@ -0,0 +1,241 @@
+"""
+离线运行用的脚本化聊天模型
+
+ScriptedChatModel 不发起任何网络请求，按脚本返回确定的回复，用于在隔离环境中端到端运行图、压测和性能分析。
+脚本是一组对话轮，每轮为 {"match": 正则, "responses": [...]}：第一条 match 能匹配最近一条用户消息的轮次
+（match 为 None 时匹配任意消息）生效；该用户消息之后已有 n 条 AIMessage 时返回第 n 个回复，
+回复用完后返回 fallback 文本。回复只取决于传入的消息，多个 thread 并发运行时互不影响。
+
+responses 中的每一项可以是：
+- 字符串：文本回复；
+- {"name": 工具名, "args": {...}}：一次工具调用，工具名必须已通过 bind_tools 绑定
+  （包括 ToBookCarRental、CompleteOrEscalate 等转交用的工具）；
+- 上述字典的列表：同一条回复中的多个工具调用；
+- AIMessage：原样返回；
+- 可调用对象：以消息列表为参数，返回以上任一形式。
+没有绑定工具的调用（summarize_conversation 生成摘要）返回 summary 文本。
+"""
+import asyncio
+import re
+import time
+from typing import Any, Iterator, Optional
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+from langchain_core.messages.tool import tool_call
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from pydantic import Field
+from utils.chat_messages import conversation_key, message_chunks
+
+# 与 DEMO_CONVERSATION 配套的默认脚本，覆盖主助手的工具、四个子助手的转交和 CompleteOrEscalate
+DEFAULT_SCRIPT = [
+    {
+        "match": r"\bflights?\b",
+        "responses": [
+            {"name": "search_flights", "args": {"departure_airport": "CDG", "arrival_airport": "BSL", "limit": 5}},
+            "Here are the next flights from Paris to Basel. Your current ticket is on the first one.",
+        ],
+    },
+    {
+        "match": r"\bpolicy\b|\bchange\b|\brefund\b|\bbaggage\b",
+        "responses": [
+            {"name": "lookup_policy", "args": {"query": "How can I change my booking?"}},
+            "Tickets can be rebooked online up to 3 hours before departure; a change fee may apply.",
+        ],
+    },
+    {
+        "match": r"\bweather\b|\bsearch the web\b",
+        "responses": [
+            {"name": "search_and_contents", "args": {"query": "weather in Basel this week"}},
+            "I looked it up: expect mild spring weather in Basel this week.",
+        ],
+    },
+    {
+        "match": r"\bcar\b",
+        "responses": [
+            {
+                "name": "ToBookCarRental",
+                "args": {
+                    "location": "Basel",
+                    "start_date": "2024-05-02",
+                    "end_date": "2024-05-05",
+                    "request": "A midsize car for three days.",
+                },
+            },
+            {"name": "search_car_rentals", "args": {"location": "Basel"}},
+            "I found several car rentals in Basel. Avis offers a midsize car. Shall I book it?",
+        ],
+    },
+    {
+        "match": r"\bhotel\b",
+        "responses": [
+            {
+                "name": "ToHotelBookingAssistant",
+                "args": {
+                    "location": "Zurich",
+                    "checkin_date": "2024-05-02",
+                    "checkout_date": "2024-05-05",
+                    "request": "Close to the city center.",
+                },
+            },
+            {"name": "search_hotels", "args": {"location": "Zurich"}},
+            {"name": "CompleteOrEscalate", "args": {"cancel": True, "reason": "The user only wanted to compare prices."}},
+            "I found several hotels in Zurich, including Hilton and Marriott. Let me know if you want to book one.",
+        ],
+    },
+    {
+        "match": r"\bexcursion\b|\bthings to do\b|\btrip\b",
+        "responses": [
+            {"name": "ToBookExcursion", "args": {"location": "Lucerne", "request": "Scenic outdoor activities."}},
+            {"name": "search_trip_recommendations", "args": {"location": "Lucerne"}},
+            "In Lucerne I recommend the Chapel Bridge and the Mount Pilatus excursion.",
+        ],
+    },
+    {
+        "match": r"\bbook\b|\byes\b",
+        "responses": [
+            {"name": "book_car_rental", "args": {"rental_id": 3}},
+            {"name": "CompleteOrEscalate", "args": {"cancel": False, "reason": "I have fully completed the task."}},
+            "Your Avis rental car in Basel is booked.",
+        ],
+    },
+    {"match": None, "responses": ["Happy to help. Is there anything else you need for your trip?"]},
+]
+
+# 按顺序发送即可走完 DEFAULT_SCRIPT 的一段对话；"Yes, please book it." 会在 book_car_rental 前中断
+DEMO_CONVERSATION = [
+    "Hi there, what time is my flight?",
+    "What is the policy if I want to change my booking?",
+    "I need a car in Basel from May 2 to May 5.",
+    "Yes, please book it.",
+    "I might also need a hotel in Zurich.",
+    "Any things to do in Lucerne?",
+    "Thanks, that's all.",
+]
+
+
+def _content_text(message: BaseMessage) -> str:
+    if isinstance(message.content, str):
+        return message.content
+    return " ".join(
+        block.get("text", "") if isinstance(block, dict) else str(block) for block in message.content
+    )
+
+
+class ScriptedChatModel(BaseChatModel):
+    """
+    按脚本回复的本地聊天模型，可用于 GraphBuilder.build_graph(llm=...)
+    """
+
+    turns: list = Field(default_factory=lambda: list(DEFAULT_SCRIPT))
+    fallback: str = "Is there anything else I can help you with?"
+    summary: str = "The user is a Swiss Airlines passenger asking about flights, car rentals, hotels and excursions."
+    # 每次调用前等待的秒数，模拟模型的响应时间
+    latency: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def bind_tools(self, tools, **kwargs):
+        # 只记录工具名，用于检查脚本中的工具调用是否可用
+        return self.bind(tool_names=[convert_to_openai_tool(tool)["function"]["name"] for tool in tools])
+
+    def _turn(self, text: str) -> list:
+        for turn in self.turns:
+            if turn.get("match") is None or re.search(turn["match"], text, re.IGNORECASE):
+                return turn["responses"]
+        return []
+
+    def respond(self, messages: list[BaseMessage], tool_names: Optional[list[str]] = None) -> AIMessage:
+        """
+        按脚本计算对 messages 的回复
+        """
+        if tool_names is None:
+            return AIMessage(content=self.summary)
+        start = next(
+            (index for index in range(len(messages) - 1, -1, -1) if isinstance(messages[index], HumanMessage)),
+            None,
+        )
+        if start is None:
+            return AIMessage(content=self.fallback)
+        step = sum(isinstance(message, AIMessage) for message in messages[start + 1:])
+        responses = self._turn(_content_text(messages[start]))
+        if step >= len(responses):
+            return AIMessage(content=self.fallback)
+        response = responses[step]
+        if callable(response):
+            response = response(messages)
+        if isinstance(response, AIMessage):
+            return response
+        if isinstance(response, str):
+            return AIMessage(content=response)
+
+        calls = response if isinstance(response, list) else [response]
+        unknown = [call["name"] for call in calls if call["name"] not in tool_names]
+        if unknown:
+            raise ValueError(f"Scripted tool calls {unknown} are not bound; available tools: {tool_names}")
+        # 工具调用 id 由对话内容决定，重复运行同一段对话时保持不变
+        prefix = conversation_key(messages)[:16]
+        return AIMessage(content="", tool_calls=[
+            tool_call(name=call["name"], args=dict(call.get("args") or {}), id=f"call_{prefix}_{index}")
+            for index, call in enumerate(calls)
+        ])
+
+    def _generate(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        tool_names: Optional[list[str]] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        if self.latency:
+            time.sleep(self.latency)
+        message = self.respond(messages, tool_names)
+        if run_manager:
+            for chunk in message_chunks(message):
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        tool_names: Optional[list[str]] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        message = self.respond(messages, tool_names)
+        if run_manager:
+            for chunk in message_chunks(message):
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        tool_names: Optional[list[str]] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        if self.latency:
+            time.sleep(self.latency)
+        yield from message_chunks(self.respond(messages, tool_names))
+
+    async def _astream(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        tool_names: Optional[list[str]] = None,
+        **kwargs: Any,
+    ):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        for chunk in message_chunks(self.respond(messages, tool_names)):
+            yield chunk
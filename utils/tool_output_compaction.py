@@ -0,0 +1,214 @@
+"""
+压缩已被使用过的旧工具输出
+
+search_flights、各个 search_* 工具和 Exa 的 search_and_contents 的返回值以 ToolMessage 的形式
+留在 State.messages 中，之后每次调用 LLM 都会重新发送。compact_tool_outputs 节点在每轮用户输入
+进入助手之前，把最近 keep_turns 轮之前、且之后已有助手回复的工具输出替换为简短摘要：
+消息 id 和 tool_call_id 保持不变（add_messages 按 id 原地替换），工具调用的配对仍然有效。
+每个工具按名称配置压缩策略：对 JSON 结果只保留指定字段，对文本结果截断到 max_chars。
+"""
+import json
+import threading
+from typing import Iterable, Optional
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langchain_core.runnables import RunnableLambda
+
+# 已压缩的消息在 response_metadata 中带有该标记，不会被重复处理
+COMPACTED_KEY = "compacted"
+
+
+class ToolOutputCompaction:
+    """
+    工具输出压缩的策略和统计
+
+    policies 以工具名为键，值为 {"fields": [...], "max_chars": n}：
+    fields 为 JSON 结果中每行保留的字段（如预订时需要的 id），max_chars 为摘要的最大字符数；
+    值为 None 表示该工具的输出从不压缩。没有单独配置的工具（包括转交子助手的调用）使用
+    default_policy，默认不压缩。不超过 min_chars 的输出保持原样。
+    """
+
+    enabled = True
+    keep_turns = 1
+    min_chars = 400
+    default_max_chars = 400
+    default_policy = None
+    policies = {
+        "search_flights": {
+            "fields": ["flight_id", "flight_no", "departure_airport", "arrival_airport", "scheduled_departure"],
+            "max_chars": 1200,
+        },
+        "search_hotels": {"fields": ["id", "name", "location", "price_tier"], "max_chars": 800},
+        "search_car_rentals": {"fields": ["id", "name", "location", "price_tier"], "max_chars": 800},
+        "search_trip_recommendations": {"fields": ["id", "name", "location"], "max_chars": 800},
+        "search_and_contents": {"fields": None, "max_chars": 300},
+        "lookup_policy": {"fields": None, "max_chars": 300},
+    }
+
+    _lock = threading.Lock()
+    compacted = 0
+    chars_before = 0
+    chars_after = 0
+
+    @staticmethod
+    def configure(enabled: Optional[bool] = None, keep_turns: Optional[int] = None,
+                  min_chars: Optional[int] = None):
+        """
+        调整开关、原样保留的最近轮数和不压缩的输出长度
+        """
+        with ToolOutputCompaction._lock:
+            if enabled is not None:
+                ToolOutputCompaction.enabled = enabled
+            if keep_turns is not None:
+                ToolOutputCompaction.keep_turns = keep_turns
+            if min_chars is not None:
+                ToolOutputCompaction.min_chars = min_chars
+
+    @staticmethod
+    def set_policy(tool_name: str, fields: Optional[Iterable[str]] = None, max_chars: Optional[int] = None,
+                   compact: bool = True):
+        """
+        设置某个工具的压缩策略；compact=False 时该工具的输出从不压缩
+        """
+        with ToolOutputCompaction._lock:
+            policies = dict(ToolOutputCompaction.policies)
+            if compact:
+                policies[tool_name] = {
+                    "fields": list(fields) if fields else None,
+                    "max_chars": max_chars or ToolOutputCompaction.default_max_chars,
+                }
+            else:
+                policies[tool_name] = None
+            ToolOutputCompaction.policies = policies
+
+    @staticmethod
+    def policy(tool_name: Optional[str]) -> Optional[dict]:
+        return ToolOutputCompaction.policies.get(tool_name, ToolOutputCompaction.default_policy)
+
+    @staticmethod
+    def record(before: int, after: int):
+        with ToolOutputCompaction._lock:
+            ToolOutputCompaction.compacted += 1
+            ToolOutputCompaction.chars_before += before
+            ToolOutputCompaction.chars_after += after
+
+    @staticmethod
+    def clear():
+        """
+        清空统计
+        """
+        with ToolOutputCompaction._lock:
+            ToolOutputCompaction.compacted = 0
+            ToolOutputCompaction.chars_before = ToolOutputCompaction.chars_after = 0
+
+    @staticmethod
+    def stats() -> dict:
+        """
+        压缩的消息数、压缩前后的字符数和节省的字符数
+        """
+        with ToolOutputCompaction._lock:
+            return {
+                "compacted": ToolOutputCompaction.compacted,
+                "chars_before": ToolOutputCompaction.chars_before,
+                "chars_after": ToolOutputCompaction.chars_after,
+                "chars_saved": ToolOutputCompaction.chars_before - ToolOutputCompaction.chars_after,
+            }
+
+
+def _truncate(text: str, max_chars: int) -> str:
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars] + f" ... [{len(text) - max_chars} chars omitted]"
+
+
+def _project_rows(rows: list, fields: list) -> list:
+    return [
+        {field: row[field] for field in fields if field in row} if isinstance(row, dict) else row
+        for row in rows
+    ]
+
+
+def digest(tool_name: Optional[str], content: str, policy: dict) -> str:
+    """
+    按策略生成工具输出的摘要
+
+    JSON 行列表（或带 results 的分页结果）只保留 fields 中的字段，并注明原有行数；
+    超出 max_chars 时截断。其他输出直接截断。
+    """
+    label = f"[compacted output of {tool_name or 'tool'}, originally {len(content)} chars]"
+    fields = policy.get("fields")
+    data = None
+    if fields:
+        try:
+            data = json.loads(content)
+        except ValueError:
+            data = None
+    if isinstance(data, list):
+        data = {"rows": len(data), "results": _project_rows(data, fields)}
+    elif isinstance(data, dict) and isinstance(data.get("results"), list):
+        data = {**data, "rows": len(data["results"]), "results": _project_rows(data["results"], fields)}
+    else:
+        return f"{label} {_truncate(content, policy['max_chars'])}"
+    text = json.dumps(data, ensure_ascii=False, default=str)
+    return f"{label} {_truncate(text, policy['max_chars'])}"
+
+
+def _content_text(message: ToolMessage) -> Optional[str]:
+    return message.content if isinstance(message.content, str) else None
+
+
+def compact_messages(messages: list) -> list:
+    """
+    返回需要替换的 ToolMessage 列表（id 与原消息相同），没有需要压缩的输出时返回空列表
+    """
+    turn_starts = [index for index, message in enumerate(messages) if isinstance(message, HumanMessage)]
+    keep_turns = ToolOutputCompaction.keep_turns
+    if len(turn_starts) <= keep_turns:
+        return []
+    boundary = turn_starts[-keep_turns] if keep_turns > 0 else len(messages)
+
+    # ToolNode 写入的 ToolMessage 带有工具名；没有时从发起调用的 AIMessage 中查找
+    call_names = {}
+    last_answer = -1
+    for index in range(boundary):
+        message = messages[index]
+        if isinstance(message, AIMessage):
+            last_answer = index
+            call_names.update((call["id"], call["name"]) for call in message.tool_calls)
+
+    replacements = []
+    # 之后已经有助手消息读取过的输出才会被压缩
+    for message in messages[:last_answer]:
+        if not isinstance(message, ToolMessage) or message.response_metadata.get(COMPACTED_KEY):
+            continue
+        content = _content_text(message)
+        if content is None or len(content) <= ToolOutputCompaction.min_chars:
+            continue
+        tool_name = message.name or call_names.get(message.tool_call_id)
+        policy = ToolOutputCompaction.policy(tool_name)
+        if policy is None:
+            continue
+        compacted = digest(tool_name, content, policy)
+        if len(compacted) >= len(content):
+            continue
+        replacements.append(message.model_copy(update={
+            "content": compacted,
+            "response_metadata": {**message.response_metadata, COMPACTED_KEY: True, "original_chars": len(content)},
+        }))
+        ToolOutputCompaction.record(len(content), len(compacted))
+    return replacements
+
+
+def create_compaction_node() -> RunnableLambda:
+    """
+    创建 compact_tool_outputs 节点
+    """
+
+    def compact(state: dict) -> dict:
+        if not ToolOutputCompaction.enabled:
+            return {"messages": []}
+        return {"messages": compact_messages(state.get("messages") or [])}
+
+    async def acompact(state: dict) -> dict:
+        return compact(state)
+
+    return RunnableLambda(compact, acompact, name="compact_tool_outputs")